@@ -0,0 +1,59 @@
+import java.util.List;
+
+class Lists {
+
+    Lists() {
+    }
+
+    static List<int> numbers(int count) {
+        List<int> list = new List<int>();
+        int seed = 17;
+        for (int i = 0; i < count; i++) {
+            seed = (seed * 1103 + 12345) % 65536;
+            list.add(seed % 1000);
+        }
+        return list;
+    }
+
+    static void sort(List<int> list) {
+        for (int i = 1; i < list.size(); i++) {
+            int value = list.get(i);
+            int j = i - 1;
+            boolean moving = true;
+            while (moving) {
+                if (j < 0) {
+                    moving = false;
+                } else if (list.get(j) > value) {
+                    list.set(j + 1, list.get(j));
+                    j = j - 1;
+                } else {
+                    moving = false;
+                }
+            }
+            list.set(j + 1, value);
+        }
+    }
+
+    static int total(List<int> list) {
+        int total = 0;
+        for (int i = 0; i < list.size(); i++) {
+            total = total + list.get(i);
+        }
+        return total;
+    }
+
+    static void main() {
+        List<int> list = Lists.numbers(400);
+        System.out.println(Integer.toString(Lists.total(list)));
+        Lists.sort(list);
+        int count = 0;
+        for (int i = 1; i < list.size(); i++) {
+            if (list.get(i - 1) > list.get(i)) {
+                count = count + 1;
+            }
+        }
+        System.out.println(Integer.toString(count));
+        System.out.println(Integer.toString(list.get(0)));
+        System.out.println(Integer.toString(list.get(399)));
+    }
+}
@@ -0,0 +1,27 @@
+class Loops {
+
+    Loops() {
+    }
+
+    static void main() {
+        int count = 0;
+        int sum = 0;
+        for (int i = 0; i < 300; i++) {
+            for (int j = 0; j < 300; j++) {
+                if ((i ^ j) % 5 == 0) {
+                    count = count + 1;
+                }
+                sum = sum + (i * j & 255);
+            }
+        }
+        System.out.println(Integer.toString(count));
+        System.out.println(Integer.toString(sum));
+        int n = 0;
+        int k = 0;
+        while (k < 50000) {
+            n = n + k % 9;
+            k++;
+        }
+        System.out.println(Integer.toString(n));
+    }
+}
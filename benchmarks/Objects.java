@@ -0,0 +1,95 @@
+class Vec {
+    int x;
+    int y;
+
+    Vec(int x, int y) {
+        this.x = x;
+        this.y = y;
+    }
+
+    int dot(Vec other) {
+        return this.x * other.x + this.y * other.y;
+    }
+
+    void scale(int factor) {
+        this.x *= factor;
+        this.y *= factor;
+    }
+
+    Vec plus(Vec other) {
+        return new Vec(this.x + other.x, this.y + other.y);
+    }
+}
+
+class Shape {
+    int sides;
+
+    Shape(int sides) {
+        this.sides = sides;
+    }
+
+    int area() {
+        return 0;
+    }
+}
+
+class Square extends Shape {
+    int side;
+
+    Square(int side) {
+        super(4);
+        this.side = side;
+    }
+
+    int area() {
+        return this.side * this.side;
+    }
+}
+
+class Triangle extends Shape {
+    int base;
+    int height;
+
+    Triangle(int base, int height) {
+        super(3);
+        this.base = base;
+        this.height = height;
+    }
+
+    int area() {
+        return this.base * this.height / 2;
+    }
+}
+
+class Objects {
+
+    Objects() {
+    }
+
+    static int measure(Shape shape) {
+        return shape.area() + shape.sides;
+    }
+
+    static void main() {
+        int total = 0;
+        Vec sum = new Vec(0, 0);
+        for (int i = 0; i < 20000; i++) {
+            Vec v = new Vec(i % 10, i % 7);
+            v.scale(3);
+            total = total + v.dot(new Vec(1, 2)) % 11;
+            sum = sum.plus(v);
+        }
+        System.out.println(Integer.toString(total));
+        System.out.println(Integer.toString(sum.x));
+        System.out.println(Integer.toString(sum.y));
+        int areas = 0;
+        for (int i = 0; i < 20000; i++) {
+            if (i % 3 == 0) {
+                areas = areas + Objects.measure(new Triangle(i % 6, 4));
+            } else {
+                areas = areas + Objects.measure(new Square(i % 5));
+            }
+        }
+        System.out.println(Integer.toString(areas));
+    }
+}
@@ -0,0 +1,30 @@
+class Recursion {
+
+    Recursion() {
+    }
+
+    static int fib(int n) {
+        if (n < 2) {
+            return n;
+        }
+        return Recursion.fib(n - 1) + Recursion.fib(n - 2);
+    }
+
+    static int gcd(int a, int b) {
+        if (b == 0) {
+            return a;
+        }
+        return Recursion.gcd(b, a % b);
+    }
+
+    static void main() {
+        System.out.println(Integer.toString(Recursion.fib(20)));
+        int total = 0;
+        for (int a = 1; a < 120; a++) {
+            for (int b = 1; b < 120; b++) {
+                total = total + Recursion.gcd(a, b);
+            }
+        }
+        System.out.println(Integer.toString(total));
+    }
+}
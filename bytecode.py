@@ -0,0 +1,1207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""A compact bytecode for analysed methods and constructors, and a
+stack-based virtual machine to run it.
+
+Each method is compiled into a Code object - an array of words, two to an
+instruction (its opcode and argument), the line each instruction came from,
+and a pool of the constants arguments index. Operands and results are pushed
+on a stack as the same variables the tree-walker's expressions evaluate to.
+
+The locals of every scope in the method (and of the methods inlined into it)
+are given slots of their own in a single array for the call, so the virtual
+machine never makes scopes of its own, and jumps are offsets in words from the
+instruction after them.
+
+The virtual machine is generated from the source of each instruction, along
+with superinstructions - runs of instructions common enough to be worth
+dispatching once, with an argument word for each - picked by
+superinstructions.py from a profile of the blocks run (see save_profile), and
+written to superinstructions.json with the order the machine tests for
+instructions in."""
+
+import array
+import collections
+import itertools
+import json
+import linecache
+import os
+import sys
+import textwrap
+
+import library
+import classes
+import interpreter
+import mjast
+import sematics
+import vectorise
+from exceptions import ExecutionException
+from tokenizer import Token
+
+from parser import parse_handling_errors
+
+
+opnames = []
+
+
+def _opcode(name):
+    opnames.append(name)
+    return len(opnames) - 1
+
+
+# Locals, constants and fields.
+LOAD = _opcode("LOAD")
+CONST = _opcode("CONST")
+STRING = _opcode("STRING")
+CLASS = _opcode("CLASS")
+EVALUATE = _opcode("EVALUATE")
+FIELD = _opcode("FIELD")
+FIELD_NAMED = _opcode("FIELD_NAMED")
+POP = _opcode("POP")
+# Operators - the argument of those with a fixed result type is its constant.
+LT = _opcode("LT")
+GT = _opcode("GT")
+LE = _opcode("LE")
+GE = _opcode("GE")
+EQ = _opcode("EQ")
+NE = _opcode("NE")
+AND = _opcode("AND")
+OR = _opcode("OR")
+ADD = _opcode("ADD")
+SUB = _opcode("SUB")
+MUL = _opcode("MUL")
+DIV = _opcode("DIV")
+MOD = _opcode("MOD")
+BIT_AND = _opcode("BIT_AND")
+BIT_OR = _opcode("BIT_OR")
+XOR = _opcode("XOR")
+SHL = _opcode("SHL")
+SHR = _opcode("SHR")
+NOT = _opcode("NOT")
+INVERT = _opcode("INVERT")
+NEGATE = _opcode("NEGATE")
+POSITIVE = _opcode("POSITIVE")
+OPERATION = _opcode("OPERATION")
+CAST = _opcode("CAST")
+# Calls and constructions.
+CALL = _opcode("CALL")
+CALL_MONOMORPHIC = _opcode("CALL_MONOMORPHIC")
+NEW = _opcode("NEW")
+INLINE = _opcode("INLINE")
+LEAVE = _opcode("LEAVE")
+# Statements.
+DECLARE = _opcode("DECLARE")
+ASSIGN = _opcode("ASSIGN")
+UPDATE = _opcode("UPDATE")
+STORE = _opcode("STORE")
+STEP = _opcode("STEP")
+TEMPORARY = _opcode("TEMPORARY")
+TEMPORARY_VALUE = _opcode("TEMPORARY_VALUE")
+TEMPORARY_STEP = _opcode("TEMPORARY_STEP")
+VECTORISE = _opcode("VECTORISE")
+FAIL = _opcode("FAIL")
+# Control flow.
+JUMP = _opcode("JUMP")
+JUMP_IF_FALSE = _opcode("JUMP_IF_FALSE")
+JUMP_IF_TRUE = _opcode("JUMP_IF_TRUE")
+RETURN = _opcode("RETURN")
+RETURN_VOID = _opcode("RETURN_VOID")
+# Counts the runs of the block it starts, when profiling.
+COUNT = _opcode("COUNT")
+
+opcodes = {name: op for op, name in enumerate(opnames)}
+
+_jumps = {JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE}
+_slots = {LOAD, TEMPORARY, TEMPORARY_VALUE}
+_numbers = {FIELD, STEP, MUL, BIT_AND, BIT_OR, XOR, SHL, SHR, INVERT,
+            NEGATE, POSITIVE, POP, LEAVE, RETURN, RETURN_VOID, FAIL,
+            ADD, SUB, COUNT}
+# Instructions ending a block.
+exits = _jumps | {RETURN, RETURN_VOID, FAIL}
+# Those only the last of a superinstruction can be, calls switching to the
+# code of the method called.
+finals = exits | {CALL, CALL_MONOMORPHIC}
+
+table = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     "superinstructions.json")
+
+
+def _load(path):
+    """The superinstructions (as the names of the instructions they run) and
+    order to test for instructions in saved to a file, if there is one."""
+    try:
+        with open(path) as file:
+            saved = json.load(file)
+    except FileNotFoundError:
+        return [], []
+    sequences = [name.split("+") for name in saved["superinstructions"]]
+    return ([names for names in sequences
+             if all(name in opcodes and opcodes[name] != COUNT
+                    for name in names)
+             and not any(opcodes[name] in finals for name in names[:-1])],
+            saved["order"])
+
+
+# Superinstructions, by the instructions they run, and the other way around.
+superinstructions = {}
+_fused = {}
+_saved, _order = _load(table)
+for names in _saved:
+    components = tuple(opcodes[name] for name in names)
+    if len(components) > 1 and components not in _fused:
+        name = "+".join(names)
+        opcodes[name] = _fused[components] = _opcode(name)
+        superinstructions[_fused[components]] = components
+# Longest first, so they are preferred to those they start with.
+sequences = sorted(_fused, key=len, reverse=True)
+
+
+class Code:
+    """A method or constructor compiled to bytecode - the words of its
+    instructions, the line of each, its constants and the names of its
+    slots. When profiling, it also has the instructions of each block and
+    the number of times each has run."""
+
+    def __init__(self, declaration, description):
+        self.declaration = declaration
+        self.description = description
+        self.instructions = array.array("i")
+        self.lines = array.array("i")
+        self.constants = []
+        self.names = []
+        self.blocks = None
+        self.counts = None
+        self._pool = {}
+
+    def constant(self, value):
+        """The index of a value in the constant pool, adding it if it isn't
+        there already."""
+        key = _key(value)
+        if key not in self._pool:
+            self._pool[key] = len(self.constants)
+            self.constants.append(value)
+        return self._pool[key]
+
+    def __repr__(self):
+        return "\n".join(disassemble(self))
+
+
+def _key(value):
+    """Constants are the same if they are equal and of the same types, and
+    floats are told apart by sign."""
+    if isinstance(value, tuple):
+        return tuple(_key(part) for part in value)
+    elif isinstance(value, float):
+        return float, repr(value)
+    try:
+        hash(value)
+    except TypeError:
+        return id(value)
+    return type(value), value
+
+
+def compile_program(program, profile=False):
+    """Compiles the methods and constructors of an analysed program, returning
+    their code - counting the runs of each block rather than using
+    superinstructions if profiling."""
+    return [_Compiler(cls, node, profile).code for cls in program.classes
+            for node in itertools.chain(cls.constructors, cls.methods)]
+
+
+def dump(codes, file=sys.stdout):
+    for code in codes:
+        print(code, file=file)
+
+
+def install(codes):
+    """Has the interpreter run the methods and constructors from their
+    bytecode rather than their trees."""
+    for code in codes:
+        code.declaration.bytecode = code
+
+
+def profile(codes):
+    """The number of times each block of the profiled code has run, by the
+    names of its instructions."""
+    counts = collections.Counter()
+    for code in codes:
+        for block, count in zip(code.blocks, code.counts):
+            if count:
+                counts[" ".join(opnames[op] for op in block)] += count
+    return counts
+
+
+def save_profile(codes, path, name):
+    """Adds the block counts of a run of the named program to those of any
+    earlier runs in a profile file."""
+    try:
+        with open(path) as file:
+            profiles = json.load(file)
+    except FileNotFoundError:
+        profiles = {}
+    counts = collections.Counter(profiles.get(name, {}))
+    counts.update(profile(codes))
+    profiles[name] = dict(counts)
+    with open(path, "w") as file:
+        json.dump(profiles, file, indent=1, sort_keys=True)
+
+
+def fuse(ops, sequences=sequences):
+    """Splits a block of opcodes into the runs of them instructions would
+    run, greedily taking the first of the sequences (longest first) of a
+    superinstruction each position starts."""
+    runs = []
+    at = 0
+    while at < len(ops):
+        for sequence in sequences:
+            if tuple(ops[at:at + len(sequence)]) == sequence:
+                break
+        else:
+            sequence = (ops[at],)
+        runs.append(sequence)
+        at += len(sequence)
+    return runs
+
+
+def width(op):
+    """The number of words in an instruction."""
+    return 1 + len(superinstructions[op]) if op in superinstructions else 2
+
+
+def _fuse(code, targets):
+    """Replaces the runs of instructions superinstructions make up, never
+    fusing an instruction jumped to with those before it."""
+    words, lines = code.instructions, code.lines
+    count = len(lines)
+    starts = sorted({0, count} | {target // 2 for target in targets})
+    runs = []
+    for start, stop in zip(starts, starts[1:]):
+        for sequence in fuse(words[start * 2:stop * 2:2]):
+            runs.append((start, sequence))
+            start += len(sequence)
+    # The offset of each instruction starting a run, once fused.
+    offsets = {}
+    offset = 0
+    for start, sequence in runs:
+        offsets[start] = offset
+        offset += 1 + len(sequence)
+    offsets[count] = offset
+    code.instructions = array.array("i")
+    code.lines = array.array("i")
+    for start, sequence in runs:
+        code.instructions.append(
+            _fused[sequence] if len(sequence) > 1 else sequence[0])
+        for index in range(start, start + len(sequence)):
+            op, arg = words[index * 2], words[index * 2 + 1]
+            if op in _jumps:
+                arg = (offsets[index + 1 + arg // 2] -
+                       (offsets[start] + 1 + len(sequence)))
+            code.instructions.append(arg)
+        code.lines.append(lines[start])
+
+
+def _blocks(code):
+    """The instructions of each block of profiled code, up to the first one
+    ending it."""
+    blocks = []
+    ended = True
+    for at in range(0, len(code.instructions), 2):
+        op = code.instructions[at]
+        if op == COUNT:
+            blocks.append([])
+            ended = False
+        elif not ended:
+            blocks[-1].append(op)
+            ended = op in exits
+    return [tuple(block) for block in blocks]
+
+
+def _primitive(name):
+    return classes.primitive_types[name](None)
+
+
+def _type(node):
+    """The class a type node names, if it is the same in every scope - that
+    of a primitive - or None."""
+    name = getattr(node.type, "value", None)
+    if name in classes.primitive_types and not node.generics:
+        return _primitive(name)
+    return None
+
+
+# Operators, with the primitive type of their result if it is fixed.
+_infix = {
+    "<": (LT, "boolean"),
+    ">": (GT, "boolean"),
+    "<=": (LE, "boolean"),
+    ">=": (GE, "boolean"),
+    "==": (EQ, "boolean"),
+    "!=": (NE, "boolean"),
+    "&&": (AND, "boolean"),
+    "||": (OR, "boolean"),
+    "+": (ADD, None),
+    "-": (SUB, None),
+    "*": (MUL, None),
+    "/": (DIV, "int"),
+    "%": (MOD, "int"),
+    "&": (BIT_AND, None),
+    "|": (BIT_OR, None),
+    "^": (XOR, None),
+    "<<": (SHL, None),
+    ">>": (SHR, None),
+    ">>>": (SHR, None),
+}
+
+_prefix = {
+    "!": (NOT, "boolean"),
+    "~": (INVERT, None),
+    "-": (NEGATE, None),
+    "+": (POSITIVE, None),
+}
+
+
+class _Compiler:
+    def __init__(self, cls, node, profile=False):
+        parameters = ", ".join(
+            "{} {}".format(parameter.type.type.value, parameter.name.value)
+            for parameter in node.parameters)
+        if isinstance(node, mjast.Constructor):
+            description = "{}({})".format(cls.name.value, parameters)
+        else:
+            description = "{}.{}({})".format(cls.name.value, node.name.value,
+                                             parameters)
+        self.code = Code(node, description)
+        self.code.names.extend(node.layout)
+        self.bases = [0]
+        self.line = node.token.line
+        self.profile = profile
+        if profile:
+            self.code.counts = []
+        # The offsets of the instructions blocks start at.
+        self.targets = set()
+        self.counted = None
+        self.label()
+        self.statements(node.statements)
+        self.emit(RETURN_VOID)
+        if profile:
+            self.code.blocks = _blocks(self.code)
+        elif superinstructions:
+            _fuse(self.code, self.targets)
+
+    def emit(self, op, arg=0, node=None):
+        """Adds an instruction, returning the offset of its argument."""
+        if node is not None and node.token is not None:
+            self.line = node.token.line or self.line
+        self.code.instructions.extend((op, arg))
+        self.code.lines.append(self.line)
+        return len(self.code.instructions) - 1
+
+    def constant(self, value):
+        return self.code.constant(value)
+
+    def here(self):
+        return len(self.code.instructions)
+
+    def label(self):
+        """Starts a block here (if one doesn't already), returning the offset
+        of its first instruction."""
+        if not self.profile:
+            self.targets.add(self.here())
+            return self.here()
+        if self.counted != self.here() - 2:
+            self.counted = self.here()
+            self.emit(COUNT, len(self.code.counts))
+            self.code.counts.append(0)
+        return self.counted
+
+    def patch(self, at):
+        """Points the jump whose argument is at the given offset here."""
+        self.code.instructions[at] = self.label() - (at + 1)
+
+    def jump(self, op, target, node=None):
+        self.emit(op, target - (self.here() + 2), node)
+
+    def slot(self, address):
+        depth, slot = address
+        return self.bases[depth] + slot
+
+    def enter(self, statement):
+        """Gives the locals of a statement with a scope of its own slots after
+        all those given so far."""
+        if statement.layout is None:
+            return False
+        self.bases.append(len(self.code.names))
+        self.code.names.extend(statement.layout)
+        return True
+
+    def exit(self, scoped):
+        if scoped:
+            self.bases.pop()
+
+    def statements(self, statements):
+        for statement in statements:
+            _statements[type(statement)](self, statement)
+
+    def value(self, expression):
+        """Emits the instructions pushing the value of the expression."""
+        _expressions[type(expression)](self, expression)
+
+    def values(self, expressions):
+        for expression in expressions:
+            self.value(expression)
+
+    # Expressions.
+
+    def number(self, expression):
+        self.emit(CONST, self.constant(
+            (_primitive("int"), int(expression.value.value))), expression)
+
+    def decimal(self, expression):
+        self.emit(CONST, self.constant(
+            (_primitive("float"), float(expression.value.value))), expression)
+
+    def boolean(self, expression):
+        self.emit(CONST, self.constant(
+            (_primitive("boolean"), expression.value.value == "true")),
+            expression)
+
+    def string(self, expression):
+        self.emit(STRING, self.constant(bytes(
+            expression.value.value, "utf-8").decode("unicode_escape")),
+            expression)
+
+    def evaluated(self, expression):
+        """Leaves an expression with no locals in it to the tree-walker."""
+        self.emit(EVALUATE, self.constant(expression), expression)
+
+    def variable(self, expression):
+        if expression.address is None:
+            self.emit(CLASS, self.constant(expression), expression)
+        else:
+            self.emit(LOAD, self.slot(expression.address), expression)
+
+    def ternary(self, expression):
+        self.value(expression.lhs)
+        false = self.emit(JUMP_IF_FALSE, 0, expression)
+        self.label()
+        self.value(expression.true_case)
+        join = self.emit(JUMP, 0, expression)
+        self.patch(false)
+        self.value(expression.false_case)
+        self.patch(join)
+
+    def operation(self, expression):
+        operands = [getattr(expression, part) for part in ("lhs", "rhs")
+                    if hasattr(expression, part)]
+        self.values(operands)
+        table = (_infix if isinstance(expression, mjast.InfixOperation) else
+                 _prefix if isinstance(expression, mjast.PrefixOperation) else
+                 {})
+        try:
+            op, result = table[expression.operator.value]
+        except KeyError:
+            self.emit(OPERATION, self.constant((expression, len(operands))),
+                      expression)
+            return
+        self.emit(op, self.constant(_primitive(result)) if result else 0,
+                  expression)
+
+    def group(self, expression):
+        self.value(expression.operation)
+
+    def construction(self, expression):
+        self.values(expression.arguments)
+        self.emit(NEW, self.constant((expression, len(expression.arguments),
+                                      _type(expression.type))), expression)
+
+    def field(self, expression):
+        self.value(expression.lhs)
+        if expression.offset is not None:
+            self.emit(FIELD, expression.offset, expression)
+        else:
+            self.emit(FIELD_NAMED, self.constant(expression.field.value),
+                      expression)
+
+    def call(self, expression):
+        self.value(expression.lhs)
+        self.values(expression.arguments)
+        self.emit(CALL_MONOMORPHIC if expression.monomorphic else CALL,
+                  self.constant((expression, len(expression.arguments))),
+                  expression)
+
+    def cast(self, expression):
+        self.value(expression.target)
+        self.emit(CAST, self.constant((expression, _type(expression.type))),
+                  expression)
+
+    def inlined(self, expression):
+        if expression.receiver:
+            self.value(expression.receiver)
+        self.values(expression.arguments)
+        count = len(expression.arguments) + bool(expression.receiver)
+        self.emit(INLINE, self.constant(
+            (expression, self.slot(expression.address), count)), expression)
+        if expression.value:
+            self.value(expression.value)
+        else:
+            self.statements(expression.statements)
+        self.emit(LEAVE, 0, expression)
+
+    def temporary(self, expression):
+        self.value(expression.expression)
+        self.emit(TEMPORARY, self.slot(expression.address), expression)
+
+    def temporary_value(self, expression):
+        self.emit(TEMPORARY_VALUE, self.slot(expression.source.address),
+                  expression)
+
+    # Statements.
+
+    def discard(self, statement):
+        self.value(statement)
+        self.emit(POP, 0, statement)
+
+    def inlined_statement(self, statement):
+        self.inlined(statement)
+        if statement.value:
+            self.emit(POP, 0, statement)
+
+    def declaration(self, statement):
+        if statement.value:
+            self.value(statement.value)
+        self.emit(DECLARE, self.constant(
+            (statement, self.bases[-1] + statement.slot,
+             _type(statement.type))), statement)
+
+    def assignment(self, statement):
+        self.value(statement.value)
+        operator = statement.operator.value
+        apply = interpreter._assignment_operators.get(operator)
+        self.emit(ASSIGN if operator == "=" else UPDATE, self.constant(
+            (statement, self.slot(statement.address), apply)), statement)
+
+    def store(self, statement):
+        self.value(statement.lhs)
+        self.value(statement.rhs)
+        apply = interpreter._assignment_operators.get(
+            statement.operator.value)
+        self.emit(STORE, self.constant(
+            (statement, statement.offset, statement.field.value, apply)),
+            statement)
+
+    def increment(self, statement):
+        self.value(statement.lhs if isinstance(statement,
+                                               mjast.PostfixOperation)
+                   else statement.rhs)
+        step = {"++": 1, "--": -1}.get(statement.operator.value)
+        if step:
+            self.emit(STEP, step, statement)
+        else:
+            self.emit(POP, 0, statement)
+
+    def step(self, statement):
+        self.emit(TEMPORARY_STEP, self.constant(
+            (self.slot(statement.source.address), statement.step)),
+            statement)
+
+    def return_(self, statement):
+        if statement.value:
+            self.value(statement.value)
+            self.emit(RETURN, 0, statement)
+        else:
+            self.emit(RETURN_VOID, 0, statement)
+
+    def no_op(self, statement):
+        self.emit(FAIL, 0, statement)
+
+    def conditional(self, statement):
+        scoped = self.enter(statement)
+        self.value(statement.check)
+        false = self.emit(JUMP_IF_FALSE, 0, statement)
+        self.label()
+        self.statements(statement.true_case)
+        join = self.emit(JUMP, 0, statement)
+        self.patch(false)
+        if statement.elseif:
+            self.conditional(statement.elseif)
+        else:
+            self.statements(statement.false_case)
+        self.patch(join)
+        self.exit(scoped)
+
+    def loop(self, statement):
+        scoped = self.enter(statement)
+        if isinstance(statement, mjast.ForLoop):
+            self.statements([statement.setup])
+            self.statements(statement.reductions)
+            body = (statement.statements + [statement.iteration] +
+                    list(statement.steps))
+        else:
+            body = statement.statements
+        check = self.label()
+        self.value(statement.check)
+        exit_ = self.emit(JUMP_IF_FALSE, 0, statement)
+        self.label()
+        self.statements(body)
+        self.jump(JUMP, check, statement)
+        self.patch(exit_)
+        self.exit(scoped)
+
+    def vectorised(self, statement):
+        """Skips the loop if the range could be vectorised."""
+        self.value(statement.start)
+        self.value(statement.stop)
+        names = tuple((node.name.value, self.slot(node.address))
+                      for node in statement.names)
+        self.emit(VECTORISE, self.constant(
+            (statement, names, _primitive("boolean"))), statement)
+        done = self.emit(JUMP_IF_TRUE, 0, statement)
+        self.label()
+        self.loop(statement.loop)
+        self.patch(done)
+
+    def block(self, statement):
+        scoped = self.enter(statement)
+        self.statements(statement.statements)
+        self.exit(scoped)
+
+
+_expressions = {
+    mjast.StringLiteral: _Compiler.string,
+    mjast.NumberLiteral: _Compiler.number,
+    mjast.DecimalLiteral: _Compiler.decimal,
+    mjast.BooleanLiteral: _Compiler.boolean,
+    mjast.NullLiteral: _Compiler.evaluated,
+    mjast.Variable: _Compiler.variable,
+    mjast.TernaryOperation: _Compiler.ternary,
+    mjast.InfixOperation: _Compiler.operation,
+    mjast.PrefixOperation: _Compiler.operation,
+    mjast.PostfixOperation: _Compiler.operation,
+    mjast.ObjectConstruction: _Compiler.construction,
+    mjast.FieldAccess: _Compiler.field,
+    mjast.MethodCall: _Compiler.call,
+    mjast.Inlined: _Compiler.inlined,
+    mjast.Temporary: _Compiler.temporary,
+    mjast.TemporaryValue: _Compiler.temporary_value,
+    mjast.Cast: _Compiler.cast,
+    mjast.OperationGroup: _Compiler.group,
+}
+
+_statements = {
+    mjast.LocalVariableDeclaration: _Compiler.declaration,
+    mjast.WhileLoop: _Compiler.loop,
+    mjast.MethodCall: _Compiler.discard,
+    mjast.VariableAssignment: _Compiler.assignment,
+    mjast.Conditional: _Compiler.conditional,
+    mjast.PostfixOperation: _Compiler.increment,
+    mjast.PrefixOperation: _Compiler.increment,
+    mjast.ForLoop: _Compiler.loop,
+    mjast.FieldAssignment: _Compiler.store,
+    mjast.Return: _Compiler.return_,
+    mjast.NoOp: _Compiler.no_op,
+    mjast.Block: _Compiler.block,
+    mjast.Inlined: _Compiler.inlined_statement,
+    mjast.Temporary: _Compiler.discard,
+    mjast.TemporaryIncrement: _Compiler.step,
+    mjast.Vectorised: _Compiler.vectorised,
+}
+
+
+# Disassembly.
+
+def _describe_constant(value):
+    if isinstance(value, tuple):
+        return ", ".join(_describe_constant(part) for part in value
+                         if part is not None)
+    elif isinstance(value, mjast.MethodCall):
+        return value.method.value
+    elif isinstance(value, mjast.ObjectConstruction):
+        return "new " + sematics.type_str(sematics.type_from_node(value.type))
+    elif isinstance(value, mjast.Cast):
+        return "(" + sematics.type_str(sematics.type_from_node(value.type))
+    elif isinstance(value, mjast.Inlined):
+        return value.description
+    elif isinstance(value, (mjast.LocalVariableDeclaration,
+                            mjast.VariableAssignment, mjast.Variable)):
+        return value.name.value
+    elif isinstance(value, (mjast.Operation, mjast.FieldAssignment)):
+        return getattr(value, "field", value.operator).value
+    elif isinstance(value, mjast.Node):
+        return type(value).__name__
+    elif isinstance(value, classes.Class):
+        return str(value)
+    elif callable(value):
+        return "<operator>"
+    return repr(value)
+
+
+def _note(code, op, arg, end):
+    if op in _jumps:
+        return "to {}".format(end + arg)
+    elif op in _slots:
+        return code.names[arg]
+    elif op in _numbers:
+        return None
+    return _describe_constant(code.constants[arg])
+
+
+def disassemble(code):
+    """Yields the lines of a readable listing of the code."""
+    yield "code {} ({} slots, {} constants):".format(
+        code.description, len(code.names), len(code.constants))
+    instructions = code.instructions
+    previous = None
+    at = 0
+    for line in code.lines:
+        op = instructions[at]
+        end = at + width(op)
+        shown = line if line != previous else ""
+        if op in superinstructions:
+            # Its name, then what it runs.
+            yield "{:>5} {:>6} {}".format(shown, at, opnames[op])
+            parts = zip(superinstructions[op], range(at + 1, end),
+                        itertools.repeat(""))
+        else:
+            parts = [(op, at + 1, at)]
+        for op, offset, shown_at in parts:
+            arg = instructions[offset]
+            note = _note(code, op, arg, end)
+            yield "{:>5} {:>6} {:<17} {:>4}{}".format(
+                shown if shown_at != "" else "", shown_at, opnames[op], arg,
+                " ({})".format(note) if note is not None else "")
+        previous = line
+        at = end
+
+
+# The virtual machine.
+
+def _token(code, at):
+    """Where the instruction at an offset of the code came from."""
+    offset = 0
+    for line in code.lines:
+        if offset >= at:
+            break
+        offset += width(code.instructions[offset])
+    token = code.declaration.token
+    return Token(None, None, token.source, line, 0)
+
+
+def _null_pointer(token, scope):
+    return ExecutionException("Null Pointer Exception", scope.stack,
+                              token.source, token.line, token.pos)
+
+
+def _unknown_operator(node, line, pos):
+    return ExecutionException("Unknown operator {}!".format(
+        node.operator.value), node.token.source, line, pos)
+
+
+def _method(item, node, values, scope):
+    """The method a call on the item runs, the instance it runs on (if any)
+    and the scope it is called from, as the item's run_method would have."""
+    if isinstance(item, classes.Instance):
+        cls, instance, context = item.cls, item, item.scope
+    else:
+        cls, instance, context = item, None, scope
+    method = cls.lookup_method(node.method.value, values, context, instance,
+                               call=node)
+    return method, None if method.static else instance, context
+
+
+# Calls to methods with bytecode run it in this machine, the caller's frame
+# (its code, position and slots) kept on a stack of its own, rather than on
+# Python's, so deep recursion only needs memory.
+_call = """
+        callee = method.frame(method.cls, instance, values, context,
+                              call=node)
+        if callee is None:
+            push(method.run(method.cls, instance, values, context,
+                            call=node))
+        else:
+            frames.append((code, pc, slots, scope))
+            code = method.declaration.bytecode
+            instructions, constants = code.instructions, code.constants
+            counts = code.counts
+            slots = callee.slots + [None] * (len(code.names) -
+                                             len(callee.slots))
+            scope = callee
+            pc = 0"""
+
+_return = """
+        scope.stack.exit()
+        code, pc, slots, scope = frames.pop()
+        instructions, constants = code.instructions, code.constants
+        counts = code.counts
+        push(value)"""
+
+# What each instruction does, run with its argument in arg.
+_instructions = {
+    LOAD: "push(slots[arg])",
+    CONST: """
+        type_, value = constants[arg]
+        push(Variable(type_, value))""",
+    JUMP_IF_FALSE: """
+        if not pop().value:
+            pc += arg""",
+    JUMP: "pc += arg",
+    INLINE: """
+        node, first, count = constants[arg]
+        base = len(stack) - count
+        values = stack[base:]
+        del stack[base:]
+        if node.receiver:
+            item = values[0].value
+            if not node.call.nonnull and item is None:
+                raise _null_pointer(node.receiver.token, scope)
+            values[0] = item.this
+        slots[first:first + count] = values
+        scope.stack.enter(interpreter.Frame(node.description, node.call))""",
+    LEAVE: "scope.stack.exit()",
+    ASSIGN: """
+        node, slot, _ = constants[arg]
+        actual_type, value = pop()
+        target = slots[slot]
+        if target.type != actual_type:
+            raise ExecutionException("Type mismatch!", node.token.source,
+                                     node.line, node.pos)
+        target.value = value""",
+    UPDATE: """
+        node, slot, apply = constants[arg]
+        actual_type, value = pop()
+        target = slots[slot]
+        if target.type != actual_type:
+            raise ExecutionException("Type mismatch!", node.token.source,
+                                     node.line, node.pos)
+        if apply is None:
+            raise _unknown_operator(node, node.line, node.pos)
+        target.value = apply(target.value, value)""",
+    ADD: """
+        rhs = pop()
+        lhs = pop()
+        push(Variable(type(lhs.type)(scope), lhs.value + rhs.value))""",
+    LT: """
+        rhs = pop()
+        push(Variable(constants[arg], pop().value < rhs.value))""",
+    STEP: "pop().value += arg",
+    MUL: """
+        rhs = pop()
+        lhs = pop()
+        push(Variable(lhs.type, lhs.value * rhs.value))""",
+    DECLARE: """
+        node, slot, required_type = constants[arg]
+        if required_type is None:
+            required_type = scope.type(node.type)
+        if node.value:
+            actual_type, value = pop()
+        else:
+            actual_type, value = required_type, required_type.default_value
+        if not actual_type.is_subclass_of(required_type):
+            raise ExecutionException("Type mismatch!", node.token.source,
+                                     node.token.line, node.token.pos)
+        slots[slot] = Variable(required_type, value, scope)""",
+    CALL_MONOMORPHIC: """
+        node, count = constants[arg]
+        base = len(stack) - count
+        values = stack[base:]
+        del stack[base:]
+        item = pop()
+        if isinstance(item, Variable):
+            item = item.value
+        if not node.nonnull and item is None:
+            raise _null_pointer(node.lhs.token, scope)
+        if isinstance(item, classes.Class):
+            method = item.implementation(node.declaration)
+            instance, context = None, scope
+        else:
+            method = item.cls.implementation(node.declaration)
+            instance = None if method.static else item
+            context = item.scope""" + _call,
+    CALL: """
+        node, count = constants[arg]
+        base = len(stack) - count
+        values = stack[base:]
+        del stack[base:]
+        item = pop()
+        if isinstance(item, Variable):
+            item = item.value
+        if not node.nonnull and item is None:
+            raise _null_pointer(node.lhs.token, scope)
+        method, instance, context = _method(item, node, values, scope)""" +
+    _call,
+    SUB: """
+        rhs = pop()
+        lhs = pop()
+        push(Variable(type(lhs.type)(scope), lhs.value - rhs.value))""",
+    RETURN: """
+        value = pop()
+        if not frames:
+            return value""" + _return,
+    FIELD: "push(pop().value.fields[arg])",
+    CLASS: "push(interpreter.variable(constants[arg], scope))",
+    MOD: """
+        rhs = pop()
+        push(Variable(constants[arg], pop().value % rhs.value))""",
+    TEMPORARY_VALUE: """
+        value = slots[arg]
+        push(Variable(value.type, value.value))""",
+    TEMPORARY: """
+        value = stack[-1]
+        slots[arg] = Variable(value.type, value.value)""",
+    POP: "pop()",
+    RETURN_VOID: """
+        value = None
+        if not frames:
+            return value""" + _return,
+    STORE: """
+        node, offset, name, apply = constants[arg]
+        value = pop()
+        instance = pop().value
+        if offset is not None:
+            target = instance.fields[offset]
+        else:
+            target = instance.scope.value(name)
+        if apply is None:
+            raise _unknown_operator(node, node.token.line, node.token.pos)
+        target.value = apply(target.value, value.value)""",
+    GT: """
+        rhs = pop()
+        push(Variable(constants[arg], pop().value > rhs.value))""",
+    LE: """
+        rhs = pop()
+        push(Variable(constants[arg], pop().value <= rhs.value))""",
+    GE: """
+        rhs = pop()
+        push(Variable(constants[arg], pop().value >= rhs.value))""",
+    EQ: """
+        rhs = pop()
+        push(Variable(constants[arg], pop().value == rhs.value))""",
+    NE: """
+        rhs = pop()
+        push(Variable(constants[arg], pop().value != rhs.value))""",
+    AND: """
+        rhs = pop()
+        push(Variable(constants[arg], pop().value and rhs.value))""",
+    OR: """
+        rhs = pop()
+        push(Variable(constants[arg], pop().value or rhs.value))""",
+    BIT_AND: """
+        rhs = pop()
+        lhs = pop()
+        push(Variable(lhs.type, lhs.value & rhs.value))""",
+    BIT_OR: """
+        rhs = pop()
+        lhs = pop()
+        push(Variable(lhs.type, lhs.value | rhs.value))""",
+    XOR: """
+        rhs = pop()
+        lhs = pop()
+        push(Variable(lhs.type, lhs.value ^ rhs.value))""",
+    SHL: """
+        rhs = pop()
+        lhs = pop()
+        push(Variable(lhs.type, lhs.value << rhs.value))""",
+    SHR: """
+        rhs = pop()
+        lhs = pop()
+        push(Variable(lhs.type, lhs.value >> rhs.value))""",
+    DIV: """
+        rhs = pop()
+        push(Variable(constants[arg], pop().value // rhs.value))""",
+    NOT: "push(Variable(constants[arg], not pop().value))",
+    INVERT: """
+        value = pop()
+        push(Variable(value.type, ~value.value))""",
+    NEGATE: """
+        value = pop()
+        push(Variable(type(value.type)(scope), -value.value))""",
+    POSITIVE: """
+        value = pop()
+        push(Variable(type(value.type)(scope), +value.value))""",
+    FIELD_NAMED: """
+        item = pop()
+        if isinstance(item, library.LibClass):
+            push(getattr(item, constants[arg]))
+        else:
+            push(item.value.scope.value(constants[arg]))""",
+    STRING: """
+        push(Variable(scope.type("java.lang.String"), constants[arg]))""",
+    NEW: """
+        node, count, cls = constants[arg]
+        if cls is None:
+            cls = scope.type(node.type)
+        base = len(stack) - count
+        values = stack[base:]
+        del stack[base:]
+        push(Variable(cls, cls.instance(values, scope, call=node)))""",
+    TEMPORARY_STEP: """
+        slot, step = constants[arg]
+        slots[slot].value += step""",
+    JUMP_IF_TRUE: """
+        if pop().value:
+            pc += arg""",
+    CAST: """
+        node, cls = constants[arg]
+        if cls is None:
+            cls = scope.type(node.type)
+        push(Variable(cls, pop().value))""",
+    OPERATION: """
+        node, count = constants[arg]
+        base = len(stack) - count
+        values = stack[base:]
+        del stack[base:]
+        type_, value = interpreter._operations[node.operator.value](*values)
+        if isinstance(type_, type):
+            type_ = type_(scope)
+        push(Variable(type_, value))""",
+    VECTORISE: """
+        node, names, boolean = constants[arg]
+        stop = pop()
+        start = pop()
+        values = {name: slots[slot] for name, slot in names}
+        push(Variable(boolean, vectorise.run(node, start, stop, values,
+                                             scope)))""",
+    EVALUATE: "push(interpreter.evaluate(constants[arg], scope))",
+    # NoOps disabled to ensure they don't mask errors.
+    FAIL: "raise Exception",
+    COUNT: "counts[arg] += 1",
+}
+
+# With a quota, jumps back round a loop count as steps against it.
+_limited = {
+    JUMP: """
+        pc += arg
+        if arg < 0 and quota.step():
+            raise quota.exceeded(scope.stack, _token(code, pc))""",
+}
+
+# How the machine starts running code, and fetches each instruction.
+_setup = '''
+    instructions, constants = code.instructions, code.constants
+    counts = code.counts
+    Variable = interpreter.Variable
+    slots = scope.slots + [None] * (len(code.names) - len(scope.slots))
+    stack = []
+    push, pop = stack.append, stack.pop
+    frames = []
+    pc = 0
+    while True:'''
+
+_fetch = '''
+        op = instructions[pc]
+        arg = instructions[pc + 1]
+        pc += 2
+'''
+
+_run = '''
+def {name}(code, scope):
+    """Runs code in the scope made for the call, the arguments already being
+    bound into its slots, returning what it returns."""'''
+
+# The machine as a generator, pausing every slice instructions.
+_steps = '''
+def {name}(code, scope, slice):
+    """A generator running code as run does, yielding after every slice
+    instructions it runs (a superinstruction counting as one), returning what
+    the code returns. Calls the machine can't keep on its own stack (to
+    constructors and library methods) run to completion within a step."""'''
+
+_ticks = '''
+        ticks -= 1
+        if not ticks:
+            yield
+            ticks = slice'''
+
+# Runs with a quota are handed to a machine counting their steps, so those
+# without one don't pay for it.
+_unlimited = '''
+    if scope.stack.quota is not None:
+        {}limited_{}'''
+
+_quota = '''
+    quota = scope.stack.quota'''
+
+
+def _generate(order, stepping=False, limited=False):
+    """Makes the virtual machine, testing for instructions in the order
+    given (the commonest first) - as a generator, if stepping, and counting
+    steps against the run's quota, if limited."""
+    name = ("limited_" if limited else "") + ("steps" if stepping else "run")
+    header = (_steps if stepping else _run).format(name=name)
+    if limited:
+        header += _quota
+    elif stepping:
+        header += _unlimited.format("return (yield from ",
+                                    "steps(code, scope, slice))")
+    else:
+        header += _unlimited.format("return ", "run(code, scope)")
+    if stepping:
+        header += "\n    ticks = slice" + _setup + _ticks
+    else:
+        header += _setup
+    source = [header + _fetch]
+    instructions = dict(_instructions)
+    if limited:
+        instructions.update(_limited)
+    for number, op in enumerate(order):
+        source.append("        {} op == {}:  # {}".format(
+            "elif" if number else "if", op, opnames[op]))
+        for position, component in enumerate(
+                superinstructions.get(op, (op,))):
+            if position:
+                source.append("            arg = instructions[pc]\n"
+                              "            pc += 1")
+            source.append(textwrap.indent(
+                textwrap.dedent(instructions[component]).strip("\n"),
+                " " * 12))
+    source.append("        else:\n"
+                  "            raise ValueError("
+                  "\"Unknown opcode {}.\".format(op))\n")
+    source = "\n".join(source)
+    filename = "<{}{}bytecode virtual machine>".format(
+        "limited " if limited else "", "stepping " if stepping else "")
+    # So that tracebacks through it show its source.
+    linecache.cache[filename] = (len(source), None,
+                                 source.splitlines(True), filename)
+    namespace = {}
+    exec(compile(source, filename, "exec"), globals(), namespace)
+    return namespace[name]
+
+
+# The order instructions are tested for in without a profile, the commonest
+# in typical programs first.
+_default = [LOAD, CONST, JUMP_IF_FALSE, JUMP, INLINE, LEAVE, ASSIGN, UPDATE,
+            ADD, LT, STEP, MUL, DECLARE, CALL_MONOMORPHIC, CALL, SUB, RETURN,
+            FIELD, CLASS, MOD, TEMPORARY_VALUE, TEMPORARY, POP, RETURN_VOID,
+            STORE, GT, LE, GE, EQ, NE, AND, OR, BIT_AND, BIT_OR, XOR, SHL,
+            SHR, DIV, NOT, INVERT, NEGATE, POSITIVE, FIELD_NAMED, STRING, NEW,
+            TEMPORARY_STEP, JUMP_IF_TRUE, CAST, OPERATION, VECTORISE,
+            EVALUATE, FAIL, COUNT]
+_order = list(collections.OrderedDict.fromkeys(
+    [opcodes[name] for name in _order if name in opcodes] + _default +
+    sorted(superinstructions)))
+run = _generate(_order)
+steps = _generate(_order, stepping=True)
+limited_run = _generate(_order, limited=True)
+limited_steps = _generate(_order, stepping=True, limited=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    import optimiser
+
+    args = argparse.ArgumentParser(
+        description='Show the bytecode of Middleweight Java code.')
+    args.add_argument('file', metavar='FILE', type=argparse.FileType('r'),
+                      default=sys.stdin, help='The source code to compile.')
+    args.add_argument('-O', dest='level', type=int, choices=range(4),
+                      default=optimiser.default_level,
+                      help='The optimisation level (default: {}).'.format(
+                          optimiser.default_level))
+
+    args = args.parse_args()
+
+    program = parse_handling_errors(args.file)
+    sematics.analyse_handling_errors(program)
+    optimiser.PassManager(args.level).run(program)
+    dump(compile_program(program))
@@ -5,6 +5,9 @@
 
 from exceptions import ExecutionException
 import interpreter
+import ir
+import bytecode
+import compiler
 import abc
 import mjast
 
@@ -19,6 +22,10 @@ class Method(metaclass=abc.ABCMeta):
         self.parameters = parameters
         self._typed = False
 
+    @property
+    def signature(self):
+        return getattr(self.declaration, "signature", None)
+
     def fits(self, name, args, static):
         if not self._typed:
             self.type()
@@ -36,6 +43,11 @@ class Method(metaclass=abc.ABCMeta):
             self.type()
         return self._run(*args, call=call)
 
+    def frame(self, cls, instance, args, context, *, call):
+        """The scope to run a call in, its frame entered, for callers that
+        can run the method's bytecode themselves - or None if they can't."""
+        return None
+
     @abc.abstractmethod
     def _run(self, cls, instance, args, context, *, call):
         pass
@@ -49,6 +61,13 @@ class Method(metaclass=abc.ABCMeta):
 
 
 class NativeMethod(Method):
+    # With the tiered engine, the calls plus loop iterations a method runs
+    # before it is compiled to a Python function.
+    threshold = None
+    # How many calls compiled code's guards can fail before it is dropped for
+    # good.
+    guard_failures = 10
+
     def __init__(self, cls, node):
         self.cls = cls
         generics = [g.type.value for g in node.generics]
@@ -64,36 +83,129 @@ class NativeMethod(Method):
             {name: Generic(name) for name in self.generics})
         self._statements = node.statements
         self._token = node.token
+        self._layout = node.layout
+        self.declaration = node
+        self.calls = 0
+        self.back_edges = 0
+        self.failures = 0
+        self.loops = {}
 
     def type(self):
         self._typed = True
         self.parameters = [(value, self.scope.type(type_,
                                                    resolve_generics=True))
                            for value, type_ in self.parameters]
+        self._generic = any(Generic.within(type_)
+                            for _, type_ in self.parameters)
         self.return_type = (self.scope.type(self.return_type,
                                             resolve_generics=True)
                             if self.return_type is not None else None)
 
     def _run(self, cls, instance, args, context, *, call):
-        variables = {param: arg
-                     for arg, (param, _) in zip(args, self.parameters)}
+        if self.threshold is not None:
+            self.calls += 1
+            if self.calls + self.back_edges >= self.threshold:
+                self._tier_up(context)
+                return self._run(cls, instance, args, context, call=call)
+        memo = context.stack.memo
+        if memo is not None and self.declaration.memoisable:
+            key = self.declaration, tuple(arg.value for arg in args)
+            result = memo.get(key)
+            if result is None:
+                value = self._call(cls, instance, args, call=call)
+                memo.put(key, (value.type, value.value))
+                return value
+            return interpreter.Variable(*result)
+        return self._call(cls, instance, args, call=call)
+
+    def _tier_up(self, context):
+        """Swaps in a Python function compiled from the method for _run, if
+        it can be compiled."""
+        self.threshold = None
+        if context.stack.memo is not None and self.declaration.memoisable:
+            return
+        run = compiler.compile_method(self)
+        if run is not None:
+            self._run = run
+
+    def hot(self, loop):
+        """How many iterations of a loop of the method to interpret before
+        running the rest compiled - 0 if it already is, None if it never
+        will be."""
+        if NativeMethod.threshold is None:
+            return None
+        if loop in self.loops:
+            return 0 if self.loops[loop] is not None else None
+        return NativeMethod.threshold
+
+    def osr(self, loop, scope):
+        """Runs the rest of a loop of the method compiled (on-stack
+        replacement), compiling it the first time, returning whether it
+        could."""
+        if loop not in self.loops:
+            self.loops[loop] = compiler.compile_loop(self, loop, scope)
+        run = self.loops[loop]
+        return run is not None and run(scope)
+
+    def deoptimised(self, cls, instance, args, context, *, call):
+        """Interprets a call the compiled code's guards failed on, dropping
+        the compiled code if they have failed too often."""
+        self.failures += 1
+        if self.failures == self.guard_failures:
+            del self._run
+        return NativeMethod._run(self, cls, instance, args, context,
+                                 call=call)
+
+    def frame(self, cls, instance, args, context, *, call):
+        if (self.declaration.bytecode is None or
+                self.declaration.closure is not None or
+                context.stack.memo is not None and
+                self.declaration.memoisable):
+            return None
+        if not self._typed:
+            self.type()
+        return self._enter(cls, instance, args, call)
+
+    def _enter(self, cls, instance, args, call):
         types = dict(Generic.fill_generic(
-            [pt for _, pt in self.parameters], [arg.type for arg in args]))
+            [pt for _, pt in self.parameters],
+            [arg.type for arg in args])) if self._generic else {}
         if instance:
             scope = instance.scope
         else:
             scope = cls.scope
         description = self.description
-        context = interpreter.Scope(description, scope, types, variables,
-                                    stack=scope.stack)
-        context.stack.enter(interpreter.Frame(description, call))
-        try:
-            value = interpreter.execute(self._statements, context)
-        except Return as e:
-            value = e.value
-        scope.stack.exit()
+        context = interpreter.Scope(description, scope, types,
+                                    stack=scope.stack, layout=self._layout,
+                                    frame=True)
+        self.bind(context.slots, instance, args)
+        context.stack.enter(interpreter.Frame(description, call, self))
+        return context
+
+    def _call(self, cls, instance, args, *, call):
+        context = self._enter(cls, instance, args, call)
+        if self.declaration.closure is not None:
+            value = self.declaration.closure(context)
+        elif self.declaration.bytecode is not None:
+            value = bytecode.run(self.declaration.bytecode, context)
+        elif self.declaration.function is not None:
+            value = ir.run(self.declaration.function, context)
+        else:
+            try:
+                value = interpreter.execute(self._statements, context)
+            except Return as e:
+                value = e.value
+        context.stack.exit()
         return value
 
+    def bind(self, slots, instance, args):
+        """Puts 'this' and the arguments in the slots analysis gave them."""
+        if self.static:
+            slots[:len(args)] = args
+        else:
+            slots[0] = instance.this
+            slots[1:len(args) + 1] = args
+
     @property
     def description(self):
         params = ["{} {}".format(type_, name)
@@ -109,35 +221,47 @@ class NativeConstructor(NativeMethod):
         self.cls = cls
         self.token = node.token
         self._super_arguments = node.super_arguments
+        self._super_declaration = getattr(node, "super_declaration", None)
         self._statements = node.statements
+        self._layout = node.layout
+        self.declaration = node
 
     def type(self):
         self._typed = True
         self.parameters = [(value, self.cls.scope.type(type_))
                            for value, type_ in self.parameters]
+        self._generic = any(Generic.within(type_)
+                            for _, type_ in self.parameters)
 
     def _run(self, cls, instance, args, context, *, call):
-        variables = {param: arg
-                     for arg, (param, _) in zip(args, self.parameters)}
         generic_classes = dict(Generic.fill_generic(
-            [pt for _, pt in self.parameters], [arg.type for arg in args]))
+            [pt for _, pt in self.parameters],
+            [arg.type for arg in args])) if self._generic else {}
         scope = instance.scope
         description = self.description
-        context = interpreter.Scope(description, scope,
-                                    generic_classes, variables)
+        context = interpreter.Scope(description, scope, generic_classes,
+                                    layout=self._layout, frame=True)
+        self.bind(context.slots, instance, args)
         context.stack.enter(interpreter.Frame(description, call))
         if cls.base:
             if self._super_arguments:
-                arguments = [interpreter.evaluate(argument, scope)
+                arguments = [interpreter.evaluate(argument, context)
                              for argument in self._super_arguments]
-                cls.base.run_constructor(instance, arguments,
-                                         context, call=call)
+                cls.base.run_constructor(
+                    instance, arguments, context, call=call,
+                    declaration=self._super_declaration)
             else:
-                cls.base.run_constructor(instance, (), scope, call=call)
-        try:
-            interpreter.execute(self._statements, context)
-        except Return:
-            pass
+                cls.base.run_constructor(instance, (), scope, call=call,
+                                         declaration=self._super_declaration)
+        if self.declaration.closure is not None:
+            self.declaration.closure(context)
+        elif self.declaration.bytecode is not None:
+            bytecode.run(self.declaration.bytecode, context)
+        else:
+            try:
+                interpreter.execute(self._statements, context)
+            except Return:
+                pass
         scope.stack.exit()
 
     @property
@@ -151,7 +275,7 @@ class Instance:
 
     def __init__(self, cls, arguments, context, *, call):
         self.cls = cls
-        self.scope = self.make_scope(context)
+        self.scope = self.make_scope(context, call)
         self.internal = {}
         cls.run_constructor(self, arguments, self.scope, call=call)
 
@@ -159,10 +283,17 @@ class Instance:
         return self.cls.run_method(name, args, self.scope, instance=self,
                                    call=call)
 
-    def make_scope(self, context):
-        fields = {name: interpreter.Variable(type_)
-                  for type_, name in self.cls.fields}
-        fields["this"] = interpreter.Variable(self.cls, self)
+    def make_scope(self, context, call=None):
+        quota = context.stack.quota
+        if quota is not None and quota.heap is not None:
+            # A cell for each field, and one for the instance itself.
+            quota.allocate(self, len(self.cls.layout) + 1, context.stack,
+                           call.token if call is not None else None)
+        self.fields = [interpreter.Variable(type_)
+                       for type_, _ in self.cls.layout]
+        fields = {name: field
+                  for (_, name), field in zip(self.cls.layout, self.fields)}
+        self.this = fields["this"] = interpreter.Variable(self.cls, self)
         return interpreter.Scope(
             "{}()".format(self.cls),
             None,
@@ -181,17 +312,21 @@ class Class:
     base = "java.lang.Object", ()
     generics = []
     fields = set()
+    layout = []
     constructors = set()
     methods = set()
     static = False
 
     default_value = None
+    monomorphises = None
 
     _constructor_class = NativeConstructor
     _method_class = NativeMethod
     _instance_class = Instance
 
     def __init__(self, scope, generics=None, static=False):
+        self._resolved = {}
+        self._implementations = None
         self.specified = generics if generics is not None else ()
         if not static:
             if len(self.specified) != len(self.generics):
@@ -208,12 +343,18 @@ class Class:
             self.scope = interpreter.Scope(self.name, None, scope.top.types,
                                            stack=scope.stack)
         self.generics = self.specified
+        if self.monomorphises:
+            # A copy monomorphisation made of a generic class fills the
+            # generics of the class it is of, for code that wasn't copied.
+            self.generics = [self.scope.type(generic)
+                             for generic in self.monomorphises[1]]
         self.base = self.scope.type(self.base)
         self.mro = list(self._mro())
         self.parent = self.scope.type(self.parent)
         if not static:
-            self.fields = {(self.scope.type(type_), name)
-                           for type_, name in self.fields}
+            self.fields = [(self.scope.type(type_), name)
+                           for type_, name in self.fields]
+            self.layout = (self.base.layout if self.base else []) + self.fields
             self.constructors = {self._constructor_class(self, constructor)
                                  for constructor in self.constructors}
             self.methods = {self._method_class(self, method)
@@ -230,19 +371,84 @@ class Class:
             "base": node.base,
             "generics": [name for name in
                          [g.type.value for g in node.generics]],
-            "fields": {(field.type, field.name.value) for field in node.fields},
+            "fields": [(field.type, field.name.value) for field in node.fields],
             "constructors": set(node.constructors),
             "methods": set(node.methods),
+            "monomorphises": node.monomorphises,
         })
         return new
 
     def instance(self, args, context, *, call):
         return self._instance_class(self, args, context, call=call)
 
+    @classmethod
+    def static_instance(cls, scope):
+        """Gets the static form of the class, made once per execution."""
+        static = cls.__dict__.get("_static")
+        if static is None or static.scope.stack is not scope.stack:
+            static = cls(scope, static=True)
+            cls._static = static
+        return static
+
     def run_method(self, name, args, context, instance=None, *, call):
-        static = instance is None
+        method = self.lookup_method(name, args, context, instance, call=call)
+        if method.static:
+            instance = None
+        return method.run(method.cls, instance, args, context, call=call)
+
+    def lookup_method(self, name, args, context, instance=None, *, call):
+        """The method a call to the named method runs."""
+        declaration = getattr(call, "declaration", None)
+        if declaration is not None:
+            return self.resolve(declaration, context, call)
+        return self.find_method(name, args, instance is None, context, call)
+
+    def resolve(self, declaration, context, call):
+        """Finds the method implementing the declaration the semantic analyser
+        bound the call to, re-dispatching on this (the runtime) class if the
+        declaration is overridden."""
+        try:
+            return self._resolved[declaration]
+        except KeyError:
+            pass
+        signature = getattr(declaration, "signature", None)
+        current = self
+        while current:
+            for method in current.methods:
+                if method.declaration is declaration or (
+                        not method.static and signature is not None and
+                        method.signature == signature):
+                    self._resolved[declaration] = method
+                    return method
+            current = current.base
+        raise ExecutionException(
+            "No method {!r} on {}.".format(signature, self), context.stack,
+            call.token.source, call.token.line, call.token.pos)
+
+    def implementation(self, declaration):
+        """The method made from the declaration in this class or its bases,
+        for calls analysis has shown can't be overridden."""
+        if self._implementations is None:
+            self._implementations = {}
+            current = self
+            while current:
+                for method in current.methods:
+                    self._implementations.setdefault(method.declaration,
+                                                     method)
+                current = current.base
+        try:
+            return self._implementations[declaration]
+        except KeyError:
+            # Calls outside the copies monomorphisation made of generic
+            # classes are bound to the originals.
+            return self.resolve(declaration, None, None)
+
+    def find_method(self, name, args, static, context, call):
         matches = {method for method in self.methods
-                   if method.fits(name, args, static)}
+                   if method.fits(name, args, static) and
+                   getattr(method.declaration, "specialises", None) is None
+                   and getattr(method.declaration, "monomorphises",
+                               None) is None}
         if len(matches) > 1:
             raise ExecutionException(
                 "Ambiguous method arguments for {!r} - ({}) fits ({}).".format(
@@ -253,8 +459,8 @@ class Class:
                 call.token.source, call.token.line, call.token.pos)
         elif not matches:
             if self.base:
-                return self.base.run_method(name, args, context, instance,
-                                            call=call)
+                return self.base.find_method(name, args, static, context,
+                                             call)
             else:
                 raise ExecutionException(
                     "No {} method {!r} with arguments ({}).".format(
@@ -262,17 +468,29 @@ class Class:
                         ", ".join([str(arg.type) for arg in args])),
                     context.stack, call.token.source, call.token.line,
                     call.token.pos)
-        else:
-            method, = matches
-        if method.static:
-            instance = None
-        return method.run(self, instance, args, context, call=call)
+        method, = matches
+        return method
 
-    def run_constructor(self, instance, args, context, *, call):
+    def run_constructor(self, instance, args, context, *, call,
+                        declaration=None):
         if not len(self.constructors) and not args:
             if self.base:
                 self.base.run_constructor(instance, (), context, call=call)
             return
+        if declaration is None:
+            declaration = getattr(call, "declaration", None)
+        try:
+            constructor = self._resolved[declaration]
+        except KeyError:
+            constructor = self.find_constructor(declaration, args, context,
+                                                call)
+        constructor.run(self, instance, args, context, call=call)
+
+    def find_constructor(self, declaration, args, context, call):
+        for constructor in self.constructors:
+            if constructor.declaration is declaration:
+                self._resolved[declaration] = constructor
+                return constructor
         matches = {constructor for constructor in self.constructors
                    if constructor.fits(self.name, args, False)}
         if len(matches) > 1:
@@ -292,12 +510,13 @@ class Class:
                     ", ".join([str(arg.type) for arg in args])),
                 context.stack, call.token.source, call.token.line,
                 call.token.pos)
-        else:
-            constructor, = matches
-        constructor.run(self, instance, args, context, call=call)
+        constructor, = matches
+        return constructor
 
     def _mro(self):
         yield type(self)
+        if self.monomorphises:
+            yield self.scope.type(self.monomorphises[0], static=True)
         if self.base:
             yield from self.base._mro()
 
@@ -330,7 +549,9 @@ class Class:
         return hash(self.name) + hash(self.parent)
 
     def __repr__(self):
-        generics = ", ".join(str(t) for t in self.generics)
+        # A copy made by monomorphisation is named after its generics.
+        generics = ("" if self.monomorphises else
+                    ", ".join(str(t) for t in self.generics))
         return "{}{}".format(
             self.full_name, "<{}>".format(generics) if generics else "")
 
@@ -375,6 +596,13 @@ class Generic:
             else:
                 yield from cls.fill_generic(g.generics, s.generics)
 
+    @classmethod
+    def within(cls, type_):
+        """Whether a type is or has generics to be filled when called."""
+        return isinstance(type_, cls) or any(
+            cls.within(generic) for generic in getattr(type_, "generics", ())
+            if not isinstance(generic, str))
+
     @classmethod
     def apply(cls, *generics):
         def decorate(func):
@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Closure compilation - each analysed method and constructor body turned,
+once, into a tree of Python closures, one per node, which run it.
+
+Where the tree-walker looks up the handler for every node each time it is
+reached, a closure has its children's closures, the function applying its
+operator, its slot and (for primitives) its types already to hand. Values are
+the same variables the tree-walker's expressions evaluate to, and nodes
+without a closure of their own run through the tree-walker's handler, so
+running the closures behaves exactly as walking the tree does.
+
+A statement's closure returns None, unless it (or one it contains) returned
+from the method, when it returns the value returned, or _void."""
+
+import itertools
+import operator
+
+import library
+import classes
+import interpreter
+import mjast
+import vectorise
+from exceptions import ExecutionException
+from interpreter import Scope, Variable
+
+
+_void = object()
+
+
+def install(program):
+    """Has the interpreter run the methods and constructors of an analysed
+    program from their closures rather than their trees, returning how many
+    were compiled."""
+    compiled = 0
+    for cls in program.classes:
+        for node in itertools.chain(cls.constructors, cls.methods):
+            node.closure = _body(node.statements)
+            compiled += 1
+    return compiled
+
+
+def _body(statements):
+    body = _sequence(statements)
+
+    def run(scope):
+        result = body(scope)
+        return None if result is _void else result
+    return run
+
+
+_primitives = {name: type_(None)
+               for name, type_ in classes.primitive_types.items()}
+
+
+def _type(node):
+    """A function giving the class a type node names in a scope - primitives
+    are the same in every scope, so are made once."""
+    name = getattr(node.type, "value", None)
+    if name in _primitives and not node.generics:
+        type_ = _primitives[name]
+        return lambda scope: type_
+    return lambda scope: scope.type(node)
+
+
+# Expressions - each closure returns what evaluating the node would.
+
+def _expression(node):
+    try:
+        compile_ = _expressions[type(node)]
+    except KeyError:
+        return lambda scope: interpreter.evaluate(node, scope)
+    return compile_(node)
+
+
+def _string(node):
+    value = bytes(node.value.value, "utf-8").decode("unicode_escape")
+    return lambda scope: Variable(scope.type("java.lang.String"), value)
+
+
+def _literal(type_, convert):
+    def compile_(node):
+        value = convert(node.value.value)
+        return lambda scope: Variable(type_, value)
+    return compile_
+
+
+def _variable(node):
+    if node.address is None:
+        handler = interpreter.variable
+        return lambda scope: handler(node, scope)
+    depth, slot = node.address
+    return lambda scope: scope.display[depth][slot]
+
+
+def _ternary(node):
+    check = _expression(node.lhs)
+    true_case = _expression(node.true_case)
+    false_case = _expression(node.false_case)
+
+    def run(scope):
+        if check(scope).value:
+            return true_case(scope)
+        return false_case(scope)
+    return run
+
+
+# Operators by the type of their result - a boolean, the type of the left
+# operand, an int, or a new class of the type of the left operand.
+_booleans = {
+    ">": operator.gt,
+    "<": operator.lt,
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "&&": lambda lhs, rhs: lhs and rhs,
+    "||": lambda lhs, rhs: lhs or rhs,
+}
+_same = {
+    "*": operator.mul,
+    "&": operator.and_,
+    "|": operator.or_,
+    "^": operator.xor,
+    "<<": operator.lshift,
+    ">>": operator.rshift,
+    ">>>": operator.rshift,
+}
+_ints = {
+    "/": operator.floordiv,
+    "%": operator.mod,
+}
+_widened = {
+    "+": operator.add,
+    "-": operator.sub,
+}
+_unary = {
+    "+": operator.pos,
+    "-": operator.neg,
+}
+
+
+def _operation(node):
+    symbol = node.operator.value
+    if isinstance(node, mjast.InfixOperation):
+        lhs, rhs = _expression(node.lhs), _expression(node.rhs)
+        if symbol in _booleans:
+            return _binary(lhs, rhs, _booleans[symbol], _primitives["boolean"])
+        elif symbol in _same:
+            apply = _same[symbol]
+
+            def run(scope):
+                left = lhs(scope)
+                return Variable(left.type, apply(left.value,
+                                                 rhs(scope).value))
+            return run
+        elif symbol in _ints:
+            return _binary(lhs, rhs, _ints[symbol], _primitives["int"])
+        elif symbol in _widened:
+            apply = _widened[symbol]
+
+            def run(scope):
+                left = lhs(scope)
+                value = apply(left.value, rhs(scope).value)
+                return Variable(type(left.type)(scope), value)
+            return run
+    elif isinstance(node, mjast.PrefixOperation):
+        rhs = _expression(node.rhs)
+        if symbol == "!":
+            boolean = _primitives["boolean"]
+            return lambda scope: Variable(boolean, not rhs(scope).value)
+        elif symbol == "~":
+            def run(scope):
+                value = rhs(scope)
+                return Variable(value.type, ~value.value)
+            return run
+        elif symbol in _unary:
+            apply = _unary[symbol]
+
+            def run(scope):
+                value = rhs(scope)
+                return Variable(type(value.type)(scope), apply(value.value))
+            return run
+    handler = interpreter.operation
+    return lambda scope: handler(node, scope)
+
+
+def _binary(lhs, rhs, apply, type_):
+    return lambda scope: Variable(type_, apply(lhs(scope).value,
+                                               rhs(scope).value))
+
+
+def _construction(node):
+    type_ = _type(node.type)
+    arguments = _expression_list(node.arguments)
+
+    def run(scope):
+        cls = type_(scope)
+        values = [argument(scope) for argument in arguments]
+        return Variable(cls, cls.instance(values, scope, call=node))
+    return run
+
+
+def _field(node):
+    lhs = _expression(node.lhs)
+    offset = node.offset
+    if offset is not None:
+        return lambda scope: lhs(scope).value.fields[offset]
+    name = node.field.value
+
+    def run(scope):
+        item = lhs(scope)
+        if isinstance(item, library.LibClass):
+            return getattr(item, name)
+        return item.value.scope.value(name)
+    return run
+
+
+def _null_pointer(token, scope):
+    return ExecutionException("Null Pointer Exception", scope.stack,
+                              token.source, token.line, token.pos)
+
+
+def _call(node):
+    lhs = _expression(node.lhs)
+    arguments = _expression_list(node.arguments)
+    nonnull, declaration = node.nonnull, node.declaration
+    if node.monomorphic:
+        def run(scope):
+            item = lhs(scope)
+            values = [argument(scope) for argument in arguments]
+            if isinstance(item, Variable):
+                item = item.value
+            if not nonnull and item is None:
+                raise _null_pointer(node.lhs.token, scope)
+            if isinstance(item, classes.Class):
+                method = item.implementation(declaration)
+                return method.run(method.cls, None, values, scope, call=node)
+            method = item.cls.implementation(declaration)
+            return method.run(method.cls, None if method.static else item,
+                              values, item.scope, call=node)
+        return run
+    name = node.method.value
+
+    def run(scope):
+        item = lhs(scope)
+        values = [argument(scope) for argument in arguments]
+        if isinstance(item, Variable):
+            item = item.value
+        if not nonnull and item is None:
+            raise _null_pointer(node.lhs.token, scope)
+        return item.run_method(name, values, scope, call=node)
+    return run
+
+
+def _inlined(node):
+    receiver = _expression(node.receiver) if node.receiver else None
+    arguments = _expression_list(node.arguments)
+    depth, first = node.address
+    nonnull = node.receiver is None or node.call.nonnull
+    if node.value:
+        body = _expression(node.value)
+    else:
+        statements = _sequence(node.statements)
+
+        def body(scope):
+            statements(scope)
+    description, call = node.description, node.call
+
+    def run(scope):
+        if receiver:
+            item = receiver(scope).value
+        values = [argument(scope) for argument in arguments]
+        slots = scope.display[depth]
+        slot = first
+        if receiver:
+            if not nonnull and item is None:
+                raise _null_pointer(node.receiver.token, scope)
+            slots[slot] = item.this
+            slot += 1
+        slots[slot:slot + len(values)] = values
+        scope.stack.enter(interpreter.Frame(description, call))
+        value = body(scope)
+        scope.stack.exit()
+        return value
+    return run
+
+
+def _temporary(node):
+    expression = _expression(node.expression)
+    depth, slot = node.address
+
+    def run(scope):
+        value = expression(scope)
+        scope.display[depth][slot] = Variable(value.type, value.value)
+        return value
+    return run
+
+
+def _temporary_value(node):
+    depth, slot = node.source.address
+
+    def run(scope):
+        value = scope.display[depth][slot]
+        return Variable(value.type, value.value)
+    return run
+
+
+def _cast(node):
+    type_ = _type(node.type)
+    target = _expression(node.target)
+
+    def run(scope):
+        cls = type_(scope)
+        return Variable(cls, target(scope).value)
+    return run
+
+
+def _group(node):
+    return _expression(node.operation)
+
+
+def _expression_list(nodes):
+    return tuple(_expression(node) for node in nodes)
+
+
+_expressions = {
+    mjast.StringLiteral: _string,
+    mjast.NumberLiteral: _literal(_primitives["int"], int),
+    mjast.DecimalLiteral: _literal(_primitives["float"], float),
+    mjast.BooleanLiteral: _literal(_primitives["boolean"],
+                                   lambda value: value == "true"),
+    mjast.Variable: _variable,
+    mjast.TernaryOperation: _ternary,
+    mjast.InfixOperation: _operation,
+    mjast.PrefixOperation: _operation,
+    mjast.ObjectConstruction: _construction,
+    mjast.FieldAccess: _field,
+    mjast.MethodCall: _call,
+    mjast.Inlined: _inlined,
+    mjast.Temporary: _temporary,
+    mjast.TemporaryValue: _temporary_value,
+    mjast.Cast: _cast,
+    mjast.OperationGroup: _group,
+}
+
+
+# Statements.
+
+def _statement(node):
+    try:
+        compile_ = _statements[type(node)]
+    except KeyError:
+        return lambda scope: interpreter.execute((node, ), scope)
+    return compile_(node)
+
+
+def _sequence(nodes):
+    statements = tuple(_statement(node) for node in nodes)
+    if not statements:
+        return lambda scope: None
+    elif len(statements) == 1:
+        return statements[0]
+
+    def run(scope):
+        for statement in statements:
+            result = statement(scope)
+            if result is not None:
+                return result
+    return run
+
+
+def _discarded(node):
+    """An expression run as a statement, its value being thrown away."""
+    expression = _expression(node)
+
+    def run(scope):
+        expression(scope)
+    return run
+
+
+def _scoped(node, kind, body):
+    """Runs the body in a scope of its own, if the statement has one."""
+    layout = node.layout
+    if layout is None:
+        return body
+    description = "{} (Line {})".format(kind, node.token.line)
+    return lambda scope: body(Scope(description, scope, layout=layout))
+
+
+def _local(node):
+    type_ = _type(node.type)
+    value = _expression(node.value) if node.value else None
+    slot = node.slot
+
+    def run(scope):
+        required_type = type_(scope)
+        if value:
+            actual_type, actual = value(scope)
+        else:
+            actual_type, actual = required_type, required_type.default_value
+        if not actual_type.is_subclass_of(required_type):
+            raise ExecutionException("Type mismatch!", node.token.source,
+                                     node.token.line, node.token.pos)
+        scope.slots[slot] = Variable(required_type, actual, scope)
+    return run
+
+
+def _while(node):
+    check = _expression(node.check)
+    statements = _sequence(node.statements)
+
+    def loop(scope):
+        quota = scope.stack.quota
+        while check(scope).value:
+            result = statements(scope)
+            if result is not None:
+                return result
+            if quota is not None and quota.step():
+                raise quota.exceeded(scope.stack, node.token)
+    return _scoped(node, "While Loop", loop)
+
+
+def _for(node):
+    setup = _statement(node.setup)
+    reductions = _sequence(node.reductions)
+    check = _expression(node.check)
+    statements = _sequence(node.statements + [node.iteration] +
+                           list(node.steps))
+
+    def loop(scope):
+        setup(scope)
+        reductions(scope)
+        quota = scope.stack.quota
+        while check(scope).value:
+            result = statements(scope)
+            if result is not None:
+                return result
+            if quota is not None and quota.step():
+                raise quota.exceeded(scope.stack, node.token)
+    return _scoped(node, "For Loop", loop)
+
+
+def _conditional(node):
+    check = _expression(node.check)
+    true_case = _sequence(node.true_case)
+    if node.elseif:
+        false_case = _statement(node.elseif)
+    else:
+        false_case = _sequence(node.false_case)
+
+    def run(scope):
+        if check(scope).value:
+            return true_case(scope)
+        return false_case(scope)
+    return _scoped(node, "Conditional", run)
+
+
+def _assignment(node):
+    depth, slot = node.address
+    value = _expression(node.value)
+    symbol = node.operator.value
+    apply = interpreter._assignment_operators.get(symbol)
+
+    def run(scope):
+        target = scope.display[depth][slot]
+        actual_type, rhs = value(scope)
+        if target.type != actual_type:
+            raise ExecutionException("Type mismatch!", node.token.source,
+                                     node.line, node.pos)
+        if apply is None:
+            raise ExecutionException("Unknown operator {}!".format(symbol),
+                                     node.token.source, node.line, node.pos)
+        target.value = apply(target.value, rhs)
+    return run
+
+
+def _step(node, get):
+    """An increment or decrement, run as a statement."""
+    target = _expression(get(node))
+    step = {"++": 1, "--": -1}.get(node.operator.value, 0)
+
+    def run(scope):
+        if step:
+            target(scope).value += step
+        else:
+            target(scope)
+    return run
+
+
+def _field_assignment(node):
+    lhs = _expression(node.lhs)
+    rhs = _expression(node.rhs)
+    offset, name = node.offset, node.field.value
+    symbol = node.operator.value
+    apply = interpreter._assignment_operators.get(symbol)
+
+    def run(scope):
+        instance = lhs(scope).value
+        value = rhs(scope)
+        if offset is not None:
+            target = instance.fields[offset]
+        else:
+            target = instance.scope.value(name)
+        if apply is None:
+            raise ExecutionException("Unknown operator {}!".format(symbol),
+                                     node.token.source, node.token.line,
+                                     node.token.pos)
+        target.value = apply(target.value, value.value)
+    return run
+
+
+def _return(node):
+    if not node.value:
+        return lambda scope: _void
+    return _expression(node.value)
+
+
+def _block(node):
+    return _scoped(node, "Anonymous Block", _sequence(node.statements))
+
+
+def _temporary_increment(node):
+    depth, slot = node.source.address
+    step = node.step
+
+    def run(scope):
+        scope.display[depth][slot].value += step
+    return run
+
+
+def _vectorised(node):
+    start, stop = _expression(node.start), _expression(node.stop)
+    names = [(name.name.value, name.address) for name in node.names]
+    loop = _for(node.loop)
+
+    def run(scope):
+        values = {name: scope.display[depth][slot]
+                  for name, (depth, slot) in names}
+        if not vectorise.run(node, start(scope), stop(scope), values, scope):
+            return loop(scope)
+    return run
+
+
+_statements = {
+    mjast.LocalVariableDeclaration: _local,
+    mjast.WhileLoop: _while,
+    mjast.MethodCall: _discarded,
+    mjast.VariableAssignment: _assignment,
+    mjast.Conditional: _conditional,
+    mjast.PostfixOperation: lambda node: _step(node, lambda node: node.lhs),
+    mjast.PrefixOperation: lambda node: _step(node, lambda node: node.rhs),
+    mjast.ForLoop: _for,
+    mjast.FieldAssignment: _field_assignment,
+    mjast.Return: _return,
+    mjast.Block: _block,
+    mjast.Inlined: _discarded,
+    mjast.Temporary: _discarded,
+    mjast.TemporaryIncrement: _temporary_increment,
+    mjast.Vectorised: _vectorised,
+}
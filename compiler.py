@@ -1,46 +1,110 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-"""Compile MWJ Code to Python Bytecode."""
+"""Compile MWJ Code to Python Bytecode.
+
+Methods that have been lowered to the IR are compiled from their control flow
+graphs, as a loop dispatching on the number of the block to run next, with a
+Python local for each register.
+
+The interpreter's tiered engine also compiles methods here as they get hot,
+into Python functions it runs in place of walking their trees."""
 
 from ast import *
+import collections
+import importlib.util
+import linecache
 import os
 import time
-import py_compile
 import marshal
+import re
 import sys
 import mjast
 
 import parser
 import sematics
+import ir
+import optimiser
+import classes
+import interpreter
+import library
+import vectorise
+from exceptions import ExecutionException
+
+
+# What compiled programs need besides their own classes - the classes of the
+# standard library they can use (lists stand in for java.util.List), and how
+# objects are made, by running a constructor on a new instance.
+_runtime = """
+def _new(cls, constructor, *arguments):
+    instance = cls.__new__(cls)
+    getattr(instance, constructor)(*arguments)
+    return instance
+
+
+class List(list):
+    def add(self, item):
+        self.append(item)
+
+    def get(self, index):
+        return self[index]
+
+    def set(self, index, value):
+        old, self[index] = self[index], value
+        return old
+
+    def size(self):
+        return len(self)
+
+    def remove(self, index):
+        return self.pop(index)
+
+    def contains(self, item):
+        return item in self
+
+    def subList(self, start, stop):
+        return List(self[start:stop])
+"""
 
 
 def program(node, statement):
     for cls in node.classes:
         if any(m.name.value == "main" for m in cls.methods):
             main_class = cls.name.value
+    # Python needs each class defined after the class it extends.
+    names = {cls.name.value: cls for cls in node.classes}
+    ordered = []
+    for cls in node.classes:
+        chain = []
+        while cls is not None and cls not in ordered + chain:
+            chain.append(cls)
+            cls = names.get(cls.base.type.value) if cls.base else None
+        ordered += reversed(chain)
     return Module(
-        body=[mjast_to_pyast(cls, True) for cls in node.classes] +
+        body=[mjast_to_pyast(cls, True) for cls in ordered] +
              [If(test=Compare(left=Name(id="__name__", ctx=Load()), ops=[Eq()],
                               comparators=[Str("__main__")]),
                  body=[Expr(Call(func=Attribute(value=Name(id=main_class,
                                                            ctx=Load()),
                                                 attr="main", ctx=Load()),
                                  args=[], keywords=[], starargs=None,
-                                 kwargs=None))], orelse=[])]
+                                 kwargs=None))], orelse=[])],
+        type_ignores=[],
     )
 
 
 def parameter(node, statement):
-    return arg(arg=node.name, annoation=None)
+    return arg(arg=node.name.value, annotation=None)
 
 
 def field(node, statement):
+    # Fields are set up in the constructor, whose object is its first
+    # register.
     return Assign(
-        targets=[Attribute(value=Name(id="self", ctx=Load()),
+        targets=[Attribute(value=_register(0),
                            attr=node.name.value,
                            ctx=Store())],
-        value=Name(id="None", ctx=Load()),
+        value=Constant(None),
     )
 
 
@@ -48,6 +112,10 @@ def string_literal(node, statement):
     return Str(node.value.value)
 
 
+def literal(node, statement):
+    return _literal(node)
+
+
 def field_assignment(node, statement):
     return Assign(
         targets=[Attribute(value=mjast_to_pyast(node.lhs),
@@ -74,24 +142,55 @@ def local_variable_declaration(node, statement):
             raise ValueError("Can't handle other than '='.")
         value = mjast_to_pyast(node.value)
     else:
-        value = Name(id="None", ctx=Load())
+        value = Constant(None)
     return Assign(
         targets=[node.name.value],
         value=value,
     )
 
 
+def _identifier(name):
+    """The Python name of a class - copies of generic classes made by
+    monomorphisation are named after the instantiation, like 'Box<int>'."""
+    return re.sub(r"\W+", "_", name).strip("_")
+
+
+def _overload(name, types):
+    """The Python name of a method or constructor - Python looks methods up
+    by name alone, so overloads are named after their parameters' types too.
+    """
+    return "_".join([name] + [_identifier(type_.split(".")[-1])
+                              for type_ in types])
+
+
+def _method_name(node):
+    """The Python name of the method a call is bound to - an override shares
+    the signature, so the name, of the method it overrides."""
+    if isinstance(node.declaration, mjast.Method):
+        return _overload(node.method.value, node.declaration.signature[1])
+    return node.method.value
+
+
+def _constructor_name(constructor):
+    """Constructors are methods named '_init', run on the object once it has
+    been made."""
+    return _overload("_init", [parameter.type.type.value
+                               for parameter in constructor.parameters])
+
+
+def _construction(node, cls, arguments):
+    if not isinstance(node.declaration, mjast.Constructor):
+        return Call(func=cls, args=arguments, keywords=[])
+    return Call(func=Name(id="_new", ctx=Load()),
+                args=[cls, Constant(_constructor_name(node.declaration))] +
+                arguments, keywords=[])
+
+
 def object_construction(node, statement):
-    r = Call(
-        func=Name(
-            id=node.type.type.value,
-            ctx=Load(),
-        ),
-        args=[mjast_to_pyast(arg) for arg in node.arguments],
-        keywords=[],
-        starargs=None,
-        kwargs=None,
-    )
+    r = _construction(
+        node, Name(id=_identifier(node.type.type.value.split(".")[-1]),
+                   ctx=Load()),
+        [mjast_to_pyast(arg) for arg in node.arguments])
     if statement:
         r = Expr(r)
     return r
@@ -101,7 +200,7 @@ def method_call(node, statement):
     r = Call(
         func=Attribute(
             value=mjast_to_pyast(node.lhs),
-            attr=node.method.value,
+            attr=_method_name(node),
             ctx=Load(),
         ),
         args=[mjast_to_pyast(arg) for arg in node.arguments],
@@ -137,54 +236,50 @@ def cls(node, statement):
         raise ValueError("Can't be an expression!")
 
     if node.base:
-        bases = [Name(id=node.base.value, ctx=Load())]
+        bases = [Name(id=_identifier(node.base.type.value.split(".")[-1]),
+                      ctx=Load())]
     else:
         bases = []
 
-    constructor = None
-    if len(node.constructors) > 1:
-        raise ValueError("Can't handle multiple constructors!")
-    elif node.constructors:
-        constructor, = node.constructors
-        constructor_args = [mjast_to_pyast(p) for p in constructor.parameters]
-
-    if node.generics:
-        raise ValueError("Can't handle generics!")
-
     return ClassDef(
-        name=node.name.value,
+        name=_identifier(node.name.value),
         bases=bases,
         keywords=[],
         starargs=None,
         kwargs=None,
         body=[FunctionDef(
-            name="__init__",
+            name=_constructor_name(c),
             args=arguments(
-                args=[arg(arg="self", annotation=None)]+constructor_args,
+                posonlyargs=[],
+                args=function_parameters(c.function),
                 vararg=None, varargannotation=None, kwonlyargs=[],
                 kwarg=None, kwargannotation=None,
                 defaults=[], kw_defaults=[]
             ),
             body=[mjast_to_pyast(field) for field in node.fields] +
-            ([mjast_to_pyast(s, True) for s in constructor.statements]
-             if constructor and constructor.statements else [Pass()]),
+            function_body(c.function),
             decorator_list=[],
             returns=None,
-        )]+[FunctionDef(
-            name=m.name.value,
+        ) for c in node.constructors]+[FunctionDef(
+            name=_overload(m.name.value, m.signature[1]),
             args=arguments(
-                args=[] if m.static else [arg(arg="self", annotation=None)] +
-                     [mjast_to_pyast(p) for p in m.parameters],
+                posonlyargs=[],
+                args=function_parameters(m.function)
+                if m.function else
+                ([] if m.static else [arg(arg="self", annotation=None)]) +
+                [mjast_to_pyast(p) for p in m.parameters],
                 vararg=None, varargannotation=None, kwonlyargs=[],
                 kwarg=None, kwargannotation=None,
                 defaults=[], kw_defaults=[]
             ),
-            body=[mjast_to_pyast(s, True) for s in m.statements]
+            body=function_body(m.function) if m.function else
+            [mjast_to_pyast(s, True) for s in m.statements]
             if m.statements else [Pass()],
             decorator_list=[Name(id='staticmethod', ctx=Load())]
             if m.static else [],
             returns=None,
-            ) for m in node.methods],
+            ) for m in node.methods
+            if not m.specialises and not m.monomorphises],
         decorator_list=[],
     )
 
@@ -192,10 +287,15 @@ def cls(node, statement):
 _mjast_to_pyast = {
     mjast.Program: program,
     mjast.Class: cls,
+    mjast.Parameter: parameter,
     mjast.LocalVariableDeclaration: local_variable_declaration,
     mjast.Field: field,
     mjast.FieldAssignment: field_assignment,
     mjast.StringLiteral: string_literal,
+    mjast.NumberLiteral: literal,
+    mjast.DecimalLiteral: literal,
+    mjast.BooleanLiteral: literal,
+    mjast.NullLiteral: literal,
     mjast.MethodCall: method_call,
     mjast.FieldAccess: field_access,
     mjast.ObjectConstruction: object_construction,
@@ -207,13 +307,1064 @@ def mjast_to_pyast(node, statement=False):
     return _mjast_to_pyast[type(node)](node, statement)
 
 
+def _register(number, ctx=None):
+    return Name(id="r{}".format(number), ctx=ctx or Load())
+
+
+def function_parameters(function):
+    return [arg(arg="r{}".format(number), annotation=None)
+            for number in range(function.parameters)]
+
+
+def function_body(function):
+    """The statements running an IR function - just those of its block if it
+    has only one, otherwise a loop running the block whose number is in
+    'block', each block setting the one to run after it."""
+    definitions = {instruction.target: instruction
+                   for block in function.blocks
+                   for instruction in block.instructions
+                   if instruction.target is not None}
+    compiled = [[statement for instruction in block.instructions
+                 for statement in _instruction(instruction, definitions)] +
+                _terminator(block.terminator)
+                for block in function.blocks]
+    if len(compiled) == 1:
+        return compiled[0]
+    chain = None
+    for number, statements in reversed(list(enumerate(compiled))):
+        chain = If(test=Compare(left=Name(id="block", ctx=Load()),
+                                ops=[Eq()], comparators=[Constant(number)]),
+                   body=statements, orelse=[chain] if chain else [])
+    return [Assign(targets=[Name(id="block", ctx=Store())],
+                   value=Constant(0)),
+            While(test=Constant(True), body=[chain], orelse=[])]
+
+
+def _operand(number, definitions):
+    """Class names are used directly, rather than through registers."""
+    definition = definitions.get(number)
+    if definition is not None and definition.op == "class":
+        return Name(id=definition.node.name.value, ctx=Load())
+    return _register(number)
+
+
+def _printer(number, definitions):
+    """Whether the register holds System.out."""
+    definition = definitions.get(number)
+    if definition is None or definition.op != "field":
+        return False
+    source = definitions.get(definition.operands[0])
+    return (definition.node.field.value == "out" and source is not None and
+            source.op == "class" and source.node.name.value == "System")
+
+
+def _literal(node):
+    if isinstance(node, mjast.NullLiteral):
+        return Constant(None)
+    value = node.value.value
+    if isinstance(node, mjast.StringLiteral):
+        return Constant(bytes(value, "utf-8").decode("unicode_escape"))
+    elif isinstance(node, mjast.NumberLiteral):
+        return Constant(int(value))
+    elif isinstance(node, mjast.DecimalLiteral):
+        return Constant(float(value))
+    return Constant(value == "true")
+
+
+_binary = {"+": Add, "-": Sub, "*": Mult, "/": FloorDiv, "%": Mod,
+           "&": BitAnd, "|": BitOr, "^": BitXor, "<<": LShift, ">>": RShift,
+           ">>>": RShift}
+_compare = {"<": Lt, ">": Gt, "<=": LtE, ">=": GtE, "==": Eq, "!=": NotEq}
+_boolean = {"&&": And, "||": Or}
+_unary = {"!": Not, "-": USub, "+": UAdd, "~": Invert}
+_augmented = {"+=": Add, "-=": Sub, "*=": Mult, "/=": Div, "|=": BitOr,
+              "&=": BitAnd, "%=": Mod, "^=": BitXor, "<<=": LShift,
+              ">>=": RShift, ">>>=": RShift}
+_builtins = {("Integer", "toString"): "str", ("Integer", "parseInt"): "int"}
+_defaults = {"int": 0, "float": 0.0, "boolean": False}
+
+
+def _operation(node, operands):
+    operator = node.operator.value
+    if len(operands) == 1 and operator in _unary:
+        return UnaryOp(op=_unary[operator](), operand=operands[0])
+    elif operator in _binary:
+        return BinOp(left=operands[0], op=_binary[operator](),
+                     right=operands[1])
+    elif operator in _compare:
+        return Compare(left=operands[0], ops=[_compare[operator]()],
+                       comparators=[operands[1]])
+    elif operator in _boolean:
+        return BoolOp(op=_boolean[operator](), values=operands)
+    elif operator == "instanceof":
+        return Call(func=Name(id="isinstance", ctx=Load()), args=operands,
+                    keywords=[])
+    raise ValueError("Can't handle operator {!r}.".format(operator))
+
+
+def _assigned(target, operator, value):
+    if operator == "=":
+        return Assign(targets=[target], value=value)
+    return AugAssign(target=target, op=_augmented[operator](), value=value)
+
+
+def _field_target(number, definitions):
+    """The field a register was loaded from, to write back to."""
+    definition = definitions.get(number)
+    if definition is not None and definition.op == "field":
+        return Attribute(value=_operand(definition.operands[0], definitions),
+                         attr=definition.node.field.value, ctx=Store())
+    return _register(number, Store())
+
+
+def _instruction(instruction, definitions):
+    op, node = instruction.op, instruction.node
+    operands = [_operand(operand, definitions)
+                for operand in instruction.operands]
+    if op in ("class", "enter", "exit") or (
+            op == "field" and _printer(instruction.target, definitions)):
+        return []
+    elif op == "constant":
+        value = _literal(node)
+    elif op == "operation":
+        value = _operation(node, operands)
+    elif op in ("move", "copy", "cast"):
+        value = operands[0]
+    elif op == "field":
+        value = Attribute(value=operands[0], attr=node.field.value,
+                          ctx=Load())
+    elif op == "call":
+        receiver = definitions.get(instruction.operands[0])
+        if (node.method.value == "println" and
+                _printer(instruction.operands[0], definitions)):
+            function = Name(id="print", ctx=Load())
+        elif (receiver is not None and receiver.op == "class" and
+                (receiver.node.name.value, node.method.value) in _builtins):
+            function = Name(id=_builtins[receiver.node.name.value,
+                                         node.method.value], ctx=Load())
+        else:
+            function = Attribute(value=operands[0], attr=_method_name(node),
+                                 ctx=Load())
+        value = Call(func=function, args=operands[1:], keywords=[])
+        if instruction.target is None:
+            return [Expr(value)]
+    elif op == "new":
+        cls = Name(id=_identifier(node.type.type.value.split(".")[-1]),
+                   ctx=Load())
+        value = _construction(node, cls, operands)
+    elif op == "declare":
+        value = (operands[0] if operands else
+                 Constant(_defaults.get(node.type.type.value)))
+    elif op == "assign":
+        return [_assigned(_register(instruction.operands[0], Store()),
+                          node.operator.value, operands[1])]
+    elif op == "store":
+        return [_assigned(Attribute(value=operands[0], attr=node.field.value,
+                                    ctx=Store()),
+                          node.operator.value, operands[1])]
+    elif op in ("increment", "step"):
+        step = node.step if op == "step" else 1
+        return [AugAssign(
+            target=_field_target(instruction.operands[0], definitions),
+            op=Sub() if op == "increment" and node.operator.value == "--"
+            else Add(), value=Constant(step))]
+    elif op == "super":
+        if node.super_declaration is None:
+            # The base class has no constructors to run.
+            return []
+        name = (_constructor_name(node.super_declaration)
+                if isinstance(node.super_declaration, mjast.Constructor)
+                else "__init__")
+        return [Expr(Call(func=Attribute(
+            value=Call(func=Name(id="super", ctx=Load()), args=[],
+                       keywords=[]),
+            attr=name, ctx=Load()), args=operands[1:], keywords=[]))]
+    elif op == "bind":
+        return [Assign(targets=[_register(parameter, Store())], value=value)
+                for parameter, value in zip(instruction.parameters, operands)]
+    elif op == "vector":
+        # Compiled lists aren't the interpreter's, so the loop always runs.
+        value = Constant(False)
+    elif op == "fail":
+        return [Raise(exc=Name(id="Exception", ctx=Load()), cause=None)]
+    else:
+        raise ValueError("Can't handle {!r} instructions.".format(op))
+    return [Assign(targets=[_register(instruction.target, Store())],
+                   value=value)]
+
+
+def _terminator(terminator):
+    if terminator.op == "return":
+        return [Return(value=None if terminator.operand is None
+                       else _register(terminator.operand))]
+    if terminator.op == "jump":
+        value = Constant(terminator.targets[0].number)
+    else:
+        true, false = terminator.targets
+        value = IfExp(test=_register(terminator.operand),
+                      body=Constant(true.number),
+                      orelse=Constant(false.number))
+    return [Assign(targets=[Name(id="block", ctx=Store())], value=value)]
+
+
 def compile_to_pyc(program, filename):
     module = mjast_to_pyast(program)
+    module.body[:0] = parse(_runtime).body
     fix_missing_locations(module)
     #print(dump(module))
     return compile(module, filename, "exec")
 
 
+# Tiering - with the tiered engine, the interpreter has each method that has
+# run enough compiled here into a Python function, swapped in for its _run
+# (see classes.NativeMethod). Unlike the programs compiled above, these run
+# on the interpreter's own values - calls, objects and fields go through the
+# same code as the IR's handlers, so a method behaves just as it does
+# interpreted.
+#
+# Registers holding ints, floats and booleans are kept as plain Python values
+# (unboxed) where nothing else can see their variables - locals and
+# temporaries that are never passed on or aliased. Arguments stay in the
+# variables the caller shares with the method, as do fields. Arguments of
+# primitive types are assumed to be of the types declared, which is guarded
+# on entry, calls failing the guards being interpreted instead.
+
+# Operators whose results are of the same type whatever their operands are -
+# the rest take the type of their first.
+_result_kinds = dict.fromkeys(["<", ">", "<=", ">=", "==", "!=", "&&", "||",
+                               "!", "instanceof"], "boolean")
+_result_kinds.update({"/": "int", "%": "int"})
+_literal_kinds = ((mjast.NumberLiteral, "int"),
+                  (mjast.DecimalLiteral, "float"),
+                  (mjast.BooleanLiteral, "boolean"))
+# Instructions that may keep hold of the variables they are given.
+_sharing = {"call", "new", "bind", "vector"}
+
+
+def tier(program, threshold):
+    """Has the interpreter compile each method of an analysed program once
+    the calls to it and the iterations of its loops reach the threshold."""
+    for cls in program.classes:
+        for method in cls.methods:
+            method.cls = cls
+    classes.NativeMethod.threshold = threshold
+
+
+def compile_method(method):
+    """A function to run calls to a method (a NativeMethod) with in place of
+    its _run, compiled from its control flow graph - or None if it can't be
+    compiled."""
+    if not _compilable(method):
+        return None
+    function = ir.lower_method(method.declaration.cls, method.declaration)
+    ir.simplify([function])
+    ir.dead_code([function])
+    try:
+        return _define(_Tier(method, function), function.description)
+    except ValueError:
+        return None
+
+
+def compile_loop(method, loop, scope):
+    """A function running the rest of a loop of a method (a NativeMethod)
+    part way through, given the scope it runs in, compiled from its control
+    flow graph - or None if it can't be compiled. The function returns
+    whether it ran the loop, which it doesn't if its guards fail."""
+    if not _compilable(method):
+        return None
+    names, temporaries = _outside(loop)
+    addresses = list(names.values()) + [temporary.address
+                                        for temporary in temporaries]
+    types = [str(scope.display[depth][slot].type)
+             for depth, slot in addresses]
+    function = ir.lower_loop(
+        loop, "{} (line {})".format(method.description, loop.token.line),
+        list(zip(names, types)), list(zip(temporaries, types[len(names):])))
+    ir.simplify([function])
+    ir.dead_code([function])
+    # Temporaries' variables are only ever copied, so only the method sees
+    # them.
+    private = _private(method)
+    private = [number for number, name in enumerate(names)
+               if name in private]
+    private += range(len(names), len(addresses))
+    try:
+        return _define(_LoopTier(method, function, addresses, private),
+                       function.description)
+    except ValueError:
+        return None
+
+
+def _compilable(method):
+    declaration = method.declaration
+    return not (declaration.cls is None or declaration.cls.generics or
+                method.generics or method._generic)
+
+
+def _define(tier, description):
+    source = unparse(fix_missing_locations(
+        Module(body=[tier.compile()], type_ignores=[])))
+    filename = "<tiered {}>".format(description)
+    # So that tracebacks through it show its source.
+    linecache.cache[filename] = (len(source), None, source.splitlines(True),
+                                 filename)
+    namespace = dict(tier.globals)
+    exec(compile(source, filename, "exec"), namespace)
+    return namespace["run"]
+
+
+def _outside(loop):
+    """The locals (with their addresses) and the temporaries a loop uses from
+    outside of it, not counting a for loop's setup."""
+    names, declared = collections.OrderedDict(), set()
+    temporaries, stored = [], set()
+    pending = [loop.check] + list(loop.statements)
+    if isinstance(loop, mjast.ForLoop):
+        pending += [loop.iteration] + list(loop.steps)
+    while pending:
+        node = pending.pop(0)
+        if isinstance(node, mjast.LocalVariableDeclaration):
+            declared.add(node.name.value)
+        elif isinstance(node, mjast.Inlined):
+            declared.update(node.parameters)
+        elif (isinstance(node, (mjast.Variable, mjast.VariableAssignment))
+                and node.address is not None):
+            names.setdefault(node.name.value, node.address)
+        elif isinstance(node, mjast.Temporary):
+            stored.add(node)
+        elif isinstance(node, (mjast.TemporaryValue,
+                               mjast.TemporaryIncrement)):
+            if node.source not in temporaries:
+                temporaries.append(node.source)
+        elif isinstance(node, mjast.ForLoop):
+            pending += list(node.reductions) + list(node.steps)
+        elif isinstance(node, mjast.Vectorised):
+            pending += [node.start, node.stop] + list(node.names)
+        pending += sematics.children(node)
+    for name in declared:
+        names.pop(name, None)
+    return names, [temporary for temporary in temporaries
+                   if temporary not in stored]
+
+
+def _private(method):
+    """The names of the locals of a method no other code can see the
+    variables of."""
+    function = ir.lower_method(method.declaration.cls, method.declaration)
+    tier = _Tier(method, function)
+    shared = {function.registers[number].name for number in tier.boxed}
+    return {register.name for register in function.registers} - shared
+
+
+def _tier_operation(node, scope, *operands):
+    type_, value = interpreter._operations[node.operator.value](*operands)
+    if isinstance(type_, type):
+        type_ = type_(scope)
+    return interpreter.Variable(type_, value)
+
+
+def _tier_field(node, item):
+    if isinstance(item, library.LibClass):
+        return getattr(item, node.field.value)
+    return item.value.scope.value(node.field.value)
+
+
+def _tier_call(node, scope, item, arguments):
+    if isinstance(item, interpreter.Variable):
+        item = item.value
+    if not node.nonnull and item is None:
+        _null_pointer(node.lhs.token, scope.stack)
+    if node.monomorphic:
+        if isinstance(item, classes.Class):
+            method = item.implementation(node.declaration)
+            return method.run(method.cls, None, arguments, scope, call=node)
+        method = item.cls.implementation(node.declaration)
+        return method.run(method.cls, None if method.static else item,
+                          arguments, item.scope, call=node)
+    return item.run_method(node.method.value, arguments, scope, call=node)
+
+
+def _tier_declare(node, required_type, value, scope):
+    if value is not None:
+        type_, value = value
+    else:
+        type_, value = required_type, required_type.default_value
+    if not type_.is_subclass_of(required_type):
+        raise ExecutionException("Type mismatch!", node.token.source,
+                                 node.token.line, node.token.pos)
+    return interpreter.Variable(required_type, value, scope)
+
+
+def _tier_assign(node, target, value):
+    actual_type, rhs = value
+    if target.type != actual_type:
+        raise ExecutionException("Type mismatch!", node.token.source,
+                                 node.line, node.pos)
+    o = node.operator.value
+    try:
+        target.value = interpreter.assignment_operator(o, target.value, rhs)
+    except KeyError as e:
+        raise ExecutionException("Unknown operator {}!".format(o),
+                                 node.token.source, node.line,
+                                 node.pos) from e
+    return target.value
+
+
+def _tier_store(node, instance, rhs):
+    instance = instance.value
+    if node.offset is not None:
+        value = instance.fields[node.offset]
+    else:
+        value = instance.scope.value(node.field.value)
+    o = node.operator.value
+    try:
+        value.value = interpreter.assignment_operator(o, value.value, rhs)
+    except KeyError as e:
+        raise ExecutionException("Unknown operator {}!".format(o),
+                                 node.token.source, node.token.line,
+                                 node.token.pos) from e
+
+
+def _tier_vector(node, scope, start, stop, *values):
+    return vectorise.run(node, start, stop, dict(zip(
+        (name.name.value for name in node.names), values)), scope)
+
+
+def _null_pointer(token, stack):
+    raise ExecutionException("Null Pointer Exception", stack, token.source,
+                             token.line, token.pos)
+
+
+def _load(name):
+    return Name(id=name, ctx=Load())
+
+
+def _value(expression, ctx=None):
+    return Attribute(value=expression, attr="value", ctx=ctx or Load())
+
+
+def _apply(function, *args, **keywords):
+    return Call(func=function, args=list(args),
+                keywords=[keyword(arg=name, value=value)
+                          for name, value in keywords.items()])
+
+
+def _dispatch(blocks, first, last):
+    """The statements running whichever of the blocks numbered first to last
+    'block' holds the number of, found by a binary search."""
+    if first == last:
+        return blocks[first]
+    middle = (first + last + 1) // 2
+    return [If(test=Compare(left=_load("block"), ops=[Lt()],
+                            comparators=[Constant(middle)]),
+               body=_dispatch(blocks, first, middle - 1),
+               orelse=_dispatch(blocks, middle, last))]
+
+
+class _Tier:
+    """Compiles a method from its function, working out the primitive type
+    (kind) each register always holds, if any, and which registers have to be
+    kept boxed in variables."""
+
+    def __init__(self, method, function):
+        self.method = method
+        self.function = function
+        self.globals = {"Variable": interpreter.Variable,
+                        "Frame": interpreter.Frame,
+                        "evaluate": interpreter.evaluate,
+                        "deoptimised": method.deoptimised}
+        self.names = {}
+        self.definitions = collections.defaultdict(list)
+        for instruction in self.instructions():
+            if instruction.target is not None:
+                self.definitions[instruction.target].append(
+                    (instruction, None))
+            if instruction.op == "bind":
+                for position, parameter in enumerate(instruction.parameters):
+                    self.definitions[parameter].append(
+                        (instruction, position))
+        self.kinds = {}
+        for number in range(function.parameters):
+            type_ = function.registers[number].type
+            self.kinds[number] = type_ if type_ in _defaults else None
+        self.boxed = self._boxed()
+
+    def instructions(self):
+        for block in self.function.blocks:
+            yield from block.instructions
+
+    def load(self, value):
+        """A global of the compiled function holding the value."""
+        if id(value) not in self.names:
+            self.names[id(value)] = "k{}".format(len(self.names))
+            self.globals[self.names[id(value)]] = value
+        return _load(self.names[id(value)])
+
+    def helper(self, function):
+        self.globals[function.__name__] = function
+        return _load(function.__name__)
+
+    def resolve(self, type_):
+        """The class a type names, as the method's code will find it."""
+        try:
+            return self.method.scope.type(type_)
+        except (KeyError, ExecutionException) as e:
+            raise ValueError("Can't resolve {}.".format(
+                type_.type.value)) from e
+
+    def evaluate(self, node):
+        return interpreter.evaluate(node, self.method.scope)
+
+    def kind(self, number):
+        """The kind of value a register holds, or None if not always of the
+        same primitive type."""
+        if number not in self.kinds:
+            # None until worked out, should its definitions depend on it.
+            self.kinds[number] = None
+            kinds = {_kinds[instruction.op](self, instruction, position)
+                     for instruction, position in self.definitions[number]}
+            self.kinds[number] = kinds.pop() if len(kinds) == 1 else None
+        return self.kinds[number]
+
+    def literal_kind(self, instruction, position):
+        for literal, kind in _literal_kinds:
+            if isinstance(instruction.node, literal):
+                return kind
+        return None
+
+    def operation_kind(self, instruction, position):
+        operator = instruction.node.operator.value
+        if operator in _result_kinds:
+            return _result_kinds[operator]
+        return self.kind(instruction.operands[0])
+
+    def operand_kind(self, instruction, position):
+        return self.kind(instruction.operands[0])
+
+    def declared_kind(self, instruction, position):
+        type_ = self.function.registers[instruction.target].type
+        return type_ if type_ in _defaults else None
+
+    def cast_kind(self, instruction, position):
+        type_ = sematics.type_str(sematics.type_from_node(
+            instruction.node.type))
+        return type_ if type_ in _defaults else None
+
+    def bound_kind(self, instruction, position):
+        if instruction.node.receiver and not position:
+            return None
+        return self.kind(instruction.operands[position])
+
+    def no_kind(self, instruction, position):
+        return None
+
+    def boolean_kind(self, instruction, position):
+        return "boolean"
+
+    def shared_parameters(self):
+        """The parameters whose variables other code may see - all of a
+        method's, being the caller's."""
+        return range(self.function.parameters)
+
+    def _boxed(self):
+        """The registers that have to hold variables - those whose values
+        aren't always of one primitive type, and those other code might see
+        the variables of."""
+        function = self.function
+        boxed = {number for number in range(len(function.registers))
+                 if self.kind(number) is None}
+        boxed.update(self.shared_parameters())
+        aliases = set(range(function.parameters))
+        shared = set()
+        uses = collections.Counter(
+            block.terminator.operand for block in function.blocks)
+        moves = []
+        for instruction in self.instructions():
+            uses.update(instruction.operands)
+            if instruction.op in _sharing:
+                shared.update(instruction.operands)
+            if instruction.op == "bind":
+                aliases.update(instruction.parameters)
+                boxed.update(instruction.parameters)
+            elif instruction.op in ("declare", "copy", "move"):
+                aliases.add(instruction.target)
+            if instruction.op == "move":
+                moves.append(instruction)
+            elif instruction.op == "field":
+                # Its variable is the field's own.
+                boxed.add(instruction.target)
+        boxed.update(number for number in shared
+                     if number in aliases or uses[number] > 1)
+        # A move's target holds its source's variable.
+        changed = True
+        while changed:
+            changed = False
+            for move in moves:
+                source, = move.operands
+                if (move.target in boxed and source in aliases and
+                        source not in boxed):
+                    boxed.add(source)
+                    changed = True
+                elif source in boxed and move.target not in boxed:
+                    boxed.add(move.target)
+                    changed = True
+        return boxed
+
+    def value(self, number):
+        """An expression for the value a register holds."""
+        if number in self.boxed:
+            return _value(_register(number))
+        return _register(number)
+
+    def variable(self, number):
+        """An expression for a variable holding the register's value - its
+        own if boxed, otherwise a new one."""
+        if number in self.boxed:
+            return _register(number)
+        return self.box(self.kinds[number], _register(number))
+
+    def box(self, kind, value):
+        return _apply(_load("Variable"), self.load(
+            classes.primitive_types[kind](None)), value)
+
+    def set(self, number, value):
+        return [Assign(targets=[_register(number, Store())], value=value)]
+
+    def result(self, instruction, value):
+        """Sets the instruction's target to a value of its kind."""
+        target = instruction.target
+        if target in self.boxed:
+            value = self.box(self.kinds[target], value)
+        return self.set(target, value)
+
+    def boxed_result(self, instruction, variable):
+        """Sets the instruction's target to a variable's value."""
+        if instruction.target not in self.boxed:
+            variable = _value(variable)
+        return self.set(instruction.target, variable)
+
+    def guard(self, variable, number):
+        """A test that a variable doesn't hold the kind of value a register
+        is assumed to."""
+        return Compare(
+            left=Attribute(value=Attribute(value=variable, attr="type",
+                                           ctx=Load()),
+                           attr="__class__", ctx=Load()),
+            ops=[IsNot()],
+            comparators=[self.load(
+                classes.primitive_types[self.kinds[number]])])
+
+    def compile(self):
+        body = self.prologue()
+        blocks = [[statement for instruction in block.instructions
+                   for statement in _compilers[instruction.op](self,
+                                                               instruction)] +
+                  self.terminator(block.terminator) + self.limit(block)
+                  for block in self.function.blocks]
+        if len(blocks) == 1:
+            body += blocks[0]
+        else:
+            body += [Assign(targets=[Name(id="block", ctx=Store())],
+                            value=Constant(0)),
+                     While(test=Constant(True),
+                           body=_dispatch(blocks, 0, len(blocks) - 1),
+                           orelse=[])]
+        return FunctionDef(name="run", args=self.arguments(), body=body,
+                           decorator_list=[], returns=None)
+
+    def arguments(self):
+        return arguments(
+            posonlyargs=[],
+            args=[arg(arg=name, annotation=None)
+                  for name in ("cls", "instance", "args", "context")],
+            vararg=None, kwonlyargs=[arg(arg="call", annotation=None)],
+            kwarg=None, defaults=[], kw_defaults=[None])
+
+    def prologue(self):
+        """Checks the guards, then gets the arguments and enters the
+        method's frame."""
+        method, function = self.method, self.function
+        first = 0 if method.static else 1
+        guards = [self.guard(Subscript(value=_load("args"),
+                                       slice=Constant(number - first),
+                                       ctx=Load()), number)
+                  for number in range(first, function.parameters)
+                  if self.kinds[number] is not None]
+        body = []
+        if guards:
+            body.append(If(
+                test=guards[0] if len(guards) == 1 else
+                BoolOp(op=Or(), values=guards),
+                body=[Return(value=_apply(
+                    _load("deoptimised"), _load("cls"), _load("instance"),
+                    _load("args"), _load("context"), call=_load("call")))],
+                orelse=[]))
+        if not method.static:
+            body += self.set(0, Attribute(value=_load("instance"),
+                                          attr="this", ctx=Load()))
+        body.append(Assign(targets=[Name(id="scope", ctx=Store())],
+                           value=Attribute(value=_load(
+                               "cls" if method.static else "instance"),
+                               attr="scope", ctx=Load())))
+        if function.parameters > first:
+            body.append(Assign(targets=[Tuple(
+                elts=[_register(number, Store())
+                      for number in range(first, function.parameters)],
+                ctx=Store())], value=_load("args")))
+        return body + [
+            Assign(targets=[Name(id="stack", ctx=Store())],
+                   value=Attribute(value=_load("scope"), attr="stack",
+                                   ctx=Load())),
+            Expr(_apply(Attribute(value=_load("stack"), attr="enter",
+                                  ctx=Load()),
+                        _apply(_load("Frame"), Constant(method.description),
+                               _load("call"))))]
+
+    def terminator(self, terminator):
+        if terminator.op == "jump":
+            value = Constant(terminator.targets[0].number)
+        elif terminator.op == "branch":
+            true, false = terminator.targets
+            value = IfExp(test=self.value(terminator.operand),
+                          body=Constant(true.number),
+                          orelse=Constant(false.number))
+        else:
+            return self.end(terminator)
+        return [Assign(targets=[Name(id="block", ctx=Store())], value=value)]
+
+    def limit(self, block):
+        """Counts going back round a loop from the block against the run's
+        quota, if it had one when the method was compiled."""
+        quota = self.method.scope.stack.quota
+        targets = [target for target in block.terminator.targets
+                   if ir.back_edge(block, target)]
+        if quota is None or not targets:
+            return []
+        exceeded = _apply(Attribute(value=self.load(quota), attr="exceeded",
+                                    ctx=Load()),
+                          _load("stack"), self.load(ir._token(targets[0])))
+        check = BoolOp(op=And(), values=[
+            Compare(left=_load("block"), ops=[LtE()],
+                    comparators=[Constant(block.number)]),
+            _apply(Attribute(value=self.load(quota), attr="step",
+                             ctx=Load()))])
+        return [If(test=check, body=[Raise(exc=exceeded, cause=None)],
+                   orelse=[])]
+
+    def end(self, terminator):
+        """Returns from the method, leaving its frame."""
+        return [Expr(_apply(Attribute(value=_load("stack"), attr="exit",
+                                      ctx=Load()))),
+                Return(value=None if terminator.operand is None
+                       else self.variable(terminator.operand))]
+
+    # Instructions - each compiled to the statements running it.
+
+    def constant(self, instruction):
+        if self.kind(instruction.target) is None:
+            return self.set(instruction.target, _apply(
+                _load("evaluate"), self.load(instruction.node),
+                _load("scope")))
+        return self.result(instruction,
+                           Constant(self.evaluate(instruction.node).value))
+
+    def cls(self, instruction):
+        return self.set(instruction.target,
+                        self.load(self.evaluate(instruction.node)))
+
+    def operation(self, instruction):
+        node, operands = instruction.node, instruction.operands
+        if (node.operator.value != "instanceof" and
+                all(self.kind(operand) is not None for operand in operands)):
+            try:
+                return self.result(instruction, _operation(
+                    node, [self.value(operand) for operand in operands]))
+            except ValueError:
+                pass
+        return self.boxed_result(instruction, _apply(
+            self.helper(_tier_operation), self.load(node), _load("scope"),
+            *[self.variable(operand) for operand in operands]))
+
+    def move(self, instruction):
+        source, = instruction.operands
+        if instruction.target in self.boxed:
+            return self.set(instruction.target, self.variable(source))
+        return self.set(instruction.target, self.value(source))
+
+    def copy(self, instruction):
+        source, = instruction.operands
+        if instruction.target not in self.boxed:
+            return self.set(instruction.target, self.value(source))
+        if source not in self.boxed:
+            return self.set(instruction.target, self.variable(source))
+        return self.set(instruction.target, _apply(
+            _load("Variable"),
+            Attribute(value=_register(source), attr="type", ctx=Load()),
+            self.value(source)))
+
+    def field(self, instruction):
+        node = instruction.node
+        item = self.variable(instruction.operands[0])
+        if node.offset is not None:
+            return self.set(instruction.target, Subscript(
+                value=Attribute(value=_value(item), attr="fields",
+                                ctx=Load()),
+                slice=Constant(node.offset), ctx=Load()))
+        return self.set(instruction.target, _apply(
+            self.helper(_tier_field), self.load(node), item))
+
+    def call(self, instruction):
+        node = instruction.node
+        receiver, *operands = instruction.operands
+        arguments = List(elts=[self.variable(operand)
+                               for operand in operands], ctx=Load())
+        definitions = self.definitions[receiver]
+        item = (self.evaluate(definitions[0][0].node)
+                if len(definitions) == 1 and definitions[0][0].op == "class"
+                else None)
+        if node.monomorphic and isinstance(item, classes.Class):
+            # Static calls that can't be overridden are resolved now.
+            method = self.load(item.implementation(node.declaration))
+            value = _apply(Attribute(value=method, attr="run", ctx=Load()),
+                           Attribute(value=method, attr="cls", ctx=Load()),
+                           Constant(None), arguments, _load("scope"),
+                           call=self.load(node))
+        else:
+            value = _apply(self.helper(_tier_call), self.load(node),
+                           _load("scope"), self.variable(receiver), arguments)
+        if instruction.target is None:
+            return [Expr(value)]
+        return self.set(instruction.target, value)
+
+    def new(self, instruction):
+        node = instruction.node
+        cls = self.load(self.resolve(node.type))
+        return self.set(instruction.target, _apply(
+            _load("Variable"), cls, _apply(
+                Attribute(value=cls, attr="instance", ctx=Load()),
+                List(elts=[self.variable(operand)
+                           for operand in instruction.operands], ctx=Load()),
+                _load("scope"), call=self.load(node))))
+
+    def cast(self, instruction):
+        source, = instruction.operands
+        if instruction.target not in self.boxed:
+            return self.set(instruction.target, self.value(source))
+        return self.set(instruction.target, _apply(
+            _load("Variable"), self.load(self.resolve(instruction.node.type)),
+            self.value(source)))
+
+    def bind(self, instruction):
+        node = instruction.node
+        values = [self.variable(operand) for operand in instruction.operands]
+        statements = []
+        if node.receiver:
+            item = _value(values[0])
+            if not node.call.nonnull:
+                statements.append(If(
+                    test=Compare(left=item, ops=[Is()],
+                                 comparators=[Constant(None)]),
+                    body=[Expr(_apply(self.helper(_null_pointer),
+                                      self.load(node.receiver.token),
+                                      _load("stack")))],
+                    orelse=[]))
+            values[0] = Attribute(value=item, attr="this", ctx=Load())
+        for parameter, value in zip(instruction.parameters, values):
+            statements += self.set(parameter, value)
+        return statements
+
+    def enter(self, instruction):
+        node = instruction.node
+        return [Expr(_apply(
+            Attribute(value=_load("stack"), attr="enter", ctx=Load()),
+            _apply(_load("Frame"), Constant(node.description),
+                   self.load(node.call))))]
+
+    def exit(self, instruction):
+        return [Expr(_apply(Attribute(value=_load("stack"), attr="exit",
+                                      ctx=Load())))]
+
+    def declare(self, instruction):
+        node, operands = instruction.node, instruction.operands
+        kind = self.kind(instruction.target)
+        if kind is not None and not operands:
+            return self.result(instruction, Constant(
+                classes.primitive_types[kind].default_value))
+        elif kind is not None and self.kind(operands[0]) == kind:
+            return self.result(instruction, self.value(operands[0]))
+        return self.boxed_result(instruction, _apply(
+            self.helper(_tier_declare), self.load(node),
+            self.load(self.resolve(node.type)),
+            self.variable(operands[0]) if operands else Constant(None),
+            _load("scope")))
+
+    def assign(self, instruction):
+        node = instruction.node
+        target, source = instruction.operands
+        operator = node.operator.value
+        if (self.kind(target) is not None and
+                self.kind(source) == self.kind(target) and
+                (operator == "=" or operator in _augmented)):
+            value = self.value(source)
+            if operator != "=":
+                value = BinOp(left=self.value(target),
+                              op=_augmented[operator](), right=value)
+            if target in self.boxed:
+                return [Assign(targets=[_value(_register(target), Store())],
+                               value=value)]
+            return self.set(target, value)
+        value = _apply(self.helper(_tier_assign), self.load(node),
+                       self.variable(target), self.variable(source))
+        if target in self.boxed:
+            return [Expr(value)]
+        return self.set(target, value)
+
+    def store(self, instruction):
+        node = instruction.node
+        instance, source = instruction.operands
+        operator = node.operator.value
+        if node.offset is None or (operator != "=" and
+                                   operator not in _augmented):
+            return [Expr(_apply(self.helper(_tier_store), self.load(node),
+                                self.variable(instance),
+                                self.value(source)))]
+        field = _value(Subscript(
+            value=Attribute(value=_value(self.variable(instance)),
+                            attr="fields", ctx=Load()),
+            slice=Constant(node.offset), ctx=Load()), Store())
+        if operator == "=":
+            return [Assign(targets=[field], value=self.value(source))]
+        return [AugAssign(target=field, op=_augmented[operator](),
+                          value=self.value(source))]
+
+    def increment(self, instruction):
+        operator = instruction.node.operator.value
+        if operator not in ("++", "--"):
+            return []
+        return self.add(instruction.operands[0],
+                        1 if operator == "++" else -1)
+
+    def step(self, instruction):
+        return self.add(instruction.operands[0], instruction.node.step)
+
+    def add(self, number, step):
+        target = (_value(_register(number), Store()) if number in self.boxed
+                  else _register(number, Store()))
+        return [AugAssign(target=target, op=Add() if step > 0 else Sub(),
+                          value=Constant(abs(step)))]
+
+    def vector(self, instruction):
+        return self.result(instruction, _apply(
+            self.helper(_tier_vector), self.load(instruction.node),
+            _load("scope"),
+            *[self.variable(operand) for operand in instruction.operands]))
+
+    def fail(self, instruction):
+        return [Raise(exc=_load("Exception"), cause=None)]
+
+
+_kinds = {
+    "constant": _Tier.literal_kind,
+    "class": _Tier.no_kind,
+    "operation": _Tier.operation_kind,
+    "move": _Tier.operand_kind,
+    "copy": _Tier.operand_kind,
+    "field": _Tier.declared_kind,
+    "call": _Tier.no_kind,
+    "new": _Tier.no_kind,
+    "cast": _Tier.cast_kind,
+    "bind": _Tier.bound_kind,
+    "declare": _Tier.declared_kind,
+    "vector": _Tier.boolean_kind,
+}
+
+_compilers = {
+    "constant": _Tier.constant,
+    "class": _Tier.cls,
+    "operation": _Tier.operation,
+    "move": _Tier.move,
+    "copy": _Tier.copy,
+    "field": _Tier.field,
+    "call": _Tier.call,
+    "new": _Tier.new,
+    "cast": _Tier.cast,
+    "bind": _Tier.bind,
+    "enter": _Tier.enter,
+    "exit": _Tier.exit,
+    "declare": _Tier.declare,
+    "assign": _Tier.assign,
+    "store": _Tier.store,
+    "increment": _Tier.increment,
+    "step": _Tier.step,
+    "vector": _Tier.vector,
+    "fail": _Tier.fail,
+}
+
+
+class _LoopTier(_Tier):
+    """Compiles the rest of a loop from its function, its parameters being
+    the variables at the addresses given. Those of private parameters that
+    hold primitives are unpacked into plain values while it runs, and their
+    values written back when it stops."""
+
+    def __init__(self, method, function, addresses, private):
+        self.addresses = addresses
+        self.private = set(private)
+        super().__init__(method, function)
+        self.globals["Return"] = classes.Return
+        self.unboxed = [number for number in range(function.parameters)
+                        if number not in self.boxed]
+
+    def shared_parameters(self):
+        return [number for number in range(self.function.parameters)
+                if number not in self.private]
+
+    def arguments(self):
+        return arguments(posonlyargs=[], args=[arg(arg="scope",
+                                                   annotation=None)],
+                         vararg=None, kwonlyargs=[], kwarg=None, defaults=[],
+                         kw_defaults=[])
+
+    def prologue(self):
+        """Gets the variables from the scope and checks the guards, then
+        unpacks the unboxed ones."""
+        body = [Assign(targets=[Name(id=name, ctx=Store())],
+                       value=Attribute(value=_load("scope"), attr=name,
+                                       ctx=Load()))
+                for name in ("stack", "display")]
+        guards = []
+        for number, (depth, slot) in enumerate(self.addresses):
+            name = _register(number) if number in self.boxed else _load(
+                "v{}".format(number))
+            body.append(Assign(
+                targets=[Name(id=name.id, ctx=Store())],
+                value=Subscript(value=Subscript(
+                    value=_load("display"), slice=Constant(depth),
+                    ctx=Load()), slice=Constant(slot), ctx=Load())))
+            if self.kinds[number] is not None:
+                guards.append(self.guard(name, number))
+        if guards:
+            body.append(If(test=guards[0] if len(guards) == 1 else
+                           BoolOp(op=Or(), values=guards),
+                           body=[Return(value=Constant(False))], orelse=[]))
+        for number in self.unboxed:
+            body += self.set(number, _value(_load("v{}".format(number))))
+        return body
+
+    def end(self, terminator):
+        """Writes back the unboxed variables, then carries on after the loop,
+        or returns from the method."""
+        body = [Assign(targets=[_value(_load("v{}".format(number)), Store())],
+                       value=_register(number))
+                for number in self.unboxed]
+        if terminator.op == "leave":
+            return body + [Return(value=Constant(True))]
+        return body + [Raise(exc=_apply(
+            _load("Return"), *([] if terminator.operand is None
+                               else [self.variable(terminator.operand)])),
+            cause=None)]
+
+
 if __name__ == "__main__":
     import argparse
 
@@ -221,18 +1372,29 @@ if __name__ == "__main__":
         description='Compile Middleweight Java Code.')
     args.add_argument('file', metavar='FILE', type=argparse.FileType('r'),
                       default=sys.stdin, help='The source code to compile.')
+    args.add_argument('-O', dest='level', type=int, choices=range(4),
+                      default=optimiser.default_level,
+                      help='The optimisation level (default: {}).'.format(
+                          optimiser.default_level))
 
     args = args.parse_args()
 
     program = parser.parse_handling_errors(args.file)
     sematics.analyse_handling_errors(program)
+    manager = optimiser.PassManager(args.level, lower=True)
+    manager.run(program)
+    ir.install(manager.functions)
+    ir.install([ir.lower_constructor(cls, constructor)
+                for cls in program.classes
+                for constructor in cls.constructors])
     name, _ = os.path.splitext(os.path.split(args.file.name)[1])
     if program:
         codeobject = compile_to_pyc(program, args.file.name)
         with open(name.lower() + ".pyc", 'wb') as fc:
-            fc.write(py_compile.MAGIC)
+            fc.write(importlib.util.MAGIC_NUMBER)
+            fc.write(b'\0\0\0\0')
+            fc.write(int(time.time()).to_bytes(4, "little"))
             fc.write(b'\0\0\0\0')
-            py_compile.wr_long(fc, int(time.time()))
             marshal.dump(codeobject, fc)
     else:
         sys.exit(1)
@@ -114,7 +114,7 @@ def tree_from_state(scope):
     seen = set()
     while scope is not None:
         tree.see(variables)
-        for name, value in scope.variables.items():
+        for name, value in scope.named():
             if not name in seen:
                 seen.add(name)
                 id_ = tree.insert(variables, "end", text=name,
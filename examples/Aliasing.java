@@ -0,0 +1,52 @@
+class Counter {
+
+    Counter() {
+    }
+
+    void skip(int step) {
+    }
+
+}
+
+class Skipper extends Counter {
+
+    Skipper() {
+        super();
+    }
+
+    void skip(int step) {
+        step += 2;
+    }
+
+}
+
+class Aliasing {
+
+    Aliasing() {
+    }
+
+    static void bump(int x) {
+        x += 5;
+    }
+
+    static void twice(int x) {
+        Aliasing.bump(x);
+    }
+
+    static Counter make() {
+        return new Skipper();
+    }
+
+    static void main() {
+        for (int i = 0; i < 30; i++) {
+            System.out.println(Integer.toString(i * 3));
+            Aliasing.twice(i);
+        }
+        Counter counter = Aliasing.make();
+        for (int j = 0; j < 10; j++) {
+            System.out.println(Integer.toString(j * 2));
+            counter.skip(j);
+        }
+    }
+
+}
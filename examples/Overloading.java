@@ -0,0 +1,114 @@
+class Animal {
+
+    Animal() {
+    }
+
+}
+
+class Dog extends Animal {
+
+    Dog() {
+    }
+
+}
+
+class ObjectFirst {
+
+    String label;
+
+    ObjectFirst(Object o) {
+        this.label = "object";
+    }
+
+    ObjectFirst(String s) {
+        this.label = "string";
+    }
+
+    static String foo(Object o) {
+        return "object";
+    }
+
+    static String foo(String s) {
+        return "string";
+    }
+
+    String bar(Animal a) {
+        return "animal";
+    }
+
+    String bar(Dog d) {
+        return "dog";
+    }
+
+}
+
+class StringFirst {
+
+    String label;
+
+    StringFirst(String s) {
+        this.label = "string";
+    }
+
+    StringFirst(Object o) {
+        this.label = "object";
+    }
+
+    static String foo(String s) {
+        return "string";
+    }
+
+    static String foo(Object o) {
+        return "object";
+    }
+
+    String bar(Dog d) {
+        return "dog";
+    }
+
+    String bar(Animal a) {
+        return "animal";
+    }
+
+}
+
+class Inherited extends ObjectFirst {
+
+    Inherited() {
+        super("x");
+    }
+
+    String bar(Animal a) {
+        return "inherited animal";
+    }
+
+}
+
+class Overloading {
+
+    Overloading() {
+    }
+
+    static void main() {
+        Dog dog = new Dog();
+        Animal animal = new Animal();
+        System.out.println(ObjectFirst.foo("x"));
+        System.out.println(ObjectFirst.foo(dog));
+        System.out.println(StringFirst.foo("x"));
+        System.out.println(StringFirst.foo(dog));
+        System.out.println(new ObjectFirst("x").label);
+        System.out.println(new ObjectFirst(dog).label);
+        System.out.println(new StringFirst("x").label);
+        System.out.println(new StringFirst(dog).label);
+        ObjectFirst first = new ObjectFirst(dog);
+        StringFirst second = new StringFirst(dog);
+        System.out.println(first.bar(dog));
+        System.out.println(first.bar(animal));
+        System.out.println(second.bar(dog));
+        System.out.println(second.bar(animal));
+        Inherited inherited = new Inherited();
+        System.out.println(inherited.bar(dog));
+        System.out.println(inherited.bar(animal));
+    }
+
+}
@@ -0,0 +1,28 @@
+class Specialisation {
+
+    Specialisation() {
+    }
+
+    static String describe(String unit, int count, boolean plural) {
+        String text = Integer.toString(count) + " " + unit;
+        if (plural) {
+            text = text + "s";
+        }
+        return text;
+    }
+
+    static int scale(int value, int factor) {
+        return value * factor;
+    }
+
+    static void main() {
+        System.out.println(Specialisation.describe("apple", 1, false));
+        System.out.println(Specialisation.describe("pear", 3, true));
+        System.out.println(Specialisation.describe("pear", 5, true));
+        for (int i = 0; i < 3; i++) {
+            System.out.println(Specialisation.describe("plum", i, i != 1));
+            System.out.println(Integer.toString(Specialisation.scale(i, 4)));
+        }
+    }
+
+}
@@ -171,17 +171,22 @@ class InterpreterException(Exception, metaclass=ABCMeta):
     def __str__(self):
         return self.description
 
-    def print_traceback(self):
+    def print_traceback(self, file=None):
         print("Traceback (most recent call last):".format(
-              self.source, self.line, self.pos))
-        print(self.stack)
+              self.source, self.line, self.pos), file=file)
+        print(self.stack, file=file)
         indent = "    "
         with open(self.source) as source:
             for line_no, text in enumerate(source, 1):
                 if line_no == self.line:
-                    print(indent + text.strip())
-        print(self.description)
+                    print(indent + text.strip(), file=file)
+        print(self.description, file=file)
 
 
 class ExecutionException(InterpreterException):
     _type = "Execution"
+
+
+class QuotaExceeded(ExecutionException):
+    """A run going over one of the limits it was given - its steps, its heap
+    or its time."""
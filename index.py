@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""A persistent symbol and cross-reference index over MWJ source files, so
+questions like "who calls X" don't need the program re-analysed."""
+
+import hashlib
+import os
+import sqlite3
+import sys
+
+import exceptions
+import library
+import parser
+import sematics
+
+default_index = ".mwjindex"
+
+_schema = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    digest TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS symbols (
+    symbol TEXT,
+    kind TEXT,
+    path TEXT,
+    line INTEGER,
+    pos INTEGER,
+    length INTEGER,
+    context TEXT,
+    PRIMARY KEY (symbol, kind, path, line, pos)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS symbols_by_context ON symbols (context, kind);
+CREATE INDEX IF NOT EXISTS symbols_by_path ON symbols (path);
+"""
+
+definitions = ("class", "field", "method", "constructor")
+references = ("call", "new", "read", "write", "type", "extends")
+
+
+class Index:
+    """An on-disk index. Every lookup is a B-tree search on one of the
+    indexed columns, so is logarithmic in the size of the index."""
+
+    def __init__(self, path=default_index):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_schema)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, paths):
+        """Re-indexes any of the given files that have changed since they were
+        last indexed, and drops any indexed files that no longer exist.
+        Returns the paths that were re-indexed."""
+        updated = []
+        for path in paths:
+            path = os.path.abspath(path)
+            with open(path, "rb") as source:
+                digest = hashlib.sha1(source.read()).hexdigest()
+            known = self.db.execute("SELECT digest FROM files WHERE path = ?",
+                                    (path, )).fetchone()
+            if known and known[0] == digest:
+                continue
+            records = self._analyse(path)
+            with self.db:
+                self._forget(path)
+                if records is not None:
+                    self.db.executemany(
+                        "INSERT OR IGNORE INTO symbols VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?)", records)
+                    self.db.execute("INSERT INTO files VALUES (?, ?)",
+                                    (path, digest))
+            updated.append(path)
+        for path, in self.db.execute("SELECT path FROM files").fetchall():
+            if not os.path.exists(path):
+                with self.db:
+                    self._forget(path)
+        return updated
+
+    def _forget(self, path):
+        self.db.execute("DELETE FROM symbols WHERE path = ?", (path, ))
+        self.db.execute("DELETE FROM files WHERE path = ?", (path, ))
+
+    @staticmethod
+    def _analyse(path):
+        try:
+            with open(path) as source:
+                program = parser.parse(source)
+            sematics.analyse(program, main=False)
+        except (exceptions.ParsingException,
+                exceptions.AnalyserException) as e:
+            e.print_error()
+            return None
+        return [(symbol, kind, path, token.line, token.pos, token.length,
+                 context)
+                for symbol, kind, token, context in sematics.symbols(program)]
+
+    def lookup(self, symbol, kinds):
+        """Records for the given symbol, of the given kinds."""
+        return self.db.execute(
+            "SELECT symbol, kind, path, line, pos, length, context "
+            "FROM symbols WHERE symbol = ? AND kind IN ({}) "
+            "ORDER BY path, line, pos".format(", ".join("?" * len(kinds))),
+            (symbol, ) + tuple(kinds)).fetchall()
+
+    def within(self, context, kinds):
+        """Records for references made from within the given definition."""
+        return self.db.execute(
+            "SELECT symbol, kind, path, line, pos, length, context "
+            "FROM symbols WHERE context = ? AND kind IN ({}) "
+            "ORDER BY path, line, pos".format(", ".join("?" * len(kinds))),
+            (context, ) + tuple(kinds)).fetchall()
+
+    def subclasses(self, cls, transitive=False):
+        """Records for the classes extending the given one. Classes are
+        recorded as extending the standard library's by their full names, but
+        those can be asked about without their package too, as in 'Object'
+        (which classes with no 'extends' are recorded as extending)."""
+        found = []
+        pending = [cls]
+        qualified = _library_names().get(cls)
+        if qualified is not None:
+            pending.append(qualified)
+        seen = set(pending)
+        while pending:
+            for record in self.lookup(pending.pop(), ("extends", )):
+                sub = record[6]
+                if sub not in seen:
+                    seen.add(sub)
+                    found.append(record)
+                    if transitive:
+                        pending.append(sub)
+        return found
+
+
+def _library_names():
+    """The full names of the standard library's classes, by their names."""
+    names = {}
+    pending = list(library.load_standard_library().values())
+    while pending:
+        for name, cls in pending.pop().children.items():
+            if getattr(cls, "children", None):
+                # A package.
+                pending.append(cls)
+            else:
+                names[name] = "{}.{}".format(cls.parent, name)
+    return names
+
+
+def _format(record, show):
+    symbol, kind, path, line, pos, length, context = record
+    return "{}:{}:{}-{}: {} {}".format(path, line, pos, pos + length, kind,
+                                       symbol if show == "symbol" else context)
+
+
+_queries = {
+    "definition": lambda index, args: (index.lookup(args.symbol, definitions),
+                                       "symbol"),
+    "references": lambda index, args: (index.lookup(args.symbol, references),
+                                       "context"),
+    "callers": lambda index, args: (index.lookup(args.symbol, ("call", "new")),
+                                    "context"),
+    "callees": lambda index, args: (index.within(args.symbol, ("call", "new")),
+                                    "symbol"),
+    "reads": lambda index, args: (index.lookup(args.symbol, ("read", )),
+                                  "context"),
+    "writes": lambda index, args: (index.lookup(args.symbol, ("write", )),
+                                   "context"),
+    "subclasses": lambda index, args: (index.subclasses(args.symbol,
+                                                        args.transitive),
+                                       "context"),
+}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    args = argparse.ArgumentParser(
+        description='Index Middleweight Java code and query the index.')
+    args.add_argument('-i', '--index', default=default_index,
+                      help='The index file (default: {}).'.format(
+                          default_index))
+    commands = args.add_subparsers(dest='command')
+    update = commands.add_parser(
+        'update', help='Index the given files, skipping unchanged ones.')
+    update.add_argument('files', metavar='FILE', nargs='+',
+                        help='The source code to index.')
+    for name in sorted(_queries):
+        query = commands.add_parser(name, help='Look up {} of a '
+                                               'symbol.'.format(name))
+        query.add_argument('symbol', metavar='SYMBOL',
+                           help='A class, or a Class.member name.')
+        if name == "subclasses":
+            query.add_argument('-t', '--transitive', action='store_true',
+                               help='Include indirect subclasses.')
+
+    args = args.parse_args()
+    if not args.command:
+        sys.exit("A command is required.")
+
+    index = Index(args.index)
+    if args.command == "update":
+        for path in index.update(args.files):
+            print("Indexed {!r}.".format(path))
+    else:
+        records, show = _queries[args.command](index, args)
+        for record in records:
+            print(_format(record, show))
+        if not records:
+            index.close()
+            sys.exit(1)
+    index.close()
@@ -3,16 +3,26 @@
 
 """The interpreter."""
 
+import gc
+import operator
 import sys
+import time
+import weakref
+from collections import OrderedDict
+from itertools import groupby
 
 from parser import parse_handling_errors
 import mjast as nodes
 import sematics
 from tokenizer import Token
-from exceptions import (ExecutionException,
-                        InterpreterException, TypeException)
+from exceptions import (ExecutionException, InterpreterException,
+                        QuotaExceeded, TypeException)
 import library
 import classes
+import ir
+import bytecode
+import optimiser
+import vectorise
 
 
 class Variable:
@@ -108,9 +118,12 @@ class CacheTree:
 
 
 class Frame:
-    def __init__(self, description, call):
+    def __init__(self, description, call, method=None):
         self.description = description
         self.call = call
+        # The method whose body is running in the frame, if it counts the
+        # iterations of its loops (for tiering).
+        self.method = method
 
     def __repr__(self):
         target = self.call.token.line
@@ -128,16 +141,141 @@ class Frame:
             return "  File {}, in {}.".format(file, self.description)
 
 
+class Memo:
+    """A bounded least-recently-used store of the results of pure methods,
+    keyed on the method and its argument values."""
+
+    def __init__(self, size):
+        self.size = size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        try:
+            result = self.results[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.results.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        self.results[key] = result
+        if len(self.results) > self.size:
+            self.results.popitem(last=False)
+            self.evictions += 1
+
+    def __repr__(self):
+        return ("Memoisation: {} hits, {} misses, {} evictions "
+                "({} of {} entries used).".format(
+                    self.hits, self.misses, self.evictions,
+                    len(self.results), self.size))
+
+
+class Quota:
+    """Limits on a run - the steps it takes (calls and loop iterations), the
+    cells of heap (fields of objects and items of lists) it holds at once and
+    how many seconds it runs for - each None if unlimited. Engines count each
+    step, and the clock is only read every interval steps."""
+
+    interval = 1000
+
+    def __init__(self, steps=None, heap=None, seconds=None):
+        self.steps = steps
+        self.heap = heap
+        self.deadline = (time.monotonic() + seconds
+                         if seconds is not None else None)
+        self.taken = 0
+        self.live = 0
+        self.reason = None
+        self.next = 0
+
+    def step(self):
+        """Takes a step, returning whether the run is over its limits."""
+        self.taken += 1
+        return self.taken >= self.next and self.check()
+
+    def check(self):
+        if self.steps is not None and self.taken > self.steps:
+            self.reason = "Step Quota Exceeded"
+            return True
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.reason = "Deadline Exceeded"
+            return True
+        self.next = self.taken + self.interval
+        if self.steps is not None:
+            self.next = min(self.next, self.steps + 1)
+        return False
+
+    def charge(self, cells, stack, token=None):
+        """Takes cells of the heap, collecting garbage before giving up if
+        that would be more than the run can hold."""
+        if self.live + cells > self.heap:
+            # Objects refer to themselves (through this), so they are only
+            # freed by the collector.
+            gc.collect()
+            if self.live + cells > self.heap:
+                self.reason = "Heap Quota Exceeded"
+                raise self.exceeded(stack, token)
+        self.live += cells
+
+    def allocate(self, owner, cells, stack, token=None):
+        """Takes cells of the heap until owner is freed."""
+        self.charge(cells, stack, token)
+        weakref.finalize(owner, self.free, cells).atexit = False
+
+    def free(self, cells):
+        self.live -= cells
+
+    def exceeded(self, stack, token=None):
+        """The exception for the limit the run went over, at the token (or
+        the call of the current frame)."""
+        if token is None:
+            token = stack.current.call.token
+        return QuotaExceeded(self.reason, stack, token.source, token.line,
+                             token.pos)
+
+
+# Deep enough for any sensible recursion, while still catching runaway
+# recursion before it uses up memory.
+default_depth = 250000
+
+# Enough that code run only a few times is never compiled, while a method
+# called in a loop of any length soon is.
+default_threshold = 100
+
+
 class Stack:
-    def __init__(self):
+    def __init__(self, memo=None, depth=None, quicken=True, quota=None):
         self.stack = []
+        self.memo = memo
+        # The limits on the run, if any.
+        self.quota = quota
+        # The most frames there can be, if limited.
+        self.depth = depth
+        # Off when evaluating outside of a run (as when folding constants),
+        # so the nodes are left as they are for the engines compiling them.
+        self.quicken = quicken
+        # Where System.out prints to, standard output if None.
+        self.output = None
 
     def enter(self, frame):
+        if len(self.stack) == self.depth:
+            raise self.overflow(frame.call.token)
+        if self.quota is not None and self.quota.step():
+            raise self.quota.exceeded(self, frame.call.token)
         self.stack.append(frame)
 
     def exit(self):
         return self.stack.pop()
 
+    def overflow(self, token):
+        return ExecutionException("Stack Overflow", self, token.source,
+                                  token.line, token.pos)
+
     @property
     def current(self):
         return self.stack[-1]
@@ -150,19 +288,46 @@ class Stack:
         yield from self.stack
 
     def __repr__(self):
-        return "\n".join(repr(frame) for frame in self.stack[1:])
+        # Like Python, a frame repeated (as by deep recursion) is only shown
+        # a few times. Each frame shows the line calling it, so all but the
+        # last of a run of frames called from the same line show the line
+        # they called on too.
+        lines = []
+        for _, frames in groupby(self.stack[1:], key=lambda frame: (
+                frame.call.token.source, frame.call.token.line,
+                frame.description)):
+            frames = list(frames)
+            if len(frames) > 4:
+                lines.extend(repr(frame) for frame in frames[:3])
+                line, _, header = repr(frames[-1]).rpartition("\n")
+                lines.extend([line, "  [Previous frame repeated {} more "
+                                    "times]".format(len(frames) - 4), header])
+            else:
+                lines.extend(repr(frame) for frame in frames)
+        return "\n".join(lines)
 
 
 class Scope:
     def __init__(self, description, outer, types=None, variables=None,
-                 *, stack=None):
+                 *, stack=None, layout=(), frame=False):
         self.description = description
         self.outer = outer
         self.stack = stack if stack is not None else outer.stack
         self.types = types if types is not None else {}
         self.top = self.outer.top if self.outer else self
         self.variables = variables if variables is not None else {}
-        self.cache = CacheTree()
+        if outer is not None and not self.types:
+            # With no types of its own, it resolves them as the scope it is
+            # in does, so shares its cache rather than starting a cold one.
+            self.cache = outer.cache
+        else:
+            self.cache = CacheTree()
+        self.layout = layout
+        self.slots = [None] * len(layout)
+        if frame or outer is None:
+            self.display = [self.slots]
+        else:
+            self.display = outer.display + [self.slots]
 
     def generic(self, generic):
         return self.types[generic]
@@ -218,36 +383,47 @@ class Scope:
             return self.variables[target]
         else:
             try:
-                return self.type(target, static=True)(self, static=True)
+                return self.type(target, static=True).static_instance(self)
             except KeyError:
                 if not self.outer:
                     raise KeyError("No such variable {!r}.".format(target))
                 else:
                     return self.outer.value(target)
 
+    def named(self):
+        """The variables held in this scope, with their names."""
+        for name, value in zip(self.layout, self.slots):
+            if value is not None:
+                yield name, value
+        yield from self.variables.items()
+
     def __repr__(self):
         return "[Scope: {}]".format(self.description)
 
 
 def string_literal(expression, scope):
-    return Variable(scope.type("java.lang.String"),
-                    bytes(expression.value.value, "utf-8").decode(
-                        "unicode_escape"))
+    return _quicken_literal(expression, scope,
+                            scope.type("java.lang.String"),
+                            bytes(expression.value.value, "utf-8").decode(
+                                "unicode_escape"))
 
 
 def number_literal(expression, scope):
-    return Variable(classes.primitive_types["int"](scope),
-                    int(expression.value.value))
+    return _quicken_literal(expression, scope,
+                            classes.primitive_types["int"](scope),
+                            int(expression.value.value))
 
 
 def decimal_literal(expression, scope):
-    return Variable(classes.primitive_types["float"](scope),
-                    float(expression.value.value))
+    return _quicken_literal(expression, scope,
+                            classes.primitive_types["float"](scope),
+                            float(expression.value.value))
 
 
 def boolean_literal(expression, scope):
-    return Variable(classes.primitive_types["boolean"](scope),
-                    expression.value.value == "true")
+    return _quicken_literal(expression, scope,
+                            classes.primitive_types["boolean"](scope),
+                            expression.value.value == "true")
 
 
 def null_literal(expression, scope):
@@ -255,8 +431,12 @@ def null_literal(expression, scope):
 
 
 def variable(expression, scope):
+    if expression.address is not None:
+        depth, slot = expression.address
+        return scope.display[depth][slot]
     try:
-        return scope.value(expression.name.value)
+        return scope.type(expression.name.value,
+                          static=True).static_instance(scope)
     except KeyError:
         token = expression.token
         raise ExecutionException("Variable {!r} does not exist in this "
@@ -334,12 +514,120 @@ _operations = {
 def operation(expression, scope):
     args = [evaluate(getattr(expression, part), scope)
             for part in ("lhs", "rhs") if hasattr(expression, part)]
+    result = _operate(expression, args, scope)
+    # Evaluating the operands may have quickened it already, if recursive.
+    if (scope.stack.quicken and not expression.generic and
+            type(expression) in _quickened):
+        _quicken_operation(expression, args, result)
+    return result
+
+
+def _operate(expression, args, scope):
     type_, value = _operations[expression.operator.value](*args)
     if isinstance(type_, type):
         type_ = type_(scope)
     return Variable(type_, value)
 
 
+# Quickening - on its first evaluation, a literal or an operation on
+# primitives or Strings rewrites itself (by changing its class) into one
+# evaluated by a handler specialised for it: literals keep their values, and
+# operations the Python operator and result type for the types of operands
+# they saw, guarded so they go back to being generic for good if they see any
+# others.
+
+_quickened = {cls: type(cls.__name__, (cls, ), {})
+              for cls in (nodes.StringLiteral, nodes.NumberLiteral,
+                          nodes.DecimalLiteral, nodes.BooleanLiteral,
+                          nodes.InfixOperation, nodes.PrefixOperation)}
+
+_quick_infix = {
+    ">": operator.gt,
+    "<": operator.lt,
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.floordiv,
+    "%": operator.mod,
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "&&": lambda lhs, rhs: lhs and rhs,
+    "&": operator.and_,
+    "||": lambda lhs, rhs: lhs or rhs,
+    "|": operator.or_,
+    "^": operator.xor,
+    "<<": operator.lshift,
+    ">>": operator.rshift,
+    ">>>": operator.rshift,
+}
+
+_quick_prefix = {
+    "+": lambda rhs: rhs,
+    "-": operator.neg,
+    "!": operator.not_,
+    "~": operator.invert,
+}
+
+
+def _quickenable(type_):
+    return (isinstance(type_, classes.Type) or
+            type_.full_name == "java.lang.String")
+
+
+def _quicken_literal(expression, scope, type_, value):
+    if not scope.stack.quicken:
+        return Variable(type_, value)
+    expression.constant = type_, value
+    expression.__class__ = _quickened[type(expression)]
+    return Variable(type_, value)
+
+
+def _quicken_operation(expression, args, result):
+    table = (_quick_infix if isinstance(expression, nodes.InfixOperation)
+             else _quick_prefix if isinstance(expression,
+                                              nodes.PrefixOperation)
+             else {})
+    apply = table.get(expression.operator.value)
+    if apply is None or not all(isinstance(arg.type, classes.Class) and
+                                _quickenable(arg.type) for arg in args):
+        expression.generic = True
+        return
+    expression.apply = apply
+    expression.operand_types = [type(arg.type) for arg in args]
+    expression.result = result.type
+    expression.__class__ = _quickened[type(expression)]
+
+
+def _deoptimise(expression, args, scope):
+    expression.__class__ = type(expression).__bases__[0]
+    expression.generic = True
+    return _operate(expression, args, scope)
+
+
+def quickened_literal(expression, scope):
+    type_, value = expression.constant
+    return Variable(type_, value)
+
+
+def quickened_infix(expression, scope):
+    lhs = evaluate(expression.lhs, scope)
+    rhs = evaluate(expression.rhs, scope)
+    lhs_type, rhs_type = expression.operand_types
+    if type(lhs.type) is not lhs_type or type(rhs.type) is not rhs_type:
+        return _deoptimise(expression, [lhs, rhs], scope)
+    return Variable(expression.result, expression.apply(lhs.value,
+                                                        rhs.value))
+
+
+def quickened_prefix(expression, scope):
+    rhs = evaluate(expression.rhs, scope)
+    if type(rhs.type) is not expression.operand_types[0]:
+        return _deoptimise(expression, [rhs], scope)
+    return Variable(expression.result, expression.apply(rhs.value))
+
+
 def object_construction(expression, scope):
     cls = scope.type(expression.type)
     args = [evaluate(arg, scope) for arg in expression.arguments]
@@ -348,6 +636,8 @@ def object_construction(expression, scope):
 
 def field_access(expression, scope):
     item = evaluate(expression.lhs, scope)
+    if expression.offset is not None:
+        return item.value.fields[expression.offset]
     name = expression.field.value
     if isinstance(item, library.LibClass):
         return getattr(item, name)
@@ -361,14 +651,66 @@ def method_call(statement, scope):
                  for argument in statement.arguments]
     if isinstance(item, Variable):
         item = item.value
-    if item is None:
+    if not statement.nonnull and item is None:
         token = statement.lhs.token
         raise ExecutionException("Null Pointer Exception", scope.stack,
                                  token.source, token.line, token.pos)
+    if statement.monomorphic:
+        if isinstance(item, classes.Class):
+            method = item.implementation(statement.declaration)
+            return method.run(method.cls, None, arguments, scope,
+                              call=statement)
+        method = item.cls.implementation(statement.declaration)
+        return method.run(method.cls, None if method.static else item,
+                          arguments, item.scope, call=statement)
     return item.run_method(statement.method.value, arguments, scope,
                            call=statement)
 
 
+def inlined(expression, scope):
+    if expression.receiver:
+        item = evaluate(expression.receiver, scope).value
+    arguments = [evaluate(argument, scope)
+                 for argument in expression.arguments]
+    depth, slot = expression.address
+    slots = scope.display[depth]
+    if expression.receiver:
+        if not expression.call.nonnull and item is None:
+            token = expression.receiver.token
+            raise ExecutionException("Null Pointer Exception", scope.stack,
+                                     token.source, token.line, token.pos)
+        slots[slot] = item.this
+        slot += 1
+    slots[slot:slot + len(arguments)] = arguments
+    # Loops in its body count towards the method it is inlined into.
+    scope.stack.enter(Frame(expression.description, expression.call,
+                            scope.stack.current.method))
+    if expression.value:
+        value = evaluate(expression.value, scope)
+    else:
+        value = execute(expression.statements, scope)
+    scope.stack.exit()
+    return value
+
+
+def temporary(expression, scope):
+    value = evaluate(expression.expression, scope)
+    depth, slot = expression.address
+    scope.display[depth][slot] = Variable(value.type, value.value)
+    return value
+
+
+def temporary_value(expression, scope):
+    depth, slot = expression.source.address
+    value = scope.display[depth][slot]
+    return Variable(value.type, value.value)
+
+
+def temporary_increment(statement, scope):
+    depth, slot = statement.source.address
+    scope.display[depth][slot].value += statement.step
+
+
 def cast(expression, scope):
     type_ = scope.type(expression.type)
     target = evaluate(expression.target, scope)
@@ -393,8 +735,17 @@ _evaluate = {
     nodes.ObjectConstruction: object_construction,
     nodes.FieldAccess: field_access,
     nodes.MethodCall: method_call,
+    nodes.Inlined: inlined,
+    nodes.Temporary: temporary,
+    nodes.TemporaryValue: temporary_value,
     nodes.Cast: cast,
     nodes.OperationGroup: operation_group,
+    _quickened[nodes.StringLiteral]: quickened_literal,
+    _quickened[nodes.NumberLiteral]: quickened_literal,
+    _quickened[nodes.DecimalLiteral]: quickened_literal,
+    _quickened[nodes.BooleanLiteral]: quickened_literal,
+    _quickened[nodes.InfixOperation]: quickened_infix,
+    _quickened[nodes.PrefixOperation]: quickened_prefix,
 }
 
 
@@ -414,29 +765,90 @@ def local_variable(statement, scope):
         raise ExecutionException("Type mismatch!", statement.token.source,
                                  statement.token.line, statement.token.pos)
     else:
-        scope.variables[statement.name.value] = Variable(required_type,
-                                                         value, scope)
+        scope.slots[statement.slot] = Variable(required_type, value, scope)
 
 
 def while_loop(statement, scope):
-    scope = Scope("While Loop (Line {})".format(statement.token.line),
-                  scope)
-    while evaluate(statement.check, scope).value:
-        execute(statement.statements, scope)
+    if statement.layout is not None:
+        scope = Scope("While Loop (Line {})".format(statement.token.line),
+                      scope, layout=statement.layout)
+    _iterate(statement, statement.statements, scope)
 
 
 def for_loop(statement, scope):
-    scope = Scope("For Loop (Line {})".format(statement.token.line),
-                  scope)
+    if statement.layout is not None:
+        scope = Scope("For Loop (Line {})".format(statement.token.line),
+                      scope, layout=statement.layout)
     execute([statement.setup], scope)
-    statements = statement.statements + [statement.iteration]
-    while evaluate(statement.check, scope).value:
-        execute(statements, scope)
+    execute(statement.reductions, scope)
+    if statement.counted is not None:
+        _count(statement, statement.statements + list(statement.steps),
+               scope)
+        return
+    statements = (statement.statements + [statement.iteration] +
+                  list(statement.steps))
+    _iterate(statement, statements, scope)
+
+
+def _count(statement, statements, scope):
+    """Runs a loop analysis found counted, keeping its counter as a Python
+    int (put in the counter's variable each iteration for the body to see)
+    compared against the bound, evaluated just once, rather than evaluating
+    the check and iteration each time round."""
+    check = statement.check
+    depth, slot = check.lhs.address
+    counter = scope.display[depth][slot]
+    bound = evaluate(check.rhs, scope).value
+    holds, step = _quick_infix[check.operator.value], statement.counted
+    method = scope.stack.current.method
+    hot = method.hot(statement) if method is not None else None
+    if hot == 0 and method.osr(statement, scope):
+        return
+    quota = scope.stack.quota
+    count = counter.value
+    back_edges = 0
+    try:
+        while holds(count, bound):
+            execute(statements, scope)
+            count += step
+            counter.value = count
+            back_edges += 1
+            if quota is not None and quota.step():
+                raise quota.exceeded(scope.stack, statement.token)
+            if back_edges == hot and method.osr(statement, scope):
+                break
+    finally:
+        if method is not None:
+            method.back_edges += back_edges
+
+
+def _iterate(statement, statements, scope):
+    """Runs a loop's statements while its check holds, counting the back
+    edges taken against the method running it for tiering, and carrying on
+    in compiled code once the loop gets hot."""
+    method = scope.stack.current.method
+    hot = method.hot(statement) if method is not None else None
+    if hot == 0 and method.osr(statement, scope):
+        return
+    quota = scope.stack.quota
+    back_edges = 0
+    try:
+        while evaluate(statement.check, scope).value:
+            execute(statements, scope)
+            back_edges += 1
+            if quota is not None and quota.step():
+                raise quota.exceeded(scope.stack, statement.token)
+            if back_edges == hot and method.osr(statement, scope):
+                break
+    finally:
+        if method is not None:
+            method.back_edges += back_edges
 
 
 def conditional(statement, scope):
-    scope = Scope("Conditional (Line {})".format(statement.token.line),
-                  scope)
+    if statement.layout is not None:
+        scope = Scope("Conditional (Line {})".format(statement.token.line),
+                      scope, layout=statement.layout)
     check = evaluate(statement.check, scope).value
     if check:
         execute(statement.true_case, scope)
@@ -447,13 +859,8 @@ def conditional(statement, scope):
 
 
 def variable_assignment(statement, scope):
-    name = statement.name.value
-    try:
-        target = scope.value(name)
-    except KeyError as e:
-        raise ExecutionException(
-            "Variable {!r} does not exist!".format(name),
-            statement.token.source, statement.line, statement.pos) from e
+    depth, slot = statement.address
+    target = scope.display[depth][slot]
     actual_type, rhs = evaluate(statement.value, scope)
     if target.type != actual_type:
         raise ExecutionException("Type mismatch!", statement.token.source,
@@ -511,8 +918,10 @@ def postfix_operation(statement, scope):
 def field_assignment(statement, scope):
     instance = evaluate(statement.lhs, scope).value
     rhs = evaluate(statement.rhs, scope)
-    name = statement.field.value
-    value = instance.scope.value(name)
+    if statement.offset is not None:
+        value = instance.fields[statement.offset]
+    else:
+        value = instance.scope.value(statement.field.value)
     o = statement.operator.value
     try:
         value.value = assignment_operator(o, value.value, rhs.value)
@@ -555,9 +964,18 @@ def type_check(name, arguments, parameters, scope, token):
                                 argument.token.pos)
 
 
+def vectorised(statement, scope):
+    values = {node.name.value: scope.display[node.address[0]][node.address[1]]
+              for node in statement.names}
+    if not vectorise.run(statement, evaluate(statement.start, scope),
+                         evaluate(statement.stop, scope), values, scope):
+        for_loop(statement.loop, scope)
+
+
 def block(statement, scope):
-    scope = Scope("Anonymous Block (Line {})".format(statement.token.line),
-                  scope)
+    if statement.layout is not None:
+        scope = Scope("Anonymous Block (Line {})".format(statement.token.line),
+                      scope, layout=statement.layout)
     execute(statement.statements, scope)
 
 
@@ -574,6 +992,10 @@ _execute = {
     nodes.Return: ret,
     nodes.NoOp: no_op,
     nodes.Block: block,
+    nodes.Inlined: inlined,
+    nodes.Temporary: temporary,
+    nodes.TemporaryIncrement: temporary_increment,
+    nodes.Vectorised: vectorised,
 }
 
 
@@ -582,10 +1004,28 @@ def execute(statements, scope):
         _execute[type(statement)](statement, scope)
 
 
-def interpret(program_node, name):
-    stack = Stack()
+def interpret(program_node, name, memoise=None, depth=None, quota=None):
+    """Runs the program. If memoise is given, the results of pure methods are
+    memoised in an LRU of that size, which is returned. If depth is given,
+    calls deeper than it are a stack overflow. If a quota is given, going
+    over any of its limits stops the program with QuotaExceeded."""
+    main, scope = load(program_node, name, memoise, depth, quota)
+    try:
+        main.run_method("main", (), scope, call=program_node)
+    except RecursionError:
+        # Only bytecode keeps calls off Python's stack - the other engines
+        # run out of it long before reaching depth.
+        raise scope.stack.overflow(scope.stack.current.call.token) from None
+    return scope.stack.memo
+
+
+def load(program_node, name, memoise=None, depth=None, quota=None):
+    """Sets up a run of the program (as interpret does), returning the static
+    form of the class with its main method and the global scope."""
+    stack = Stack(Memo(memoise) if memoise else None, depth, quota=quota)
     stack.enter(Frame("Global", program_node))
-    global_scope = Scope("Global", None, types=classes.primitive_types,
+    # A copy, as the program's classes are added to it.
+    global_scope = Scope("Global", None, types=dict(classes.primitive_types),
                          stack=stack)
     stdlib = library.load_standard_library()
     java = stdlib["java"]
@@ -618,25 +1058,124 @@ def interpret(program_node, name):
             mains.append(cls)
     assert(len(mains) == 1)  # Semantic analyser should catch this.
     program_node.token = Token(0, 0, name, None, None)
-    mains[0](global_scope, static=True).run_method("main", (), global_scope,
-                                                   call=program_node)
+    return mains[0].static_instance(global_scope), global_scope
 
 if __name__ == "__main__":
     import argparse
+    import os
+    import asyncio
+    import closures
+    import compiler
+    import scheduler
 
     args = argparse.ArgumentParser(
         description='Interpret Middleweight Java Code.')
     args.add_argument('file', metavar='FILE', type=argparse.FileType('r'),
                       default=sys.stdin, help='The source code to interpret.')
+    args.add_argument('-m', '--memoise', metavar='SIZE', type=int,
+                      help='Memoise pure static methods taking and returning '
+                           'only primitives and Strings, keeping up to SIZE '
+                           'results.')
+    args.add_argument('-s', '--statistics', action='store_true',
+                      help='Print what the analyser optimised to stderr.')
+    args.add_argument('-O', dest='level', type=int, choices=range(4),
+                      default=optimiser.default_level,
+                      help='The optimisation level (default: {}).'.format(
+                          optimiser.default_level))
+    args.add_argument('-e', '--engine',
+                      choices=("tree", "ir", "closure", "bytecode", "tiered",
+                               "stepping"),
+                      default="tree",
+                      help='Run methods by walking their trees, from their '
+                           'control flow graphs, as closures compiled from '
+                           'their trees, as bytecode on a stack-based '
+                           'virtual machine, by walking their trees until '
+                           'hot, then as Python functions compiled from '
+                           'their control flow graphs, or as bytecode a '
+                           'slice at a time in an asyncio event loop '
+                           '(default: tree).')
+    args.add_argument('--tier-threshold', metavar='COUNT', type=int,
+                      default=default_threshold,
+                      help='With the tiered engine, how many calls plus '
+                           'loop iterations a method runs before it is '
+                           'compiled (default: {}).'.format(
+                               default_threshold))
+    args.add_argument('--slice', metavar='COUNT', type=int,
+                      default=scheduler.default_slice,
+                      help='With the stepping engine, how many instructions '
+                           'run before the event loop gets a turn (default: '
+                           '{}).'.format(scheduler.default_slice))
+    args.add_argument('--max-depth', metavar='DEPTH', type=int,
+                      default=default_depth,
+                      help='The deepest calls can go before a stack '
+                           'overflow (default: {}). Running as bytecode, '
+                           'calls between methods keep no Python frames, so '
+                           'only memory limits how deep this can be; the '
+                           'other engines overflow at Python\'s recursion '
+                           'limit first.'.format(default_depth))
+    args.add_argument('--max-steps', metavar='COUNT', type=int,
+                      help='Stop the program once it has made more than '
+                           'COUNT calls and loop iterations.')
+    args.add_argument('--max-heap', metavar='CELLS', type=int,
+                      help='Stop the program if its objects and lists would '
+                           'hold more than CELLS fields and items at once.')
+    args.add_argument('--timeout', metavar='SECONDS', type=float,
+                      help='Stop the program once it has run for SECONDS.')
+    args.add_argument('--profile-bytecode', metavar='PROFILE',
+                      help='Run methods as bytecode, adding the number of '
+                           'times each block of it ran to those in PROFILE '
+                           '(for superinstructions.py).')
+    args.add_argument('--time-passes', action='store_true',
+                      help='Print how long each optimisation pass took to '
+                           'stderr.')
+    args.add_argument('--dump-ir', action='store_true',
+                      help='Print the control flow graphs before and after '
+                           'each pass on them to stderr.')
 
     args = args.parse_args()
 
     program = parse_handling_errors(args.file)
-    sematics.analyse_handling_errors(program)
+    statistics = sematics.analyse_handling_errors(program)
+    manager = optimiser.PassManager(args.level, lower=args.engine == "ir",
+                                    dump=sys.stderr if args.dump_ir else None)
+    statistics.update(manager.run(program))
+    if args.statistics:
+        for name, value in statistics.items():
+            print("{}: {}.".format(name.capitalize(), value), file=sys.stderr)
+    if args.time_passes:
+        for name, seconds in manager.timings.items():
+            print("Time in {}: {:.6f}s.".format(name, seconds),
+                  file=sys.stderr)
+    if args.engine == "ir":
+        ir.install(manager.functions)
+    elif args.engine == "closure":
+        closures.install(program)
+    elif args.engine == "tiered":
+        compiler.tier(program, args.tier_threshold)
+    elif args.engine in ("bytecode", "stepping") or args.profile_bytecode:
+        codes = bytecode.compile_program(program,
+                                         profile=bool(args.profile_bytecode))
+        bytecode.install(codes)
     if program:
+        quota = None
+        if (args.max_steps is not None or args.max_heap is not None or
+                args.timeout is not None):
+            quota = Quota(args.max_steps, args.max_heap, args.timeout)
         try:
-            interpret(program, args.file.name)
+            if args.engine == "stepping":
+                memo = asyncio.run(scheduler.run(
+                    program, args.file.name, args.slice,
+                    memoise=args.memoise, depth=args.max_depth,
+                    quota=quota))
+            else:
+                memo = interpret(program, args.file.name, args.memoise,
+                                 args.max_depth, quota)
+            if memo:
+                print(memo, file=sys.stderr)
         except InterpreterException as e:
             e.print_traceback()
+        if args.profile_bytecode:
+            bytecode.save_profile(codes, args.profile_bytecode,
+                                  os.path.basename(args.file.name))
     else:
         sys.exit(1)
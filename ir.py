@@ -0,0 +1,884 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""A control flow graph intermediate representation - each method lowered from
+its analysed tree into basic blocks of simple instructions over numbered,
+typed registers, with the control flow between the blocks explicit.
+
+Registers hold what the tree-walker's expressions evaluate to, so a local's
+register holds its variable (and arguments still share their variable with
+the caller), and running the IR behaves exactly as running the tree does."""
+
+import sys
+
+import library
+import classes
+import interpreter
+import mjast
+import sematics
+import vectorise
+from exceptions import ExecutionException
+
+from parser import parse_handling_errors
+
+
+class Register:
+    def __init__(self, number, type_, name=None):
+        self.number = number
+        self.type = type_
+        self.name = name
+
+    def __repr__(self):
+        return "%{}".format(self.number)
+
+
+class Instruction:
+    """An operation, the register it sets (if any), the registers it reads,
+    and the node it was lowered from, which holds the rest of its details
+    (operators, types, names and tokens for errors)."""
+
+    def __init__(self, op, target, operands, node):
+        self.op = op
+        self.target = target
+        self.operands = operands
+        self.node = node
+
+    def __repr__(self):
+        text = " ".join([self.op] + _details.get(self.op, _none)(self.node) +
+                        ["%{}".format(operand) for operand in self.operands])
+        if self.target is not None:
+            return "%{} = {}".format(self.target, text)
+        return text
+
+
+class Terminator:
+    """How a block ends - a jump to one block, a branch to the first or second
+    block on the value of a register, a return of a register's value (or of
+    nothing), or, in a loop lowered on its own, leaving the loop."""
+
+    def __init__(self, op, operand=None, targets=()):
+        self.op = op
+        self.operand = operand
+        self.targets = list(targets)
+
+    def __repr__(self):
+        return " ".join([self.op] + (["%{}".format(self.operand)]
+                                     if self.operand is not None else []) +
+                        ["b{}".format(target.number)
+                         for target in self.targets])
+
+
+class Block:
+    def __init__(self, number):
+        self.number = number
+        self.instructions = []
+        self.terminator = None
+
+    def __repr__(self):
+        return "b{}".format(self.number)
+
+
+class Function:
+    """A method as a control flow graph - its first block is its entry, and
+    its first registers its parameters ('this' first, for instance
+    methods)."""
+
+    def __init__(self, declaration, description):
+        self.declaration = declaration
+        self.description = description
+        self.registers = []
+        self.parameters = 0
+        self.blocks = []
+
+    def register(self, type_, name=None):
+        register = Register(len(self.registers), type_, name)
+        self.registers.append(register)
+        return register.number
+
+    def block(self):
+        block = Block(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    def renumber(self):
+        for number, block in enumerate(self.blocks):
+            block.number = number
+
+    def __repr__(self):
+        lines = ["function {}:".format(self.description)]
+        lines += ["  %{}{}: {}".format(register.number,
+                                       " " + register.name
+                                       if register.name else "",
+                                       register.type)
+                  for register in self.registers]
+        for block in self.blocks:
+            lines.append("b{}:".format(block.number))
+            lines += ["  {!r}".format(instruction)
+                      for instruction in block.instructions]
+            lines.append("  {!r}".format(block.terminator))
+        return "\n".join(lines)
+
+
+def _none(node):
+    return []
+
+
+_details = {
+    "constant": lambda node: [node.value.value],
+    "class": lambda node: [node.name.value],
+    "operation": lambda node: [node.operator.value],
+    "increment": lambda node: [node.operator.value],
+    "assign": lambda node: [node.operator.value],
+    "field": lambda node: [node.field.value],
+    "store": lambda node: [node.field.value, node.operator.value],
+    "call": lambda node: [node.method.value],
+    "new": lambda node: [_type_name(node.type)],
+    "cast": lambda node: [_type_name(node.type)],
+    "declare": lambda node: [_type_name(node.type)],
+    "enter": lambda node: [node.description],
+    "step": lambda node: [str(node.step)],
+    "vector": lambda node: [node.counter],
+}
+
+
+def _type_name(node):
+    return sematics.type_str(sematics.type_from_node(node))
+
+
+def _static_type(expression):
+    type_ = expression.static_type
+    if type_ is None:
+        return "?"
+    if isinstance(type_, tuple):
+        return sematics.type_str(type_)
+    return "class {}".format(type_)
+
+
+def lower(program):
+    """Lowers the methods of an analysed program, returning their
+    functions."""
+    return [lower_method(cls, method)
+            for cls in program.classes for method in cls.methods]
+
+
+def lower_method(cls, method):
+    """Lowers a method of an analysed class, returning its function."""
+    lowering = _entry(cls, method, method.name.value, not method.static)
+    lowering.statements(method.statements)
+    lowering.block.terminator = Terminator("return")
+    return lowering.function
+
+
+def lower_constructor(cls, constructor):
+    """Lowers a constructor of an analysed class, returning its function. Its
+    call to the base class's constructor, made whether or not it is written,
+    is a 'super' instruction taking 'this' and the arguments."""
+    lowering = _entry(cls, constructor, "<init>", True)
+    if cls.base:
+        operands = [lowering.local("this")] + [
+            lowering.value(argument)
+            for argument in constructor.super_arguments]
+        lowering.emit("super", None, operands, constructor)
+    lowering.statements(constructor.statements)
+    lowering.block.terminator = Terminator("return")
+    return lowering.function
+
+
+def _entry(cls, declaration, name, instance):
+    """A lowering of a method or constructor, with its parameters ('this'
+    first, if an instance one) taken and its first block started."""
+    parameters = ", ".join(
+        "{} {}".format(parameter.type.type.value, parameter.name.value)
+        for parameter in declaration.parameters)
+    lowering = _Lowering(Function(declaration, "{}.{}({})".format(
+        cls.name.value, name, parameters)))
+    if instance:
+        lowering.parameter("this", sematics.type_str((cls.name.value, tuple(
+            (generic.type.value, ()) for generic in cls.generics))))
+    for parameter in declaration.parameters:
+        lowering.parameter(parameter.name.value, _type_name(parameter.type))
+    lowering.function.parameters = len(lowering.function.registers)
+    lowering.block = lowering.function.block()
+    return lowering
+
+
+def lower_loop(loop, description, names, temporaries):
+    """Lowers what is left of a loop part way through running - its check and
+    body, without a for loop's setup - as a function that leaves when the loop
+    ends. Its parameters are the variables from outside the loop it uses -
+    the locals named, then the temporaries, each given with its type."""
+    lowering = _Lowering(Function(loop, description))
+    for name, type_ in names:
+        lowering.parameter(name, type_)
+    for temporary, type_ in temporaries:
+        lowering.temporaries[temporary] = lowering.function.register(type_)
+    lowering.function.parameters = len(lowering.function.registers)
+    lowering.block = lowering.function.block()
+    lowering.iterations(loop)
+    lowering.block.terminator = Terminator("leave")
+    return lowering.function
+
+
+class _Lowering:
+    def __init__(self, function):
+        self.function = function
+        self.env = [{}]
+        self.temporaries = {}
+        self.block = None
+
+    def parameter(self, name, type_):
+        self.env[-1][name] = self.function.register(type_, name)
+
+    def emit(self, op, target, operands, node):
+        self.block.instructions.append(Instruction(op, target, operands,
+                                                   node))
+        return target
+
+    def temporary(self, expression):
+        return self.function.register(_static_type(expression))
+
+    def end(self, terminator, following=None):
+        """Ends the current block, carrying on in the following one (a new,
+        unreachable one if not given)."""
+        self.block.terminator = terminator
+        self.block = following or self.function.block()
+
+    def statements(self, statements):
+        self.env.append({})
+        for statement in statements:
+            self.statement(statement)
+        self.env.pop()
+
+    def statement(self, statement):
+        _statements.get(type(statement), _Lowering.discard)(self, statement)
+
+    def value(self, expression):
+        """The register holding the value of the expression, once the
+        instructions evaluating it have run."""
+        # The interpreter may have quickened the node into a subclass.
+        kind = next(kind for kind in type(expression).__mro__
+                    if kind in _expressions)
+        return _expressions[kind](self, expression)
+
+    def discard(self, statement):
+        self.value(statement)
+
+    def local(self, name):
+        for env in reversed(self.env):
+            if name in env:
+                return env[name]
+        raise KeyError("No such local {!r}.".format(name))
+
+    def variable(self, expression):
+        if expression.address is None:
+            return self.emit("class", self.temporary(expression), [],
+                             expression)
+        return self.local(expression.name.value)
+
+    def constant(self, expression):
+        return self.emit("constant", self.temporary(expression), [],
+                         expression)
+
+    def operation(self, expression):
+        operands = [self.value(getattr(expression, part))
+                    for part in ("lhs", "rhs") if hasattr(expression, part)]
+        return self.emit("operation", self.temporary(expression), operands,
+                         expression)
+
+    def group(self, expression):
+        return self.value(expression.operation)
+
+    def ternary(self, expression):
+        target = self.temporary(expression)
+        check = self.value(expression.lhs)
+        true, false, join = (self.function.block(), self.function.block(),
+                             self.function.block())
+        self.end(Terminator("branch", check, (true, false)), true)
+        self.emit("move", target, [self.value(expression.true_case)],
+                  expression)
+        self.end(Terminator("jump", None, (join, )), false)
+        self.emit("move", target, [self.value(expression.false_case)],
+                  expression)
+        self.end(Terminator("jump", None, (join, )), join)
+        return target
+
+    def field(self, expression):
+        operands = [self.value(expression.lhs)]
+        return self.emit("field", self.temporary(expression), operands,
+                         expression)
+
+    def call(self, expression):
+        operands = [self.value(expression.lhs)] + [
+            self.value(argument) for argument in expression.arguments]
+        return self.emit("call", self.temporary(expression), operands,
+                         expression)
+
+    def call_statement(self, statement):
+        operands = [self.value(statement.lhs)] + [
+            self.value(argument) for argument in statement.arguments]
+        self.emit("call", None, operands, statement)
+
+    def construction(self, expression):
+        operands = [self.value(argument) for argument in expression.arguments]
+        return self.emit("new", self.temporary(expression), operands,
+                         expression)
+
+    def cast(self, expression):
+        operands = [self.value(expression.target)]
+        return self.emit("cast", self.temporary(expression), operands,
+                         expression)
+
+    def inlined(self, expression):
+        call = expression.call
+        operands = ([self.value(expression.receiver)]
+                    if expression.receiver else [])
+        operands += [self.value(argument) for argument in expression.arguments]
+        types = ([_static_type(expression.receiver)]
+                 if expression.receiver else [])
+        types += [_type_name(parameter.type)
+                  for parameter in call.declaration.parameters]
+        self.env.append({})
+        parameters = [self.function.register(type_, name)
+                      for type_, name in zip(types, expression.parameters)]
+        self.env[-1].update(zip(expression.parameters, parameters))
+        self.emit("bind", None, operands, expression)
+        # The registers bound to are the instruction's parameters.
+        self.block.instructions[-1].parameters = parameters
+        self.emit("enter", None, [], expression)
+        if expression.value:
+            value = self.value(expression.value)
+        else:
+            self.statements(expression.statements)
+            value = None
+        self.emit("exit", None, [], expression)
+        self.env.pop()
+        return value
+
+    def temporary_store(self, expression):
+        value = self.value(expression.expression)
+        self.temporaries[expression] = self.emit(
+            "copy", self.temporary(expression.expression), [value], expression)
+        return value
+
+    def temporary_value(self, expression):
+        return self.emit("copy", self.temporary(expression.source.expression),
+                         [self.temporaries[expression.source]], expression)
+
+    def declaration(self, statement):
+        operands = [self.value(statement.value)] if statement.value else []
+        target = self.function.register(_type_name(statement.type),
+                                        statement.name.value)
+        self.emit("declare", target, operands, statement)
+        self.env[-1][statement.name.value] = target
+
+    def assignment(self, statement):
+        self.emit("assign", None, [self.local(statement.name.value),
+                                   self.value(statement.value)], statement)
+
+    def store(self, statement):
+        self.emit("store", None, [self.value(statement.lhs),
+                                  self.value(statement.rhs)], statement)
+
+    def increment(self, statement):
+        target = (statement.lhs if isinstance(statement,
+                                              mjast.PostfixOperation)
+                  else statement.rhs)
+        self.emit("increment", None, [self.value(target)], statement)
+
+    def step(self, statement):
+        self.emit("step", None, [self.temporaries[statement.source]],
+                  statement)
+
+    def return_(self, statement):
+        value = self.value(statement.value) if statement.value else None
+        self.end(Terminator("return", value))
+
+    def no_op(self, statement):
+        self.emit("fail", None, [], statement)
+
+    def conditional(self, statement):
+        join = self.function.block()
+        self.branches(statement, join)
+        self.end(Terminator("jump", None, (join, )), join)
+
+    def branches(self, statement, join):
+        check = self.value(statement.check)
+        true, false = self.function.block(), self.function.block()
+        self.end(Terminator("branch", check, (true, false)), true)
+        self.statements(statement.true_case)
+        self.end(Terminator("jump", None, (join, )), false)
+        if statement.elseif:
+            self.branches(statement.elseif, join)
+        else:
+            self.statements(statement.false_case)
+
+    def loop(self, statement):
+        self.env.append({})
+        if isinstance(statement, mjast.ForLoop):
+            # The setup's declaration is in scope for the whole loop.
+            for setup in [statement.setup] + list(statement.reductions):
+                self.statement(setup)
+        self.iterations(statement)
+        self.env.pop()
+
+    def iterations(self, statement):
+        """The check and body of a loop, carrying on after it."""
+        check, body, exit_ = (self.function.block(), self.function.block(),
+                              self.function.block())
+        self.end(Terminator("jump", None, (check, )), check)
+        self.end(Terminator("branch", self.value(statement.check),
+                            (body, exit_)), body)
+        if isinstance(statement, mjast.ForLoop):
+            self.statements(statement.statements + [statement.iteration] +
+                            list(statement.steps))
+        else:
+            self.statements(statement.statements)
+        self.end(Terminator("jump", None, (check, )), exit_)
+
+    def vectorised(self, statement):
+        """Branches to the loop if the range couldn't be vectorised."""
+        operands = [self.value(statement.start), self.value(statement.stop)]
+        operands += [self.local(node.name.value) for node in statement.names]
+        done = self.emit("vector", self.function.register("boolean"),
+                         operands, statement)
+        loop, join = self.function.block(), self.function.block()
+        self.end(Terminator("branch", done, (join, loop)), loop)
+        self.loop(statement.loop)
+        self.end(Terminator("jump", None, (join, )), join)
+
+    def block_statement(self, statement):
+        self.statements(statement.statements)
+
+
+_expressions = {
+    mjast.StringLiteral: _Lowering.constant,
+    mjast.NumberLiteral: _Lowering.constant,
+    mjast.DecimalLiteral: _Lowering.constant,
+    mjast.BooleanLiteral: _Lowering.constant,
+    mjast.NullLiteral: _Lowering.constant,
+    mjast.Variable: _Lowering.variable,
+    mjast.TernaryOperation: _Lowering.ternary,
+    mjast.InfixOperation: _Lowering.operation,
+    mjast.PrefixOperation: _Lowering.operation,
+    mjast.PostfixOperation: _Lowering.operation,
+    mjast.ObjectConstruction: _Lowering.construction,
+    mjast.FieldAccess: _Lowering.field,
+    mjast.MethodCall: _Lowering.call,
+    mjast.Inlined: _Lowering.inlined,
+    mjast.Temporary: _Lowering.temporary_store,
+    mjast.TemporaryValue: _Lowering.temporary_value,
+    mjast.Cast: _Lowering.cast,
+    mjast.OperationGroup: _Lowering.group,
+}
+
+_statements = {
+    mjast.LocalVariableDeclaration: _Lowering.declaration,
+    mjast.MethodCall: _Lowering.call_statement,
+    mjast.WhileLoop: _Lowering.loop,
+    mjast.VariableAssignment: _Lowering.assignment,
+    mjast.Conditional: _Lowering.conditional,
+    mjast.PostfixOperation: _Lowering.increment,
+    mjast.PrefixOperation: _Lowering.increment,
+    mjast.ForLoop: _Lowering.loop,
+    mjast.FieldAssignment: _Lowering.store,
+    mjast.Return: _Lowering.return_,
+    mjast.NoOp: _Lowering.no_op,
+    mjast.Block: _Lowering.block_statement,
+    mjast.TemporaryIncrement: _Lowering.step,
+    mjast.Vectorised: _Lowering.vectorised,
+}
+
+
+def dump(functions, file=sys.stdout):
+    for function in functions:
+        print(function, file=file)
+
+
+def install(functions):
+    """Has the interpreter run the methods from their functions rather than
+    their trees."""
+    for function in functions:
+        function.declaration.function = function
+
+
+# Passes - each takes the functions, and returns how many things it changed.
+
+def simplify(functions):
+    """Control flow simplification - makes branches on literal booleans
+    jumps, jumps to empty blocks that just jump on go straight to where they
+    lead, merges blocks into their only predecessor when it jumps to them,
+    and removes unreachable blocks. Returns the number of blocks removed."""
+    removed = 0
+    for function in functions:
+        before = len(function.blocks)
+        _constant_branches(function)
+        for block in function.blocks:
+            for position, target in enumerate(block.terminator.targets):
+                block.terminator.targets[position] = _forward(target)
+        _merge(function)
+        reachable = _reachable(function)
+        function.blocks = [block for block in function.blocks
+                           if block in reachable]
+        function.renumber()
+        removed += before - len(function.blocks)
+    return removed
+
+
+def _constant_branches(function):
+    for block in function.blocks:
+        terminator = block.terminator
+        if terminator.op != "branch" or not block.instructions:
+            continue
+        last = block.instructions[-1]
+        if (last.op == "constant" and last.target == terminator.operand and
+                isinstance(last.node, mjast.BooleanLiteral)):
+            taken = terminator.targets[last.node.value.value != "true"]
+            block.terminator = Terminator("jump", None, (taken, ))
+
+
+def _forward(block):
+    seen = set()
+    while (not block.instructions and block.terminator.op == "jump" and
+           block not in seen):
+        seen.add(block)
+        block = block.terminator.targets[0]
+    return block
+
+
+def _predecessors(function):
+    predecessors = {block: [] for block in function.blocks}
+    for block in function.blocks:
+        for target in block.terminator.targets:
+            predecessors[target].append(block)
+    return predecessors
+
+
+def _merge(function):
+    predecessors = _predecessors(function)
+    entry = function.blocks[0]
+    for block in function.blocks:
+        while block.terminator.op == "jump":
+            following = block.terminator.targets[0]
+            if (following is block or following is entry or
+                    predecessors[following] != [block]):
+                break
+            block.instructions += following.instructions
+            block.terminator = following.terminator
+            following.instructions = []
+            following.terminator = Terminator("return")
+            for target in block.terminator.targets:
+                predecessors[target] = [block if predecessor is following
+                                        else predecessor
+                                        for predecessor in
+                                        predecessors[target]]
+            predecessors[following] = []
+
+
+def _reachable(function):
+    reachable = set()
+    pending = [function.blocks[0]]
+    while pending:
+        block = pending.pop()
+        if block not in reachable:
+            reachable.add(block)
+            pending.extend(block.terminator.targets)
+    return reachable
+
+
+# Instructions that can't fail or have any effect other than setting their
+# register.
+_pure = {"constant", "move", "copy"}
+
+
+def dead_code(functions):
+    """Removes pure instructions whose registers are never read, repeating
+    until there are none. Returns the number removed."""
+    removed = 0
+    for function in functions:
+        while True:
+            read = set()
+            for block in function.blocks:
+                for instruction in block.instructions:
+                    read.update(instruction.operands)
+                if block.terminator.operand is not None:
+                    read.add(block.terminator.operand)
+            count = 0
+            for block in function.blocks:
+                kept = [instruction for instruction in block.instructions
+                        if instruction.op not in _pure or
+                        instruction.target in read]
+                count += len(block.instructions) - len(kept)
+                block.instructions = kept
+            if not count:
+                break
+            removed += count
+    return removed
+
+
+# Running functions - the handlers mirror the tree-walker's, on registers.
+
+def run(function, scope):
+    """Runs a function in the scope made for the call, the arguments already
+    being bound into its slots, returning what it returns."""
+    registers = [None] * len(function.registers)
+    registers[:function.parameters] = scope.slots[:function.parameters]
+    quota = scope.stack.quota
+    block = function.blocks[0]
+    while True:
+        for instruction in block.instructions:
+            _run[instruction.op](instruction, registers, scope)
+        terminator = block.terminator
+        if terminator.op == "jump":
+            target = terminator.targets[0]
+        elif terminator.op == "branch":
+            target = terminator.targets[
+                not registers[terminator.operand].value]
+        elif terminator.operand is not None:
+            return registers[terminator.operand]
+        else:
+            return None
+        if (quota is not None and back_edge(block, target) and
+                quota.step()):
+            raise quota.exceeded(scope.stack, _token(target))
+        block = target
+
+
+def back_edge(block, target):
+    """Whether going from the block to the target goes back round a loop -
+    every loop has an edge back to a block numbered no later than where it
+    comes from, so counting these counts its iterations."""
+    return target.number <= block.number
+
+
+def _token(block):
+    """The token of the first node run by the block, if any."""
+    for instruction in block.instructions:
+        token = getattr(instruction.node, "token", None)
+        if token is not None:
+            return token
+    return None
+
+
+def _evaluate(instruction, registers, scope):
+    registers[instruction.target] = interpreter.evaluate(instruction.node,
+                                                         scope)
+
+
+def _operation(instruction, registers, scope):
+    node = instruction.node
+    type_, value = interpreter._operations[node.operator.value](
+        *[registers[operand] for operand in instruction.operands])
+    if isinstance(type_, type):
+        type_ = type_(scope)
+    result = interpreter.Variable(type_, value)
+    result.token = node.token
+    registers[instruction.target] = result
+
+
+def _move(instruction, registers, scope):
+    registers[instruction.target] = registers[instruction.operands[0]]
+
+
+def _copy(instruction, registers, scope):
+    value = registers[instruction.operands[0]]
+    registers[instruction.target] = interpreter.Variable(value.type,
+                                                         value.value)
+
+
+def _field(instruction, registers, scope):
+    node = instruction.node
+    item = registers[instruction.operands[0]]
+    if node.offset is not None:
+        value = item.value.fields[node.offset]
+    elif isinstance(item, library.LibClass):
+        value = getattr(item, node.field.value)
+    else:
+        value = item.value.scope.value(node.field.value)
+    value.token = node.token
+    registers[instruction.target] = value
+
+
+def _call(instruction, registers, scope):
+    node = instruction.node
+    item, *arguments = [registers[operand]
+                        for operand in instruction.operands]
+    if isinstance(item, interpreter.Variable):
+        item = item.value
+    if not node.nonnull and item is None:
+        token = node.lhs.token
+        raise ExecutionException("Null Pointer Exception", scope.stack,
+                                 token.source, token.line, token.pos)
+    if node.monomorphic:
+        if isinstance(item, classes.Class):
+            method = item.implementation(node.declaration)
+            value = method.run(method.cls, None, arguments, scope, call=node)
+        else:
+            method = item.cls.implementation(node.declaration)
+            value = method.run(method.cls, None if method.static else item,
+                               arguments, item.scope, call=node)
+    else:
+        value = item.run_method(node.method.value, arguments, scope,
+                                call=node)
+    if instruction.target is not None:
+        value.token = node.token
+        registers[instruction.target] = value
+
+
+def _new(instruction, registers, scope):
+    node = instruction.node
+    cls = scope.type(node.type)
+    arguments = [registers[operand] for operand in instruction.operands]
+    value = interpreter.Variable(cls, cls.instance(arguments, scope,
+                                                   call=node))
+    value.token = node.token
+    registers[instruction.target] = value
+
+
+def _cast(instruction, registers, scope):
+    value = interpreter.Variable(scope.type(instruction.node.type),
+                                 registers[instruction.operands[0]].value)
+    value.token = instruction.node.token
+    registers[instruction.target] = value
+
+
+def _bind(instruction, registers, scope):
+    node = instruction.node
+    values = [registers[operand] for operand in instruction.operands]
+    if node.receiver:
+        item = values[0].value
+        if not node.call.nonnull and item is None:
+            token = node.receiver.token
+            raise ExecutionException("Null Pointer Exception", scope.stack,
+                                     token.source, token.line, token.pos)
+        values[0] = item.this
+    for register, value in zip(instruction.parameters, values):
+        registers[register] = value
+
+
+def _enter(instruction, registers, scope):
+    node = instruction.node
+    scope.stack.enter(interpreter.Frame(node.description, node.call))
+
+
+def _exit(instruction, registers, scope):
+    scope.stack.exit()
+
+
+def _declare(instruction, registers, scope):
+    node = instruction.node
+    required_type = scope.type(node.type)
+    if instruction.operands:
+        type_, value = registers[instruction.operands[0]]
+    else:
+        type_, value = required_type, required_type.default_value
+    if not type_.is_subclass_of(required_type):
+        raise ExecutionException("Type mismatch!", node.token.source,
+                                 node.token.line, node.token.pos)
+    registers[instruction.target] = interpreter.Variable(required_type, value,
+                                                         scope)
+
+
+def _assign(instruction, registers, scope):
+    node = instruction.node
+    target, value = [registers[operand] for operand in instruction.operands]
+    actual_type, rhs = value
+    if target.type != actual_type:
+        raise ExecutionException("Type mismatch!", node.token.source,
+                                 node.line, node.pos)
+    o = node.operator.value
+    try:
+        target.value = interpreter.assignment_operator(o, target.value, rhs)
+    except KeyError as e:
+        raise ExecutionException("Unknown operator {}!".format(o),
+                                 node.token.source, node.line,
+                                 node.pos) from e
+
+
+def _store(instruction, registers, scope):
+    node = instruction.node
+    instance, rhs = [registers[operand] for operand in instruction.operands]
+    instance = instance.value
+    if node.offset is not None:
+        value = instance.fields[node.offset]
+    else:
+        value = instance.scope.value(node.field.value)
+    o = node.operator.value
+    try:
+        value.value = interpreter.assignment_operator(o, value.value,
+                                                      rhs.value)
+    except KeyError as e:
+        raise ExecutionException("Unknown operator {}!".format(o),
+                                 node.token.source, node.token.line,
+                                 node.token.pos) from e
+
+
+def _increment(instruction, registers, scope):
+    target = registers[instruction.operands[0]]
+    o = instruction.node.operator.value
+    if o == "++":
+        target.value += 1
+    elif o == "--":
+        target.value -= 1
+
+
+def _step(instruction, registers, scope):
+    registers[instruction.operands[0]].value += instruction.node.step
+
+
+def _vector(instruction, registers, scope):
+    node = instruction.node
+    start, stop, *values = [registers[operand]
+                            for operand in instruction.operands]
+    done = vectorise.run(node, start, stop, dict(zip(
+        (name.name.value for name in node.names), values)), scope)
+    registers[instruction.target] = interpreter.Variable(
+        classes.primitive_types["boolean"](scope), done)
+
+
+def _fail(instruction, registers, scope):
+    raise Exception  # NoOps disabled to ensure they don't mask errors.
+
+
+_run = {
+    "constant": _evaluate,
+    "class": _evaluate,
+    "operation": _operation,
+    "move": _move,
+    "copy": _copy,
+    "field": _field,
+    "call": _call,
+    "new": _new,
+    "cast": _cast,
+    "bind": _bind,
+    "enter": _enter,
+    "exit": _exit,
+    "declare": _declare,
+    "assign": _assign,
+    "store": _store,
+    "increment": _increment,
+    "step": _step,
+    "vector": _vector,
+    "fail": _fail,
+}
+
+
+if __name__ == "__main__":
+    import argparse
+    import optimiser
+
+    args = argparse.ArgumentParser(
+        description='Show the control flow graphs of Middleweight Java code.')
+    args.add_argument('file', metavar='FILE', type=argparse.FileType('r'),
+                      default=sys.stdin, help='The source code to lower.')
+    args.add_argument('-O', dest='level', type=int, choices=range(4),
+                      default=optimiser.default_level,
+                      help='The optimisation level (default: {}).'.format(
+                          optimiser.default_level))
+
+    args = args.parse_args()
+
+    program = parse_handling_errors(args.file)
+    sematics.analyse_handling_errors(program)
+    manager = optimiser.PassManager(args.level, lower=True)
+    manager.run(program)
+    dump(manager.functions)
@@ -16,7 +16,7 @@ def load_standard_library():
     return {cls.name: cls for cls in stdlib.standard_library}
 
 
-def method(static=False):
+def method(static=False, pure=False):
     def decorate(obj):
         signature = inspect.signature(obj)
         return_type = signature.return_annotation
@@ -35,6 +35,7 @@ def method(static=False):
                                  "annotation to give the return type.")
         obj.types = [param.annotation for param in params]
         obj.static = static
+        obj.pure = pure
         obj.method = True
         obj.return_type = return_type
         return obj
@@ -74,6 +75,7 @@ class LibMethod(Method):
         self.return_type = (return_type
                             if return_type is not signature.empty else None)
         self._func = func
+        self.declaration = getattr(func, "__func__", func)
         name = (func.__name__
                 if not hasattr(self._func, "constructor") else cls.name)
         super().__init__(cls, name, static, generics, return_type,
@@ -121,7 +123,7 @@ class LibInstance(Instance):
     def __init__(self, cls, arguments, context, *, call):
         self.cls = cls
         self.internal = {}
-        self.scope = self.make_scope(context)
+        self.scope = self.make_scope(context, call)
         cls.run_constructor(self, arguments, self.scope, call=call)
 
     def run_method(self, name, args, context, instance=None, *, call):
@@ -29,7 +29,8 @@ from mjast.expressions import (Expression, OperationGroup, Operation,
                                FieldAccess, Cast)
 
 from mjast.promotable import (PromotableExpression, MethodCall,
-                              ObjectConstruction)
+                              ObjectConstruction, Inlined, Temporary,
+                              TemporaryValue, TemporaryIncrement, Vectorised)
 
 from mjast.core import (Program, Class, Field, Parameter, Constructor, Method,
                         Type, Import)
@@ -32,6 +32,8 @@ class Program(Node):
 
 
 class Class(Node):
+    monomorphises = None
+
     def __init__(self, code):
         self.base = None
         self.expression = (
@@ -75,6 +77,11 @@ class Parameter(Node):
 
 
 class Constructor(Node):
+    function = None
+    closure = None
+    bytecode = None
+    written = None
+
     def __init__(self, code):
         self.super_arguments = []
         self.expression = (
@@ -93,6 +100,17 @@ class Constructor(Node):
 
 
 class Method(Node):
+    pure = False
+    memoisable = False
+    specialises = None
+    monomorphises = None
+    written = None
+    function = None
+    closure = None
+    bytecode = None
+    # The class declaring the method, given for tiering to lower it with.
+    cls = None
+
     def __init__(self, code):
         self.expression = (
             exists("static", keyword("static")),
@@ -12,6 +12,8 @@ from tokenizer import Token
 
 
 class Expression(Node):
+    static_type = None
+
     def __init__(self, code):
         super().__init__(code)
 
@@ -29,7 +31,9 @@ class OperationGroup(Expression):
 
 
 class Operation(Expression):
-    pass
+    # Set by the interpreter once it has found it can't quicken the
+    # operation, or the guard of its quickened form has failed.
+    generic = False
 
 
 class PrefixOperation(Operation, Statement):
@@ -43,6 +47,8 @@ class PrefixOperation(Operation, Statement):
 
 
 class PostfixOperation(Operation, Statement):
+    _parts = (("lhs", "operator"), ())
+
     def __init__(self, code):
         self.expression = (
             operator(Token.prepostfix_operator),
@@ -80,13 +86,19 @@ class TernaryOperation(Operation):
 
 
 class Literal(Expression):
+    _parts = (("value", ), ())
     type_ = None
 
-    def __init__(self, code):
-        self.expression = (
-            literal("value", self.type_),
-        )
-        super().__init__(code)
+    def __init__(self, code=None, value=None):
+        if code:
+            self.expression = (
+                literal("value", self.type_),
+            )
+            super().__init__(code)
+        elif value is not None:
+            self.value = self.token = value
+        else:
+            raise ValueError("value must be supplied if code is not.")
 
 
 class StringLiteral(Literal):
@@ -111,6 +123,8 @@ class NullLiteral(Literal):
 
 
 class Variable(Expression):
+    address = None
+
     def __init__(self, code):
         self.expression = (
             identifier("name"),
@@ -120,6 +134,8 @@ class Variable(Expression):
 
 class FieldAccess(Expression):
     _parts = (("lhs", "field"), ())
+    owner = None
+    offset = None
 
     def __init__(self, code):
         self.expression = (
@@ -14,6 +14,10 @@ class PromotableExpression(Statement, Expression):
 
 class MethodCall(PromotableExpression):
     _parts = (("lhs", "method"), ("arguments", ))
+    declaration = None
+    owner = None
+    monomorphic = False
+    nonnull = False
 
     def __init__(self, code):
         self.expression = (
@@ -24,6 +28,9 @@ class MethodCall(PromotableExpression):
 
 
 class ObjectConstruction(PromotableExpression):
+    declaration = None
+    owner = None
+
     def __init__(self, code):
         self.expression = (
             keyword("new"),
@@ -31,3 +38,71 @@ class ObjectConstruction(PromotableExpression):
             arguments(),
         )
         super().__init__(code)
+
+
+class Inlined(PromotableExpression):
+    """The body of a method in place of a call to it, made by the optimiser.
+    The parameters (renamed so they can't clash with the caller's locals, and
+    including 'this' for instance methods) are bound to the receiver and
+    arguments, then either the statements are run or the value evaluated."""
+    _parts = (("receiver", "value"), ("arguments", "statements"))
+    address = None
+
+    def __init__(self, call, receiver, parameters, statements, value,
+                 description):
+        self.call = call
+        self.token = call.token
+        self.receiver = receiver
+        self.arguments = call.arguments
+        self.parameters = parameters
+        self.statements = statements
+        self.value = value
+        self.description = description
+
+
+class Temporary(PromotableExpression):
+    """An expression whose value the optimiser keeps in a slot of its own, so
+    it can be reused through TemporaryValue nodes rather than evaluated
+    again."""
+    _parts = (("expression", ), ())
+    address = None
+
+    def __init__(self, expression):
+        self.token = expression.token
+        self.expression = expression
+
+
+class TemporaryValue(Expression):
+    """The value last kept by a Temporary."""
+    _parts = ((), ())
+
+    def __init__(self, source):
+        self.token = source.token
+        self.source = source
+
+
+class TemporaryIncrement(Statement):
+    """Adds a constant to the value kept by a Temporary."""
+    _parts = ((), ())
+
+    def __init__(self, source, step):
+        self.token = source.token
+        self.source = source
+        self.step = step
+
+
+class Vectorised(Statement):
+    """A counted for loop the optimiser found can be run a whole range at a
+    time. Each kernel is a ("set", list, expression) storing the expression
+    into the list at the counter, or a ("sum", local, expression) adding it to
+    the local. The loop is kept to run instead when the range can't be."""
+    _parts = (("loop", ), ())
+
+    def __init__(self, loop, counter, start, stop, kernels, names):
+        self.token = loop.token
+        self.loop = loop
+        self.counter = counter
+        self.start = start
+        self.stop = stop
+        self.kernels = kernels
+        self.names = names
@@ -45,6 +45,10 @@ class WhileLoop(Statement):
 
 class ForLoop(Statement):
     must_be_closed = False
+    reductions = ()
+    steps = ()
+    # The constant the counter steps by, if analysis found the loop counted.
+    counted = None
 
     def __init__(self, code):
         self.expression = (
@@ -94,6 +98,8 @@ class Conditional(Statement):
 
 class FieldAssignment(Statement):
     _parts = (("lhs", "field", "operator", "rhs"), ())
+    owner = None
+    offset = None
 
     def __init__(self, code):
         self.expression = (
@@ -105,16 +111,25 @@ class FieldAssignment(Statement):
 
 
 class LocalVariableDeclaration(Statement):
-    def __init__(self, code):
-        self.expression = (
-            type_identifier(),
-            identifier("name"),
-            If(LocalVariableDeclaration._assignment),
-            operator(Token.assignment_operator),
-            expression("value"),
-            EndIf(),
-        )
-        super().__init__(code)
+    _parts = ("type", "name", "operator", "value"), ()
+
+    def __init__(self, code=None, using=None):
+        self.operator = None
+        self.value = None
+        if code:
+            self.expression = (
+                type_identifier(),
+                identifier("name"),
+                If(LocalVariableDeclaration._assignment),
+                operator(Token.assignment_operator),
+                expression("value"),
+                EndIf(),
+            )
+            super().__init__(code)
+        elif using:
+            self.token = using
+        else:
+            raise ValueError("using must be supplied if code is not.")
 
     @staticmethod
     def _assignment(inst):
@@ -122,13 +137,21 @@ class LocalVariableDeclaration(Statement):
 
 
 class VariableAssignment(Statement):
-    def __init__(self, code):
-        self.expression = (
-            identifier("name"),
-            operator(Token.assignment_operator),
-            expression("value"),
-        )
-        super().__init__(code)
+    _parts = ("name", "operator", "value"), ()
+    address = None
+
+    def __init__(self, code=None, using=None):
+        if code:
+            self.expression = (
+                identifier("name"),
+                operator(Token.assignment_operator),
+                expression("value"),
+            )
+            super().__init__(code)
+        elif using:
+            self.token = using
+        else:
+            raise ValueError("using must be supplied if code is not.")
 
 
 class Return(Statement):
@@ -143,12 +166,17 @@ class Return(Statement):
 
 
 class Block(Statement):
+    _parts = ((), ("statements", ))
     must_be_closed = False
 
-    def __init__(self, code):
-        self.expression = (
-            symbol("{"),
-            statements(),
-            symbol("}"),
-        )
-        super().__init__(code)
+    def __init__(self, code=None, body=None, token=None):
+        if code:
+            self.expression = (
+                symbol("{"),
+                statements(),
+                symbol("}"),
+            )
+            super().__init__(code)
+        else:
+            self.statements = body
+            self.token = token
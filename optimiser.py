@@ -0,0 +1,1179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Optimisation passes - rewrite an analysed abstract syntax tree into an
+equivalent one that is cheaper to interpret."""
+
+import copy
+import itertools
+import sys
+import time
+
+import library
+import classes
+import interpreter
+import ir
+import mjast
+import sematics
+import vectorise
+from tokenizer import Token
+
+from parser import parse_handling_errors
+
+
+default_level = 3
+
+
+def optimise(program, level=default_level):
+    """Runs the optimisation passes for the level over an analysed program,
+    returning statistics on what they did."""
+    return PassManager(level).run(program)
+
+
+class PassManager:
+    """Runs the passes enabled at an optimisation level (0 running none, 3
+    all of them) - first those on the tree, then, if lowering, those on the
+    control flow graphs of the methods, which are left in functions. Each
+    pass is timed, and if given a file to dump to, the IR is written to it
+    before and after each IR pass."""
+
+    def __init__(self, level=default_level, lower=False, dump=None):
+        self.level = level
+        self.lower = lower or dump is not None
+        self.dump = dump
+        self.timings = {}
+        self.functions = None
+
+    def run(self, program):
+        statistics = {}
+        for name, level, function, counts in tree_passes:
+            if level <= self.level:
+                self._statistics(statistics, counts,
+                                 self._time(name, function, program))
+        if self.level:
+            # The passes change the tree, so it needs addressing again.
+            self._time("address", sematics.address, program)
+            self._time("counted", sematics.counted, program)
+        if not self.lower:
+            return statistics
+        self.functions = self._time("lower", ir.lower, program)
+        for name, level, function, counts in ir_passes:
+            if level <= self.level:
+                self._dump("before", name)
+                self._statistics(statistics, counts,
+                                 self._time(name, function, self.functions))
+                self._dump("after", name)
+        return statistics
+
+    def _time(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.timings[name] = time.perf_counter() - start
+        return result
+
+    def _dump(self, when, name):
+        if self.dump is not None:
+            print("*** IR {} {} ***".format(when, name), file=self.dump)
+            ir.dump(self.functions, self.dump)
+
+    @staticmethod
+    def _statistics(statistics, counts, result):
+        if isinstance(counts, tuple):
+            statistics.update(zip(counts, result))
+        else:
+            statistics[counts] = result
+
+
+def size(node):
+    return sum(1 for _ in node)
+
+
+def fold(program):
+    """Constant folding and dead code elimination - evaluates operations on
+    literals (and calls to pure library methods with literal arguments) once,
+    replacing them with a literal of the result, and removes branches and
+    loops that can never run and statements after a return. Returns the number
+    of nodes removed."""
+    scope = _constant_scope()
+    before = size(program)
+    for cls in program.classes:
+        for constructor in cls.constructors:
+            constructor.super_arguments = [
+                _fold_expression(argument, scope)
+                for argument in constructor.super_arguments]
+            constructor.statements = _fold_statements(constructor.statements,
+                                                      scope)
+        for method in cls.methods:
+            method.statements = _fold_statements(method.statements, scope)
+    return before - size(program)
+
+
+def _constant_scope():
+    scope = interpreter.Scope("Constant Folding", None,
+                              types=dict(classes.primitive_types),
+                              stack=interpreter.Stack(quicken=False))
+    java = library.load_standard_library()["java"]
+    scope.types["java"] = java
+    scope.types.update(java.children["lang"].children)
+    return scope
+
+
+_literals = (mjast.StringLiteral, mjast.NumberLiteral, mjast.DecimalLiteral,
+             mjast.BooleanLiteral)
+
+
+def _fold_statements(statements, scope):
+    folded = []
+    for statement in statements:
+        folded.extend(_fold_statement(statement, scope))
+        if isinstance(statement, mjast.Return):
+            break
+    return folded
+
+
+def _fold_statement(statement, scope):
+    """The statements that should replace the given one."""
+    if isinstance(statement, mjast.Conditional):
+        statement.check = _fold_expression(statement.check, scope)
+        statement.true_case = _fold_statements(statement.true_case, scope)
+        if statement.elseif:
+            rest = _fold_statement(statement.elseif, scope)
+        else:
+            rest = _fold_statements(statement.false_case, scope)
+        if isinstance(statement.check, mjast.BooleanLiteral):
+            if statement.check.value.value == "true":
+                return _inline(statement.true_case, statement.token)
+            return _inline(rest, statement.token)
+        if len(rest) == 1 and isinstance(rest[0], mjast.Conditional):
+            statement.elseif, statement.false_case = rest[0], []
+        else:
+            statement.elseif, statement.false_case = None, rest
+    elif isinstance(statement, (mjast.WhileLoop, mjast.ForLoop)):
+        if isinstance(statement, mjast.ForLoop):
+            for name in ("setup", "iteration"):
+                part = _fold_expression(getattr(statement, name), scope)
+                if isinstance(part, mjast.Statement):
+                    setattr(statement, name, part)
+        statement.check = _fold_expression(statement.check, scope)
+        statement.statements = _fold_statements(statement.statements, scope)
+        if (isinstance(statement.check, mjast.BooleanLiteral) and
+                statement.check.value.value == "false"):
+            if isinstance(statement, mjast.ForLoop):
+                return _inline([statement.setup], statement.token)
+            return []
+    elif isinstance(statement, mjast.Block):
+        statement.statements = _fold_statements(statement.statements, scope)
+    else:
+        statement = _fold_expression(statement, scope)
+        if not isinstance(statement, mjast.Statement):
+            # A pure call whose result is unused.
+            return []
+    return [statement]
+
+
+def _inline(statements, token):
+    """Statements to run in place of a branch - the branch's own, in a block
+    if they declare anything, so the names stay local to it."""
+    if any(isinstance(statement, mjast.LocalVariableDeclaration)
+           for statement in statements):
+        return [mjast.Block(body=statements, token=token)]
+    return statements
+
+
+def _fold_expression(expression, scope):
+    single, many = expression._parts
+    for name in single:
+        part = getattr(expression, name)
+        if isinstance(part, mjast.Node):
+            setattr(expression, name, _fold_expression(part, scope))
+    for name in many:
+        setattr(expression, name, [_fold_expression(part, scope)
+                                   if isinstance(part, mjast.Node) else part
+                                   for part in getattr(expression, name)])
+    if isinstance(expression, mjast.OperationGroup):
+        if isinstance(expression.operation, _literals):
+            return expression.operation
+    elif isinstance(expression, mjast.TernaryOperation):
+        if isinstance(expression.lhs, mjast.BooleanLiteral):
+            return (expression.true_case
+                    if expression.lhs.value.value == "true"
+                    else expression.false_case)
+    elif isinstance(expression, (mjast.InfixOperation,
+                                 mjast.PrefixOperation)):
+        operands = [getattr(expression, part) for part in ("lhs", "rhs")
+                    if hasattr(expression, part)]
+        if (expression.operator.value in interpreter._operations and
+                expression.operator.value != "instanceof" and
+                all(isinstance(operand, _literals) for operand in operands)):
+            return _constant(expression, scope)
+        elif expression.operator.value in ("==", "!="):
+            # Comparing to the literal that leaves a boolean as it is.
+            identity = "true" if expression.operator.value == "==" else "false"
+            for operand, other in (operands, operands[::-1]):
+                if (isinstance(operand, mjast.BooleanLiteral) and
+                        operand.value.value == identity):
+                    return other
+    elif isinstance(expression, mjast.MethodCall):
+        declaration = expression.declaration
+        if (not isinstance(declaration, (type(None), mjast.Method)) and
+                declaration.static and getattr(declaration, "pure", False) and
+                all(isinstance(argument, _literals)
+                    for argument in expression.arguments)):
+            return _constant(expression, scope)
+    return expression
+
+
+def _constant(expression, scope):
+    """A literal for the value of the expression, evaluated as the interpreter
+    would, or the expression itself if that isn't possible."""
+    try:
+        value = interpreter.evaluate(expression, scope)
+    except Exception:
+        # Left for the interpreter to fail on when (if) it is run.
+        return expression
+    type_, value = value
+    if isinstance(type_, classes.primitive_types["boolean"]):
+        if not isinstance(value, bool):
+            return expression
+        cls, text = mjast.BooleanLiteral, "true" if value else "false"
+    elif isinstance(type_, classes.primitive_types["int"]):
+        if isinstance(value, bool) or not isinstance(value, int):
+            return expression
+        cls, text = mjast.NumberLiteral, str(value)
+    elif isinstance(type_, classes.primitive_types["float"]):
+        if not isinstance(value, float):
+            return expression
+        cls, text = mjast.DecimalLiteral, repr(value)
+    elif isinstance(value, str) and type_.name == "String":
+        # The quotes are stripped, and escapes decoded again on evaluation.
+        cls = mjast.StringLiteral
+        text = '"{}"'.format(value.encode("unicode_escape").decode("ascii"))
+    else:
+        return expression
+    token = expression.token
+    return cls(value=Token(cls.type_, text, token.source, token.line,
+                           token.pos))
+
+
+monomorphise_budget = 2000
+
+
+def monomorphise(program, budget=monomorphise_budget):
+    """Monomorphisation - makes a copy of each generic class for each concrete
+    instantiation of it the program uses, and of each generic method for each
+    concrete set of generics a call to it binds, with the generics replaced by
+    the types. Types naming an instantiation name its copy instead, and calls
+    are bound to the copies, so they run like any other class and method.
+    Copies are made until they total budget nodes. Static methods stay in the
+    generic class, as do classes named on the right of an instanceof, as a
+    copy is a different class. Returns the number of classes and methods
+    copied."""
+    monomorphiser = _Monomorphiser(program, budget)
+    monomorphiser.run()
+    return len(monomorphiser.classes), len(monomorphiser.methods)
+
+
+class _Monomorphiser:
+    def __init__(self, program, budget):
+        self.program = program
+        self.budget = budget
+        self.declared = {cls.name.value: cls for cls in program.classes}
+        excluded = {node.rhs.name.value for node in program
+                    if isinstance(node, mjast.InfixOperation) and
+                    node.operator.value == "instanceof" and
+                    isinstance(node.rhs, mjast.Variable)}
+        self.generic = {name: cls for name, cls in self.declared.items()
+                        if cls.generics and name not in excluded}
+        self.owners = {member: cls for cls in program.classes
+                       for member in itertools.chain(cls.constructors,
+                                                     cls.methods)}
+        # Copies by the instantiation (or method and generics) they are of,
+        # and what each copy of a class is of by its name.
+        self.classes = {}
+        self.methods = {}
+        self.members = {}
+        self.origins = {}
+        self.rebound = set()
+        self.pending = list(program.classes)
+
+    def run(self):
+        while self.pending:
+            self.rewrite(self.pending.pop(0))
+
+    def rewrite(self, tree):
+        """Binds the calls in the tree to copies, then renames the types."""
+        if isinstance(tree, mjast.Class) and tree.base:
+            base = self.expand(sematics.type_from_node(tree.base))
+            for constructor in tree.constructors:
+                declaration = getattr(constructor, "super_declaration", None)
+                constructor.super_declaration = self.member(base,
+                                                            declaration)
+        for node in list(tree):
+            if id(node) in self.rebound:
+                continue
+            self.rebound.add(id(node))
+            if isinstance(node, mjast.ObjectConstruction):
+                node.declaration = self.member(self.expand(node.static_type),
+                                               node.declaration)
+            elif (isinstance(node, mjast.MethodCall) and
+                    node.declaration in self.owners):
+                declaration = node.declaration
+                if not declaration.static:
+                    owner = self.owners[declaration].name.value
+                    declaration = self.member(
+                        self.instantiation(node.lhs.static_type, owner),
+                        declaration)
+                if declaration.generics:
+                    generics = self.bindings(declaration, node)
+                    if generics is not None:
+                        declaration = self.method(declaration, generics)
+                node.declaration = declaration
+        self.rename(tree)
+        for node in tree:
+            if isinstance(getattr(node, "static_type", None), tuple):
+                node.static_type = self.monotype(node.static_type)
+
+    def rename(self, node):
+        if isinstance(node, mjast.Type) and node.type:
+            type_ = sematics.type_from_node(node)
+            renamed = self.monotype(type_)
+            if renamed != type_:
+                _retype(node, renamed)
+                return
+        for child in sematics.children(node):
+            self.rename(child)
+
+    def expand(self, type_):
+        """The type with the names of copies replaced by what they are of."""
+        if not isinstance(type_, tuple) or type_[0] is None:
+            return type_
+        name, generics = type_
+        if name in self.origins:
+            return self.origins[name]
+        return name, tuple(self.expand(generic) for generic in generics)
+
+    def monotype(self, type_):
+        """The type with the instantiations it names replaced by copies."""
+        name, generics = type_ = self.expand(type_)
+        if name in self.generic and self.concrete(type_):
+            copy_ = self.instantiate(type_)
+            if copy_ is not None:
+                return copy_.name.value, ()
+        return name, tuple(self.monotype(generic) for generic in generics)
+
+    def concrete(self, type_):
+        name, generics = type_
+        return ((name in self.declared or name in mjast.primitive_types or
+                 "." in name) and
+                all(self.concrete(generic) for generic in generics))
+
+    def instantiation(self, type_, owner):
+        """The instantiation of the owner the type is, or inherits from."""
+        type_ = self.expand(type_) if isinstance(type_, tuple) else None
+        while type_ and type_[0] in self.declared:
+            if type_[0] == owner:
+                return type_ if self.concrete(type_) else None
+            cls = self.declared[type_[0]]
+            if not cls.base:
+                return None
+            replacements = {(generic.type.value, ()): argument
+                            for generic, argument in zip(cls.generics,
+                                                         type_[1])}
+            type_ = sematics.replace_generics(
+                replacements, self.expand(sematics.type_from_node(cls.base)))
+        return None
+
+    def member(self, instantiation, declaration):
+        """The copy of the constructor or method in the copy of the class for
+        the instantiation, if there is one."""
+        if (declaration not in self.owners or not instantiation or
+                instantiation[0] not in self.generic or
+                not self.concrete(instantiation) or
+                self.instantiate(instantiation) is None):
+            return declaration
+        return self.members.get((instantiation, declaration), declaration)
+
+    def instantiate(self, type_):
+        if type_ in self.classes:
+            return self.classes[type_]
+        cls = self.generic[type_[0]]
+        name = _type_name(type_)
+        cost = size(cls)
+        if cost > self.budget or name in self.origins:
+            return None
+        self.budget -= cost
+        replacements = {(generic.type.value, ()): argument
+                        for generic, argument in zip(cls.generics, type_[1])}
+        copy_ = copy.copy(cls)
+        copy_.monomorphises = type_
+        token = cls.name
+        copy_.name = Token(token.type, name, token.source, token.line,
+                           token.pos)
+        copy_.generics = []
+        copy_.base = _copy(cls.base, {}) if cls.base else None
+        copy_.fields = [_copy(field, {}) for field in cls.fields]
+        copy_.constructors = [_copy(constructor, {})
+                              for constructor in cls.constructors]
+        methods = [method for method in cls.methods if not method.static]
+        copy_.methods = [_copy(method, {}) for method in methods]
+        _substitute(copy_, replacements)
+        for member, member_copy in zip(
+                itertools.chain(cls.constructors, methods),
+                itertools.chain(copy_.constructors, copy_.methods)):
+            self.members[type_, member] = member_copy
+            self.owners[member_copy] = copy_
+        self.program.classes.append(copy_)
+        self.classes[type_] = copy_
+        self.origins[name] = type_
+        self.pending.append(copy_)
+        return copy_
+
+    def bindings(self, method, call):
+        """The concrete types the call binds the method's generics to, if it
+        binds them all consistently."""
+        generics = {(generic.type.value, ()) for generic in method.generics}
+        pairs = [(parameter.type, argument.static_type)
+                 for parameter, argument in zip(method.parameters,
+                                                call.arguments)]
+        pairs.append((method.type, call.static_type))
+        bound = {}
+        for parameter, actual in pairs:
+            if not isinstance(actual, tuple) or not parameter.type:
+                continue
+            matched = {}
+            sematics.fill_generics(
+                matched, generics,
+                self.expand(sematics.type_from_node(parameter)),
+                self.expand(actual))
+            for generic, type_ in matched.items():
+                if bound.setdefault(generic, type_) != type_:
+                    return None
+        if bound.keys() != generics or not all(
+                self.concrete(type_) for type_ in bound.values()):
+            return None
+        return tuple(sorted(bound.items()))
+
+    def method(self, method, generics):
+        key = method, generics
+        if key in self.methods:
+            return self.methods[key]
+        cost = size(method)
+        if cost > self.budget:
+            return method
+        self.budget -= cost
+        copy_ = _copy(method, {})
+        copy_.monomorphises = method
+        copy_.generics = []
+        _substitute(copy_, dict(generics))
+        owner = self.owners[method]
+        owner.methods.append(copy_)
+        self.owners[copy_] = owner
+        self.methods[key] = copy_
+        self.pending.append(copy_)
+        return copy_
+
+
+def _type_name(type_):
+    """The name of the copy of an instantiation, which can't clash with a
+    class's, as it has generics."""
+    name, generics = type_
+    name = name.rsplit(".", 1)[-1]
+    if generics:
+        return "{}<{}>".format(name, ", ".join(map(_type_name, generics)))
+    return name
+
+
+def _substitute(tree, replacements):
+    """Replaces generics in the types in a tree."""
+    for node in itertools.chain([tree], tree):
+        if isinstance(node, mjast.Type) and node.type:
+            type_ = sematics.type_from_node(node)
+            replaced = sematics.replace_generics(replacements, type_)
+            if replaced != type_:
+                _retype(node, replaced)
+        if isinstance(getattr(node, "static_type", None), tuple):
+            node.static_type = sematics.replace_generics(replacements,
+                                                         node.static_type)
+
+
+def _retype(node, type_):
+    token = node.type
+    name, generics = type_
+    node.type = Token(token.type, name, token.source, token.line, token.pos)
+    node.generics = []
+    for generic in generics:
+        part = mjast.Type(using=node.token)
+        part.type = token
+        _retype(part, generic)
+        node.generics.append(part)
+
+
+specialise_budget = 400
+
+# Literals that can stand in for a parameter of each type - an int literal
+# can't for a float, as it would change what operations on it do.
+_parameter_literals = {"int": mjast.NumberLiteral,
+                       "float": mjast.DecimalLiteral,
+                       "boolean": mjast.BooleanLiteral,
+                       "java.lang.String": mjast.StringLiteral}
+
+
+def specialise(program, budget=specialise_budget):
+    """Partial evaluation of static methods - binds calls to them with literal
+    arguments to a clone of the method with those arguments' parameters
+    replaced by the literals and folded, so branches on them are decided once.
+    Clones are shared by calls with the same literal arguments, and calls in
+    clones are specialised in turn, until the clones total budget nodes.
+    Parameters the method assigns to are left alone. Returns the number of
+    clones made."""
+    specialiser = _Specialiser(program, budget)
+    for cls in program.classes:
+        for node in itertools.chain(cls.constructors, cls.methods):
+            specialiser.calls(node)
+    return len(specialiser.clones)
+
+
+class _Specialiser:
+    def __init__(self, program, budget):
+        self.budget = budget
+        self.owners = {method: cls for cls in program.classes
+                       for method in cls.methods if method.static}
+        self.clones = {}
+        self.scope = _constant_scope()
+
+    def calls(self, node):
+        for call in [call for call in node
+                     if isinstance(call, mjast.MethodCall) and
+                     call.declaration in self.owners]:
+            clone = self.clone(call)
+            if clone is not None:
+                call.declaration = clone
+
+    def clone(self, call):
+        method = call.declaration.specialises or call.declaration
+        written = sematics.written_parameters(method)
+        constants = {
+            parameter.name.value: argument
+            for position, (parameter, argument) in enumerate(
+                zip(method.parameters, call.arguments))
+            if position not in written and isinstance(
+                argument, _parameter_literals.get(mjast.primitive_types.get(
+                    parameter.type.type.value, parameter.type.type.value),
+                    ()))}
+        if not constants:
+            return None
+        key = method, tuple(sorted(
+            (name, type(argument).__name__, argument.value.value)
+            for name, argument in constants.items()))
+        if key in self.clones:
+            return self.clones[key]
+        cost = size(method)
+        if cost > self.budget:
+            return None
+        self.budget -= cost
+        clone = copy.copy(method)
+        clone.specialises = method
+        clone.statements = [_copy(statement, {})
+                            for statement in method.statements]
+        for statement in clone.statements:
+            for variable in [node for node in statement
+                             if isinstance(node, mjast.Variable) and
+                             node.address is not None and
+                             node.name.value in constants]:
+                _replace(statement, variable,
+                         copy.copy(constants[variable.name.value]))
+        clone.statements = _fold_statements(clone.statements, self.scope)
+        cls = self.owners[method]
+        cls.methods.append(clone)
+        self.owners[clone] = cls
+        # Registered first, so recursive calls share it.
+        self.clones[key] = clone
+        self.calls(clone)
+        return clone
+
+
+inline_budget = 40
+
+
+def inline(program, budget=inline_budget):
+    """Replaces calls to small methods that can be bound at analysis time -
+    static ones, and instance methods on calls devirtualisation has shown to
+    be monomorphic - with a copy of the method's body, with its locals renamed
+    so they can live in the caller's frame. Only methods of at most budget
+    nodes that either consist of a single return, or return nothing and have
+    no return statement, are inlined, and generic ones never are. Returns the
+    number of calls inlined."""
+    bodies = {}
+    for cls in program.classes:
+        for method in cls.methods:
+            if (method.generics or (cls.generics and not method.static) or
+                    size(method) > budget):
+                continue
+            if (len(method.statements) == 1 and
+                    isinstance(method.statements[0], mjast.Return) and
+                    method.statements[0].value):
+                bodies[method] = cls, None
+            elif not method.type.type and not any(
+                    isinstance(node, mjast.Return) for node in method):
+                bodies[method] = cls, method.statements
+    counter = itertools.count()
+    inlined = 0
+    for cls in program.classes:
+        for node in itertools.chain(cls.constructors, cls.methods):
+            for call in [call for call in node
+                         if isinstance(call, mjast.MethodCall) and
+                         call.declaration in bodies and
+                         call.declaration is not node]:
+                if call.declaration.static:
+                    if (not isinstance(call.lhs, mjast.Variable) or
+                            call.lhs.address is not None):
+                        continue
+                elif not call.monomorphic:
+                    continue
+                replacement = _inline_call(call, bodies[call.declaration],
+                                           next(counter))
+                _replace(node, call, replacement)
+                inlined += 1
+    return inlined
+
+
+def _inline_call(call, body, number):
+    method = call.declaration
+    cls, statements = body
+    names = ([] if method.static else ["this"]) + [
+        parameter.name.value for parameter in method.parameters]
+    names += [node.name.value for node in method
+              if isinstance(node, mjast.LocalVariableDeclaration)]
+    names = {name: "{}@{}".format(name, number) for name in names}
+    parameters = [names[name] for name in
+                  ([] if method.static else ["this"]) +
+                  [parameter.name.value for parameter in method.parameters]]
+    if statements is None:
+        statements, value = [], _copy(method.statements[0].value, names)
+    else:
+        statements, value = [_copy(statement, names)
+                             for statement in statements], None
+    description = "{}.{}({})".format(
+        cls.name.value, method.name.value,
+        ", ".join("{} {}".format(parameter.type.type.value,
+                                 parameter.name.value)
+                  for parameter in method.parameters))
+    return mjast.Inlined(call, None if method.static else call.lhs,
+                         parameters, statements, value, description)
+
+
+def _copy(node, names):
+    """A copy of the tree, with the given locals renamed. Anything that isn't
+    part of the tree (such as the declarations calls are bound to) is
+    shared."""
+    new = copy.copy(node)
+    single, many = node._parts
+    for name in single:
+        part = getattr(node, name)
+        if isinstance(part, mjast.Node):
+            setattr(new, name, _copy(part, names))
+    for name in many:
+        setattr(new, name, [_copy(part, names)
+                            if isinstance(part, mjast.Node) else part
+                            for part in getattr(node, name)])
+    if (isinstance(new, (mjast.Variable, mjast.VariableAssignment,
+                         mjast.LocalVariableDeclaration)) and
+            new.name.value in names):
+        token = new.name
+        new.name = Token(token.type, names[token.value], token.source,
+                         token.line, token.pos)
+    return new
+
+
+def _replace(tree, old, new):
+    for node in itertools.chain([tree], tree):
+        single, many = node._parts
+        for name in single:
+            if getattr(node, name) is old:
+                setattr(node, name, new)
+                return
+        for name in many:
+            parts = getattr(node, name)
+            for index, part in enumerate(parts):
+                if part is old:
+                    parts[index] = new
+                    return
+
+
+def escape(program):
+    """Escape analysis and scalar replacement - a local initialised with a new
+    object, and only ever used to get and set its fields (directly, or as the
+    receiver of inlined methods that do the same), holds the only reference
+    to the object, so the object can't escape the method and needn't be made:
+    the local is replaced by a local for each of its fields, and the call to
+    its constructor by an inlined copy of it.
+
+    Only objects of classes without a base class or generics are replaced,
+    and only if their fields are primitives, set by the constructor before
+    anything reads them (as an object's fields start null rather than at the
+    type's default), and only ever assigned values of their own type (which,
+    unlike fields, locals check). Returns the number of objects replaced."""
+    owners = {constructor: cls for cls in program.classes
+              for constructor in cls.constructors}
+    fields = {}
+    counter = itertools.count()
+    replaced = 0
+    for cls in program.classes:
+        for node in itertools.chain(cls.constructors, cls.methods):
+            declarations = {}
+            for subnode in node:
+                if isinstance(subnode, mjast.LocalVariableDeclaration):
+                    declarations.setdefault(subnode.name.value,
+                                            []).append(subnode)
+            parameters = {parameter.name.value
+                          for parameter in node.parameters}
+            for name, found in declarations.items():
+                declaration = found[0]
+                construction = declaration.value
+                if (len(found) > 1 or name in parameters or
+                        not isinstance(construction,
+                                       mjast.ObjectConstruction) or
+                        construction.declaration not in owners):
+                    continue
+                constructor = construction.declaration
+                if constructor not in fields:
+                    fields[constructor] = _replaceable(owners[constructor],
+                                                       constructor)
+                if fields[constructor] is None:
+                    continue
+                names = _confined(node, name, fields[constructor])
+                if names is not None and _split(node, declaration, names,
+                                                owners[constructor],
+                                                next(counter)):
+                    replaced += 1
+    if replaced:
+        # Later passes tell locals from class names by their addresses.
+        sematics.address(program)
+    return replaced
+
+
+def _replaceable(cls, constructor):
+    """The types of the fields of the class, by name, if objects made by the
+    constructor can be replaced by them."""
+    fields = {field.name.value: sematics.type_from_node(field.type)
+              for field in cls.fields}
+    if (cls.base or cls.generics or constructor.super_arguments or
+            sematics.written_parameters(constructor) or
+            not all(type_[0] in mjast.primitive_types and not type_[1]
+                    for type_ in fields.values())):
+        return None
+    for node in constructor:
+        if isinstance(node, mjast.Return):
+            return None
+        elif (isinstance(node, mjast.VariableAssignment) and
+                node.address is None):
+            return None
+        elif (isinstance(node, mjast.Variable) and node.address is None and
+                not isinstance(node.static_type, str)):
+            # A field of 'this', not a class.
+            return None
+    names = _confined(constructor, "this", fields)
+    if names is None:
+        return None
+    assigned = set()
+    for statement in constructor.statements:
+        read = {node.field.value for node in itertools.chain([statement],
+                                                             statement)
+                if (isinstance(node, mjast.FieldAccess) or
+                    (isinstance(node, mjast.FieldAssignment) and
+                     node.operator.value != "=")) and
+                _named(node.lhs, names)}
+        if not read <= assigned:
+            return None
+        if (isinstance(statement, mjast.FieldAssignment) and
+                _named(statement.lhs, names)):
+            assigned.add(statement.field.value)
+    return fields if assigned == fields.keys() else None
+
+
+def _named(node, names):
+    return (isinstance(node, mjast.Variable) and node.address is not None and
+            node.name.value in names)
+
+
+def _confined(tree, name, fields):
+    """The names the object in the local is used through in the tree - the
+    local, and the 'this' of methods inlined on it - if it is only used to
+    get and set its fields, with values of their types."""
+    names, uses = {name}, set()
+    for node in tree:
+        if isinstance(node, mjast.Inlined) and _named(node.receiver, names):
+            names.add(node.parameters[0])
+            uses.add(id(node.receiver))
+        elif (isinstance(node, (mjast.FieldAccess, mjast.FieldAssignment)) and
+                _named(node.lhs, names)):
+            if (isinstance(node, mjast.FieldAssignment) and
+                    node.rhs.static_type != fields[node.field.value]):
+                return None
+            uses.add(id(node.lhs))
+    for node in tree:
+        if (isinstance(node, (mjast.Variable, mjast.VariableAssignment)) and
+                node.name.value in names and id(node) not in uses):
+            return None
+    return names
+
+
+def _split(tree, declaration, names, cls, number):
+    """Replaces the declaration of the local with the declarations of its
+    fields and the constructor, returning whether it could be."""
+    for node in itertools.chain([tree], tree):
+        for part in node._parts[1]:
+            statements = getattr(node, part)
+            if any(statement is declaration for statement in statements):
+                break
+        else:
+            continue
+        break
+    else:
+        # A for loop's setup, which there is nowhere to put the others in.
+        return False
+    local = declaration.name.value
+    scalars = {field.name.value: "{}.{}".format(local, field.name.value)
+               for field in cls.fields}
+    _scalarise(tree, names, scalars)
+    replacement = []
+    for field in cls.fields:
+        scalar = mjast.LocalVariableDeclaration(using=declaration.token)
+        scalar.type = _copy(field.type, {})
+        scalar.name = _renamed(declaration.name, scalars[field.name.value])
+        replacement.append(scalar)
+    replacement.append(_constructor(declaration.value, cls, scalars, number))
+    index = next(index for index, statement in enumerate(statements)
+                 if statement is declaration)
+    statements[index:index + 1] = replacement
+    return True
+
+
+def _constructor(construction, cls, scalars, number):
+    """The constructor inlined, setting the locals for the fields."""
+    constructor = construction.declaration
+    names = [parameter.name.value for parameter in constructor.parameters]
+    names += [node.name.value for node in constructor
+              if isinstance(node, mjast.LocalVariableDeclaration)]
+    names = {name: "{}@{}".format(name, number) for name in names}
+    description = "{}({})".format(
+        cls.name.value, ", ".join("{} {}".format(parameter.type.type.value,
+                                                 parameter.name.value)
+                                  for parameter in constructor.parameters))
+    inlined = mjast.Inlined(
+        construction, None, [names[parameter.name.value]
+                             for parameter in constructor.parameters],
+        [_copy(statement, names) for statement in constructor.statements],
+        None, description)
+    _scalarise(inlined, {"this"}, scalars)
+    return inlined
+
+
+def _scalarise(tree, names, scalars):
+    """Replaces the uses of the fields of the object used through the names
+    in the tree with the locals for them."""
+    for node in list(tree):
+        if isinstance(node, mjast.Inlined) and _named(node.receiver, names):
+            names = names | {node.parameters[0]}
+            node.receiver = None
+            node.parameters = node.parameters[1:]
+        elif isinstance(node, mjast.FieldAccess) and _named(node.lhs, names):
+            variable = copy.copy(node.lhs)
+            variable.name = _renamed(node.field, scalars[node.field.value])
+            variable.static_type = node.static_type
+            _replace(tree, node, variable)
+        elif (isinstance(node, mjast.FieldAssignment) and
+                _named(node.lhs, names)):
+            assignment = mjast.VariableAssignment(using=node.token)
+            assignment.name = _renamed(node.field, scalars[node.field.value])
+            assignment.operator = node.operator
+            assignment.value = node.rhs
+            _replace(tree, node, assignment)
+
+
+def _renamed(token, name):
+    return Token(token.type, name, token.source, token.line, token.pos)
+
+
+def loops(program):
+    """Hoists invariant expressions out of loop checks, so they are evaluated
+    once before the loop rather than every iteration; reduces multiplications
+    of a for loop's counter by a constant to an addition each iteration; and
+    evaluates repeated expressions within a statement only once. Returns the
+    number of expressions hoisted, multiplications reduced and repeats
+    eliminated.
+
+    Only checks are hoisted from, as the body may never run. Invariants must
+    be pure, and only use locals the loop doesn't assign, fields it doesn't
+    write, and collections it calls no mutating method of the same class on -
+    any impure call to a method of the program itself could do anything, so
+    rules out hoisting field accesses and collection calls."""
+    counts = [0, 0, 0]
+    for cls in program.classes:
+        for node in itertools.chain(cls.constructors, cls.methods):
+            node.statements = _loop_statements(node.statements, counts)
+    return tuple(counts)
+
+
+def _loop_statements(statements, counts):
+    optimised = []
+    for statement in statements:
+        if isinstance(statement, mjast.Conditional):
+            statement.true_case = _loop_statements(statement.true_case, counts)
+            if statement.elseif:
+                statement.elseif, = _loop_statements([statement.elseif],
+                                                     counts)
+            statement.false_case = _loop_statements(statement.false_case,
+                                                    counts)
+        elif isinstance(statement, (mjast.WhileLoop, mjast.ForLoop,
+                                    mjast.Block)):
+            statement.statements = _loop_statements(statement.statements,
+                                                    counts)
+        if isinstance(statement, (mjast.WhileLoop, mjast.ForLoop)):
+            optimised.extend(_hoist(statement, counts))
+            if isinstance(statement, mjast.ForLoop):
+                _reduce(statement, counts)
+        if isinstance(statement, (mjast.Conditional, mjast.WhileLoop,
+                                  mjast.ForLoop)):
+            _share(statement, statement.check, counts)
+        elif not isinstance(statement, (mjast.Block, mjast.Vectorised)):
+            _share(statement, statement, counts)
+        optimised.append(statement)
+    return optimised
+
+
+def _pure_call(call):
+    return (call.declaration is not None and
+            getattr(call.declaration, "pure", False))
+
+
+def _library_call(call):
+    return not isinstance(call.declaration, (type(None), mjast.Method,
+                                             mjast.Constructor))
+
+
+class _Loop:
+    """What a loop may change."""
+
+    def __init__(self, loop):
+        self.assigned = sematics.assigned([loop])
+        self.fields = set()
+        self.owners = set()
+        self.opaque = False
+        for node in loop:
+            if isinstance(node, mjast.FieldAssignment):
+                self.fields.add(node.field.value)
+            elif isinstance(node, mjast.ObjectConstruction):
+                self.opaque |= not _library_call(node)
+            elif isinstance(node, mjast.MethodCall) and not _pure_call(node):
+                if _library_call(node):
+                    self.owners.add(node.owner)
+                else:
+                    self.opaque = True
+
+    def invariant(self, node):
+        if isinstance(node, _literals):
+            return True
+        elif isinstance(node, mjast.Variable):
+            return node.address is None or node.name.value not in self.assigned
+        elif isinstance(node, mjast.OperationGroup):
+            return self.invariant(node.operation)
+        elif isinstance(node, mjast.Cast):
+            return self.invariant(node.target)
+        elif isinstance(node, (mjast.InfixOperation, mjast.PrefixOperation)):
+            return (node.operator.value in interpreter._operations and
+                    node.operator.value != "instanceof" and
+                    all(self.invariant(operand)
+                        for operand in _operands(node)))
+        elif isinstance(node, mjast.FieldAccess):
+            return (not self.opaque and node.field.value not in self.fields and
+                    self.invariant(node.lhs))
+        elif isinstance(node, mjast.MethodCall):
+            if isinstance(node.declaration, mjast.Method):
+                if not node.declaration.memoisable:
+                    return False
+            elif not (_pure_call(node) and not self.opaque and
+                      node.owner not in self.owners):
+                return False
+            return all(self.invariant(part)
+                       for part in [node.lhs] + node.arguments)
+        return False
+
+
+def _operands(node):
+    return [getattr(node, part) for part in ("lhs", "rhs")
+            if hasattr(node, part)]
+
+
+_trivial = _literals + (mjast.Variable, mjast.OperationGroup)
+
+
+def _hoist(loop, counts):
+    """Temporaries to evaluate before the loop, for the invariant parts of its
+    check."""
+    context = _Loop(loop)
+    stores = []
+    for node in list(_hoistable(loop.check, context)):
+        store = mjast.Temporary(node)
+        _replace(loop, node, mjast.TemporaryValue(store))
+        stores.append(store)
+    counts[0] += len(stores)
+    return stores
+
+
+def _hoistable(node, context):
+    if not isinstance(node, _trivial) and context.invariant(node):
+        yield node
+    elif isinstance(node, mjast.TernaryOperation):
+        # Only the condition is certain to be evaluated.
+        yield from _hoistable(node.lhs, context)
+    else:
+        for child in sematics.children(node):
+            yield from _hoistable(child, context)
+
+
+def _reduce(loop, counts):
+    """Keeps 'counter * constant' in a temporary for the loop, stepped along
+    with the counter, if the counter is an int only the iteration changes."""
+    setup = loop.setup
+    if (not isinstance(setup, mjast.LocalVariableDeclaration) or
+            setup.type.type.value != "int"):
+        return
+    counter = setup.name.value
+    step = sematics.step(loop.iteration, counter)
+    if step is None or counter in sematics.assigned([loop.check] +
+                                                    loop.statements):
+        return
+    products = {}
+    for node in itertools.chain.from_iterable(
+            itertools.chain([node], node)
+            for node in [loop.check] + loop.statements):
+        if (isinstance(node, mjast.InfixOperation) and
+                node.operator.value == "*"):
+            operands = node.lhs, node.rhs
+            if (isinstance(node.rhs, mjast.Variable) and
+                    isinstance(node.lhs, mjast.NumberLiteral)):
+                operands = node.rhs, node.lhs
+            variable, constant = operands
+            if (isinstance(variable, mjast.Variable) and
+                    variable.name.value == counter and
+                    isinstance(constant, mjast.NumberLiteral)):
+                products.setdefault(int(constant.value.value),
+                                    []).append(node)
+    reductions, steps = list(loop.reductions), list(loop.steps)
+    for constant, nodes in products.items():
+        store = mjast.Temporary(nodes[0])
+        for node in nodes:
+            _replace(loop, node, mjast.TemporaryValue(store))
+        reductions.append(store)
+        steps.append(mjast.TemporaryIncrement(store, step * constant))
+        counts[1] += len(nodes)
+    loop.reductions, loop.steps = reductions, steps
+
+
+def _share(statement, root, counts):
+    """Common subexpression elimination within an expression, for repeated
+    pure expressions - as long as nothing in it can change their values
+    between the first being evaluated and the others."""
+    for node in itertools.chain([root], root):
+        if (isinstance(node, (mjast.ObjectConstruction, mjast.Inlined)) or
+                (isinstance(node, mjast.MethodCall) and
+                 not _pure_call(node)) or
+                (isinstance(node, (mjast.PrefixOperation,
+                                   mjast.PostfixOperation)) and
+                 node.operator.value in ("++", "--"))):
+            return
+    while True:
+        occurrences = {}
+        for node in _evaluated(root):
+            key = _key(node)
+            if key is not None and not isinstance(node, _trivial):
+                occurrences.setdefault(key, []).append(node)
+        repeated = [nodes for nodes in occurrences.values() if len(nodes) > 1]
+        if not repeated:
+            return
+        first, *rest = max(repeated, key=lambda nodes: size(nodes[0]))
+        store = mjast.Temporary(first)
+        _replace(statement, first, store)
+        for node in rest:
+            _replace(statement, node, mjast.TemporaryValue(store))
+        counts[2] += len(rest)
+
+
+def _evaluated(node):
+    """The nodes of the tree that are certain to be evaluated, in the order
+    they are."""
+    yield node
+    if isinstance(node, mjast.TernaryOperation):
+        yield from _evaluated(node.lhs)
+    else:
+        for child in sematics.children(node):
+            yield from _evaluated(child)
+
+
+def _key(node):
+    """Equal for expressions that are the same, None if unsupported."""
+    if isinstance(node, _literals):
+        return type(node).__name__, node.value.value
+    elif isinstance(node, mjast.Variable):
+        return "variable", node.name.value
+    elif isinstance(node, mjast.OperationGroup):
+        return _key(node.operation)
+    elif isinstance(node, mjast.FieldAccess):
+        parts = [node.lhs]
+    elif (isinstance(node, (mjast.InfixOperation, mjast.PrefixOperation)) and
+            node.operator.value in interpreter._operations):
+        parts = _operands(node)
+    elif isinstance(node, mjast.MethodCall) and _pure_call(node):
+        parts = [node.lhs] + node.arguments
+    else:
+        return None
+    keys = tuple(_key(part) for part in parts)
+    if None in keys:
+        return None
+    label = (node.field.value if isinstance(node, mjast.FieldAccess) else
+             id(node.declaration) if isinstance(node, mjast.MethodCall) else
+             node.operator.value)
+    return type(node).__name__, label, keys
+
+
+# The passes, in the order they run - each with the lowest level it runs at,
+# and what the number (or numbers) it returns count.
+tree_passes = [
+    ("fold", 1, fold, "nodes removed by constant folding"),
+    ("monomorphise", 2, monomorphise, ("generic classes monomorphised",
+                                       "generic methods monomorphised")),
+    ("specialise", 2, specialise, "methods specialised"),
+    ("inline", 2, inline, "calls inlined"),
+    ("escape", 2, escape, "objects replaced by their fields"),
+    ("vectorise", 3, vectorise.vectorise, "loops vectorised"),
+    ("loops", 3, loops, ("loop invariants hoisted",
+                         "multiplications strength reduced",
+                         "common subexpressions eliminated")),
+]
+
+ir_passes = [
+    ("simplify", 1, ir.simplify,
+     "blocks removed by control flow simplification"),
+    ("dead code", 2, ir.dead_code, "dead instructions removed"),
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    args = argparse.ArgumentParser(
+        description='Optimise Middleweight Java Code.')
+    args.add_argument('file', metavar='FILE', type=argparse.FileType('r'),
+                      default=sys.stdin, help='The source code to optimise.')
+    args.add_argument('-O', dest='level', type=int, choices=range(4),
+                      default=default_level,
+                      help='The optimisation level (default: {}).'.format(
+                          default_level))
+
+    args = args.parse_args()
+    program = parse_handling_errors(args.file)
+    sematics.analyse_handling_errors(program)
+    for name, value in optimise(program, args.level).items():
+        print("{}: {}.".format(name.capitalize(), value))
+    print("\n".join(program.tree()))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Runs programs a slice at a time - their bytecode run by the virtual
+machine as a generator, pausing after every slice of instructions - so many
+of them can share one thread, each running a slice in turn, without threads
+of their own.
+
+As coroutines, any number of programs can be scheduled fairly in an asyncio
+event loop alongside other tasks, each printing to an output of its own."""
+
+import asyncio
+import io
+import sys
+import traceback
+
+import bytecode
+import interpreter
+import optimiser
+import sematics
+from exceptions import InterpreterException
+
+from parser import parse_handling_errors
+
+
+default_slice = 1000
+
+
+def prepare(program):
+    """Compiles an analysed program to bytecode for it to be stepped."""
+    bytecode.install(bytecode.compile_program(program))
+
+
+def steps(program, name, slice=default_slice, output=None, memoise=None,
+          depth=None, quota=None):
+    """A generator running a prepared program (as interpreter.interpret
+    does, printing to output if given), yielding after every slice of
+    instructions of its bytecode, and returning the memo if memoising."""
+    main, scope = interpreter.load(program, name, memoise, depth, quota)
+    scope.stack.output = output
+    method = main.lookup_method("main", (), scope, call=program)
+    context = method.frame(method.cls, None, (), scope, call=program)
+    try:
+        if context is None:
+            # Memoised, or not compiled, it can only be run all at once.
+            method.run(method.cls, None, (), scope, call=program)
+        else:
+            yield from bytecode.steps(method.declaration.bytecode, context,
+                                      slice)
+            context.stack.exit()
+    except RecursionError:
+        # Constructors and library methods still recurse in Python.
+        raise scope.stack.overflow(scope.stack.current.call.token) from None
+    return scope.stack.memo
+
+
+async def run(program, name, slice=default_slice, output=None, memoise=None,
+              depth=None, quota=None):
+    """Runs a prepared program as steps does, letting the event loop run
+    other tasks between each slice, returning the memo if memoising."""
+    stepping = steps(program, name, slice, output, memoise, depth, quota)
+    while True:
+        try:
+            next(stepping)
+        except StopIteration as e:
+            return e.value
+        await asyncio.sleep(0)
+
+
+async def run_all(programs, slice=default_slice, limits=None):
+    """Runs prepared programs (pairs of a program and its name)
+    concurrently, returning what each printed - its traceback included, if
+    it failed, which leaves the others running. If limits are given (the
+    arguments of an interpreter.Quota), each program has a quota of its own
+    with them, its time counted from when it starts."""
+    outputs = [io.StringIO() for _ in programs]
+
+    async def run_one(program, name, output):
+        quota = interpreter.Quota(**limits) if limits else None
+        try:
+            await run(program, name, slice, output, quota=quota)
+        except InterpreterException as e:
+            e.print_traceback(output)
+        except Exception:
+            traceback.print_exc(file=output)
+
+    await asyncio.gather(*(run_one(program, name, output)
+                           for (program, name), output
+                           in zip(programs, outputs)))
+    return [output.getvalue() for output in outputs]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    args = argparse.ArgumentParser(
+        description='Run Middleweight Java programs concurrently, a slice '
+                    'at a time.')
+    args.add_argument('files', metavar='FILE', nargs='+',
+                      type=argparse.FileType('r'),
+                      help='The source code to run.')
+    args.add_argument('--slice', metavar='COUNT', type=int,
+                      default=default_slice,
+                      help='How many instructions each program runs before '
+                           'the next has a turn (default: {}).'.format(
+                               default_slice))
+    args.add_argument('--max-steps', metavar='COUNT', type=int,
+                      help='Stop each program once it has made more than '
+                           'COUNT calls and loop iterations.')
+    args.add_argument('--max-heap', metavar='CELLS', type=int,
+                      help='Stop each program if its objects and lists '
+                           'would hold more than CELLS fields and items at '
+                           'once.')
+    args.add_argument('--timeout', metavar='SECONDS', type=float,
+                      help='Stop each program once it has run for SECONDS.')
+    args.add_argument('-O', dest='level', type=int, choices=range(4),
+                      default=optimiser.default_level,
+                      help='The optimisation level (default: {}).'.format(
+                          optimiser.default_level))
+
+    args = args.parse_args()
+
+    programs = []
+    for file in args.files:
+        program = parse_handling_errors(file)
+        sematics.analyse_handling_errors(program)
+        optimiser.PassManager(args.level).run(program)
+        prepare(program)
+        programs.append((program, file.name))
+    limits = {name: value for name, value in (
+        ("steps", args.max_steps), ("heap", args.max_heap),
+        ("seconds", args.timeout)) if value is not None}
+    outputs = asyncio.run(run_all(programs, args.slice, limits))
+    for (_, name), output in zip(programs, outputs):
+        print("==> {} <==".format(name))
+        sys.stdout.write(output)
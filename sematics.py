@@ -5,6 +5,7 @@
 makes sense semantically."""
 
 import sys
+import itertools
 import exceptions
 import library
 import mjast
@@ -72,7 +73,22 @@ def analyse(program, main=True):
 
     shunting_yard(program)
 
-    consistency_check(program, types, stdlib)
+    class_info = consistency_check(program, types, stdlib)
+
+    devirtualise(program, class_info)
+
+    parameter_writes(program, class_info)
+
+    purity(program)
+
+    address(program)
+
+    eliminated, checks = nullness(program)
+
+    marked, loops = counted(program)
+
+    return {"null checks eliminated": "{} of {}".format(eliminated, checks),
+            "counted for loops": "{} of {}".format(marked, loops)}
 
 
 operator_precedence = {
@@ -141,7 +157,7 @@ def consistency_check(program, global_types, stdlib):
         "fields": {field.name.value: type_from_node(field.type)
                    for field in cls.fields},
         "constructors": {tuple(type_from_node(p.type)
-                               for p in constructor.parameters)
+                               for p in constructor.parameters): constructor
                          for constructor in cls.constructors},
         "methods": {(tuple(type_from_node(g) for g in method.generics),
                      method.name.value,
@@ -156,8 +172,19 @@ def consistency_check(program, global_types, stdlib):
                            for method in cls.methods if method.static},
         "generics": [type_from_node(g) for g in cls.generics],
         "base": type_from_node(cls.base) if cls.base else ("java.lang.Object",
-                                                           ())
+                                                           ()),
+        "declarations": {(tuple(type_from_node(g) for g in method.generics),
+                          method.name.value,
+                          tuple(type_from_node(p.type)
+                                for p in method.parameters)): method
+                         for method in cls.methods},
     } for cls in program.classes}
+    for cls in program.classes:
+        info = class_info[cls.name.value]
+        erased = {g for g, _ in info["generics"]}
+        for (mg, name, parameters), method in info["declarations"].items():
+            method.signature = signature(name, parameters,
+                                         erased | {g for g, _ in mg})
     for cls in program.classes:
         generics = [generic.type.value for generic in cls.generics]
         cls_type = cls.name.value, tuple((generic, ())
@@ -170,6 +197,12 @@ def consistency_check(program, global_types, stdlib):
                            for p in constructor.parameters)
             locals_.update({"this": cls_type})
             expected_return = None
+            arguments = [check_expression(locals_, generics, class_info,
+                                          stdlib, global_types, a)
+                         for a in constructor.super_arguments]
+            base = class_info[cls.name.value]["base"]
+            constructor.super_declaration = resolve_constructor(
+                base, arguments, class_info, stdlib, constructor.token, True)
             check_statements(constructor.statements, locals_, expected_return,
                              generics, class_info, stdlib, global_types)
         for method in cls.methods:
@@ -195,6 +228,340 @@ def consistency_check(program, global_types, stdlib):
                         "Method has no return statement and non-void return "
                         "type '{}'.".format(type_str(expected_return)),
                         token.source, token.line, token.pos)
+    return class_info
+
+
+def devirtualise(program, class_info):
+    """Class hierarchy analysis - marks calls whose target no class in the
+    program overrides for the receiver's type, so they can be bound directly
+    rather than dispatched on the receiver's runtime class."""
+    subclasses = {}
+    for name, info in class_info.items():
+        subclasses.setdefault(info["base"][0], set()).add(name)
+    signatures = {cls.name.value: {method.signature for method in cls.methods
+                                   if not method.static}
+                  for cls in program.classes}
+    for node in program:
+        if isinstance(node, mjast.MethodCall) and node.declaration is not None:
+            overridden = False
+            if not node.declaration.static:
+                signature = node.declaration.signature
+                pending = list(subclasses.get(node.receiver, ()))
+                while pending and not overridden:
+                    name = pending.pop()
+                    overridden = signature in signatures[name]
+                    pending.extend(subclasses.get(name, ()))
+            node.monomorphic = not overridden
+
+
+def purity(program):
+    """Marks static methods that are pure - that write no fields, do no I/O,
+    don't mutate their arguments and only call pure methods - and which of
+    those take and return only primitives and Strings, so their results can
+    be memoised. Recursive methods are pure unless shown otherwise."""
+    candidates = {method for cls in program.classes for method in cls.methods
+                  if method.static}
+    changed = True
+    while changed:
+        changed = False
+        for method in list(candidates):
+            if not _pure(method, candidates):
+                candidates.remove(method)
+                changed = True
+    for method in candidates:
+        method.pure = True
+        method.memoisable = method.type.type is not None and all(
+            _memoisable(type_) for type_ in
+            [method.type] + [parameter.type
+                             for parameter in method.parameters])
+
+
+def _pure(method, pure):
+    # Arguments share their variables with the caller.
+    if written_parameters(method):
+        return False
+    for node in method:
+        if isinstance(node, (mjast.FieldAssignment, mjast.ObjectConstruction)):
+            return False
+        elif isinstance(node, mjast.MethodCall):
+            if isinstance(node.declaration, mjast.Method):
+                if node.declaration not in pure:
+                    return False
+            elif not getattr(node.declaration, "pure", False):
+                return False
+    return True
+
+
+def parameter_writes(program, class_info):
+    """Marks the positions of the parameters of each method and constructor
+    that calling it may assign to. As arguments share their variables with
+    the caller, those are the parameters its body assigns, those it passes on
+    to parameters of a method or constructor that may assign them, and for an
+    instance method, those of any method overriding it that may."""
+    subclasses = {}
+    for name, info in class_info.items():
+        subclasses.setdefault(info["base"][0], set()).add(name)
+    classes = {cls.name.value: cls for cls in program.classes}
+    overriding = {}
+    for cls in program.classes:
+        for method in cls.methods:
+            if method.static:
+                continue
+            overriding[method] = []
+            pending = list(subclasses.get(cls.name.value, ()))
+            while pending:
+                name = pending.pop()
+                overriding[method].extend(
+                    other for other in classes[name].methods
+                    if not other.static and
+                    other.signature == method.signature)
+                pending.extend(subclasses.get(name, ()))
+    written = {node: _assigned_parameters(node) for cls in program.classes
+               for node in itertools.chain(cls.constructors, cls.methods)}
+    changed = True
+    while changed:
+        changed = False
+        for node, positions in written.items():
+            found = set(positions)
+            for other in overriding.get(node, ()):
+                found |= written[other]
+            parameters = [parameter.name.value
+                          for parameter in node.parameters]
+            for call in node:
+                if (isinstance(call, (mjast.MethodCall,
+                                      mjast.ObjectConstruction)) and
+                        call.declaration in written):
+                    found.update(
+                        parameters.index(argument.name.value)
+                        for position, argument in enumerate(call.arguments)
+                        if position in written[call.declaration] and
+                        isinstance(argument, mjast.Variable) and
+                        argument.name.value in parameters)
+            if found != positions:
+                written[node] = found
+                changed = True
+    for node, positions in written.items():
+        node.written = positions
+
+
+def written_parameters(node):
+    """The positions of the parameters of a method or constructor that
+    calling it may assign to - as parameter_writes found, if it has run, or
+    else those its body assigns."""
+    if node.written is not None:
+        return node.written
+    return _assigned_parameters(node)
+
+
+def _assigned_parameters(node):
+    parameters = [parameter.name.value for parameter in node.parameters]
+    written = set()
+    for subnode in node:
+        if isinstance(subnode, mjast.VariableAssignment):
+            target = subnode.name.value
+        elif (isinstance(subnode, (mjast.PrefixOperation,
+                                   mjast.PostfixOperation)) and
+                subnode.operator.value in ("++", "--")):
+            target = (subnode.lhs if isinstance(subnode,
+                                                mjast.PostfixOperation)
+                      else subnode.rhs)
+            if not isinstance(target, mjast.Variable):
+                continue
+            target = target.name.value
+        else:
+            continue
+        if target in parameters:
+            written.add(parameters.index(target))
+    return written
+
+
+def assigned(nodes):
+    """The names of the locals the nodes may assign to."""
+    assigned = set()
+    for node in itertools.chain.from_iterable(
+            itertools.chain([node], node) for node in nodes):
+        if isinstance(node, (mjast.LocalVariableDeclaration,
+                             mjast.VariableAssignment)):
+            assigned.add(node.name.value)
+        elif isinstance(node, mjast.Inlined):
+            assigned.update(node.parameters)
+        elif (isinstance(node, (mjast.PrefixOperation,
+                                mjast.PostfixOperation)) and
+                node.operator.value in ("++", "--")):
+            target = (node.lhs if isinstance(node, mjast.PostfixOperation)
+                      else node.rhs)
+            if isinstance(target, mjast.Variable):
+                assigned.add(target.name.value)
+        call = node.call if isinstance(node, mjast.Inlined) else node
+        if (isinstance(call, (mjast.MethodCall, mjast.ObjectConstruction)) and
+                isinstance(call.declaration, (mjast.Method,
+                                              mjast.Constructor))):
+            # Arguments share their variables with the caller (or with the
+            # parameters of the body inlined in place of the call).
+            written = written_parameters(call.declaration)
+            assigned.update(argument.name.value for position, argument
+                            in enumerate(call.arguments)
+                            if position in written and
+                            isinstance(argument, mjast.Variable))
+    return assigned
+
+
+def step(iteration, counter):
+    """The constant a for loop's iteration adds to its counter, or None if it
+    doesn't just do that."""
+    if (isinstance(iteration, (mjast.PrefixOperation,
+                               mjast.PostfixOperation)) and
+            iteration.operator.value in ("++", "--")):
+        target = (iteration.lhs if isinstance(iteration,
+                                              mjast.PostfixOperation)
+                  else iteration.rhs)
+        if isinstance(target, mjast.Variable) and target.name.value == counter:
+            return 1 if iteration.operator.value == "++" else -1
+    elif (isinstance(iteration, mjast.VariableAssignment) and
+            iteration.name.value == counter and
+            iteration.operator.value in ("+=", "-=") and
+            isinstance(iteration.value, mjast.NumberLiteral)):
+        step = int(iteration.value.value.value)
+        return step if iteration.operator.value == "+=" else -step
+    return None
+
+
+def _memoisable(type_):
+    return not type_.generics and type_.type.value in (
+        set(mjast.default_primitive_values) | {"java.lang.String"})
+
+
+def nullness(program):
+    """Nullness analysis - marks method calls whose receiver can't be null, so
+    the interpreter needn't check it: 'this', class names, new objects, and
+    local variables that have been assigned one of those or already
+    dereferenced and can't have changed since. Returns how many calls were
+    marked, and how many there are."""
+    writes = {}
+    counts = [0, 0]
+    for cls in program.classes:
+        for constructor in cls.constructors:
+            facts = {"this"}
+            for argument in constructor.super_arguments:
+                _nullness_expression(argument, facts, writes, counts)
+            _nullness_statements(constructor.statements, facts, writes, counts)
+        for method in cls.methods:
+            _nullness_statements(method.statements,
+                                 set() if method.static else {"this"}, writes,
+                                 counts)
+    return tuple(counts)
+
+
+def _non_null(expression, facts):
+    while isinstance(expression, (mjast.OperationGroup, mjast.Cast)):
+        expression = (expression.operation
+                      if isinstance(expression, mjast.OperationGroup)
+                      else expression.target)
+    if isinstance(expression, mjast.Variable):
+        return (expression.address is None or
+                expression.name.value in facts)
+    return isinstance(expression, (mjast.ObjectConstruction,
+                                   mjast.StringLiteral))
+
+
+def _aliased(node, writes):
+    """Local variables passed to parameters the callee may assign to, which
+    (as arguments share the caller's variables) may change them."""
+    if not isinstance(node.declaration, (mjast.Method, mjast.Constructor)):
+        return set()
+    if node.declaration not in writes:
+        writes[node.declaration] = written_parameters(node.declaration)
+    return {argument.name.value
+            for position, argument in enumerate(node.arguments)
+            if position in writes[node.declaration] and
+            isinstance(argument, mjast.Variable)}
+
+
+def _nullness_statements(statements, facts, writes, counts):
+    for statement in statements:
+        _nullness_statement(statement, facts, writes, counts)
+    return facts
+
+
+def _nullness_statement(statement, facts, writes, counts):
+    if isinstance(statement, (mjast.LocalVariableDeclaration,
+                              mjast.VariableAssignment)):
+        if statement.value:
+            _nullness_expression(statement.value, facts, writes, counts)
+        facts.discard(statement.name.value)
+        if (statement.value and _non_null(statement.value, facts) and
+                getattr(statement, "operator", None) is not None and
+                statement.operator.value == "="):
+            facts.add(statement.name.value)
+    elif isinstance(statement, mjast.Conditional):
+        _nullness_expression(statement.check, facts, writes, counts)
+        true = _nullness_statements(statement.true_case, set(facts), writes,
+                                    counts)
+        false = _nullness_statements(
+            [statement.elseif] if statement.elseif else statement.false_case,
+            set(facts), writes, counts)
+        facts &= true & false
+    elif isinstance(statement, (mjast.WhileLoop, mjast.ForLoop)):
+        # Only what no iteration can undo holds at the head of the loop.
+        if isinstance(statement, mjast.ForLoop):
+            _nullness_statement(statement.setup, facts, writes, counts)
+        facts -= _assigned(statement, writes)
+        _nullness_expression(statement.check, facts, writes, counts)
+        body = statement.statements
+        if isinstance(statement, mjast.ForLoop):
+            body = body + [statement.iteration]
+        _nullness_statements(body, set(facts), writes, counts)
+    elif isinstance(statement, mjast.Block):
+        _nullness_statements(statement.statements, facts, writes, counts)
+    else:
+        _nullness_expression(statement, facts, writes, counts)
+
+
+def _assigned(node, writes):
+    assigned = set()
+    for subnode in node:
+        if isinstance(subnode, (mjast.LocalVariableDeclaration,
+                                mjast.VariableAssignment)):
+            assigned.add(subnode.name.value)
+        elif isinstance(subnode, (mjast.MethodCall,
+                                  mjast.ObjectConstruction)):
+            assigned |= _aliased(subnode, writes)
+    return assigned
+
+
+def _nullness_expression(expression, facts, writes, counts):
+    if isinstance(expression, mjast.MethodCall):
+        _nullness_expression(expression.lhs, facts, writes, counts)
+        expression.nonnull = _non_null(expression.lhs, facts)
+        counts[0] += expression.nonnull
+        counts[1] += 1
+        for argument in expression.arguments:
+            _nullness_expression(argument, facts, writes, counts)
+        if isinstance(expression.lhs, mjast.Variable):
+            facts.add(expression.lhs.name.value)
+        facts -= _aliased(expression, writes)
+    elif isinstance(expression, mjast.ObjectConstruction):
+        for argument in expression.arguments:
+            _nullness_expression(argument, facts, writes, counts)
+        facts -= _aliased(expression, writes)
+    elif (isinstance(expression, mjast.InfixOperation) and
+            expression.operator.value in ("&&", "||")):
+        _nullness_expression(expression.lhs, facts, writes, counts)
+        before = set(facts)
+        _nullness_expression(expression.rhs, facts, writes, counts)
+        facts &= before
+    elif isinstance(expression, mjast.TernaryOperation):
+        _nullness_expression(expression.lhs, facts, writes, counts)
+        true = set(facts)
+        _nullness_expression(expression.true_case, true, writes, counts)
+        _nullness_expression(expression.false_case, facts, writes, counts)
+        facts &= true
+    else:
+        for part in children(expression):
+            _nullness_expression(part, facts, writes, counts)
+        if (isinstance(expression, (mjast.FieldAccess, mjast.FieldAssignment))
+                and isinstance(expression.lhs, mjast.Variable)):
+            facts.add(expression.lhs.name.value)
 
 
 def local_variable_declaration(statement, token, locals_, generics, class_info,
@@ -233,6 +600,13 @@ def generic_name(type_):
     return (type_.name, ()) if isinstance(type_, classes.Generic) else type_
 
 
+def signature(name, parameters, generics):
+    """The key an overriding method must share with the method it overrides -
+    generic parameters are erased to Object."""
+    return name, tuple("java.lang.Object" if p in generics else p
+                       for p, _ in parameters)
+
+
 def method_call(statement, token, locals_, generics, class_info, stdlib,
                 global_types, expected_return=None):
     actual = check_expression(locals_, generics, class_info, stdlib,
@@ -246,6 +620,9 @@ def method_call(statement, token, locals_, generics, class_info, stdlib,
                                   global_types, a)
                  for a in statement.arguments]
     _, cls_generics = actual
+    # Every overload that could take the arguments, those overridden left
+    # out - the class's own found first, so it is the one kept.
+    candidates = {}
     for cls_name, _ in resolve_mro(actual, generics, class_info, stdlib, token):
         if cls_name in class_info:
             info = class_info[cls_name]
@@ -254,19 +631,26 @@ def method_call(statement, token, locals_, generics, class_info, stdlib,
                 methods = info["static_methods"]
             else:
                 methods = info["methods"]
+            declarations = info["declarations"]
         else:
             cls = get_stdlib_class(cls_name, stdlib, token)
             call_generics = [(g, ()) for g in cls.generics]
-            tmp = ((m, getattr(cls, m)) for m in cls.methods)
+            tmp = [(m, getattr(cls, m)) for m in cls.methods]
             methods = {((), m, tuple(map(generic_name, f.types))):
                        generic_name(f.return_type)
                        for m, f in tmp if f.static == static}
+            declarations = {((), m, tuple(map(generic_name, f.types))): f
+                            for m, f in tmp}
+            for (_, m, parameters), f in declarations.items():
+                f.signature = signature(m, parameters, set(cls.generics))
         generics_replacement = dict(zip(call_generics, cls_generics))
         methods = {(mg, tuple(replace_generics(generics_replacement, p)
                               for p in m)):
-                   return_type for (mg, n, m), return_type in methods.items()
+                   (return_type, declarations[mg, n, m])
+                   for (mg, n, m), return_type in methods.items()
                    if n == name}
-        for (method_generics, parameters), return_type in methods.items():
+        for ((method_generics, parameters),
+             (return_type, declaration)) in methods.items():
             if len(parameters) == len(arguments):
                 matched_mg = dict(generics_replacement)
                 for p, a in zip(parameters, arguments):
@@ -275,12 +659,37 @@ def method_call(statement, token, locals_, generics, class_info, stdlib,
                               for p in parameters]
                 if check_arguments(parameters, arguments, generics, class_info,
                                    stdlib):
-                    return replace_generics(matched_mg, return_type)
-    raise exceptions.SanityException(
-        "No method '{}.{}({})'.".format(
-            type_str(actual), name, ", ".join(type_str(a)
-                                              for a in arguments)),
-        token.source, token.line, token.pos)
+                    candidates.setdefault(tuple(parameters), (
+                        declaration, cls_name,
+                        replace_generics(matched_mg, return_type)))
+    description = "{}.{}({})".format(
+        type_str(actual), name, ", ".join(type_str(a) for a in arguments))
+    if not candidates:
+        raise exceptions.SanityException(
+            "No method '{}'.".format(description),
+            token.source, token.line, token.pos)
+    declaration, owner, return_type = candidates[most_specific(
+        candidates, generics, class_info, stdlib, token, description)]
+    statement.declaration = declaration
+    statement.owner = owner
+    statement.receiver = actual[0]
+    return return_type
+
+
+def most_specific(candidates, generics, class_info, stdlib, token,
+                  description):
+    """The parameters of the overload to bind a call to - as in Java, the
+    most specific, whose parameters every other overload could take as its
+    arguments - raising if there isn't just one."""
+    best = [parameters for parameters in candidates
+            if all(check_arguments(other, parameters, generics, class_info,
+                                   stdlib)
+                   for other in candidates)]
+    if len(best) != 1:
+        raise exceptions.SanityException(
+            "Ambiguous call '{}'.".format(description),
+            token.source, token.line, token.pos)
+    return best[0]
 
 
 def fill_generics(matched_mg, method_generics, p, a):
@@ -307,29 +716,44 @@ def replace_generics(replacements, type_):
 def object_construction(expression, token, locals_, generics, class_info,
                         stdlib, global_types, expected_return=None):
     actual = type_from_node(expression.type, class_info, stdlib, generics)
-    a_name, a_generics = actual
     arguments = [check_expression(locals_, generics, class_info, stdlib,
                                   global_types, a)
                  for a in expression.arguments]
+    expression.declaration = resolve_constructor(actual, arguments, class_info,
+                                                 stdlib, token)
+    expression.owner = actual[0]
+    return actual
+
+
+def resolve_constructor(actual, arguments, class_info, stdlib, token,
+                        implicit=False):
+    a_name, a_generics = actual
     if a_name in class_info:
         info = class_info[a_name]
         generics = info["generics"]
-        constructors = info["constructors"]
+        constructors = info["constructors"].items()
     else:
         cls = get_stdlib_class(a_name, stdlib, token)
         generics = [(g, ()) for g in cls.generics]
-        constructors = [getattr(cls, c).types for c in cls.constructors]
+        constructors = [(getattr(cls, c).types, getattr(cls, c))
+                        for c in cls.constructors]
+    if implicit and not constructors and not arguments:
+        return None
     generics = dict(zip(generics, a_generics))
-    constructors = [tuple(replace_generics(generics, p) for p in c)
-                    for c in constructors]
-    if not any(check_arguments(constructor, arguments,
-                               generics, class_info, stdlib)
-               for constructor in constructors):
+    candidates = {}
+    for parameters, declaration in constructors:
+        parameters = tuple(replace_generics(generics, p) for p in parameters)
+        if check_arguments(parameters, arguments, generics, class_info,
+                           stdlib):
+            candidates.setdefault(parameters, declaration)
+    description = "{}({})".format(type_str(actual), ", ".join(
+        type_str(a) for a in arguments))
+    if not candidates:
         raise exceptions.SanityException(
-            "No constructor '{}({})'.".format(type_str(actual), ", ".join(
-                type_str(a) for a in arguments)),
+            "No constructor '{}'.".format(description),
             token.source, token.line, token.pos)
-    return actual
+    return candidates[most_specific(candidates, generics, class_info, stdlib,
+                                    token, description)]
 
 
 def for_loop(statement, token, locals_, generics, class_info, stdlib,
@@ -482,6 +906,7 @@ def field_assignment(statement, token, locals_, generics, class_info, stdlib,
                               global_types, statement.rhs)
     cls_name, cls_generics = lhs
     name = statement.field.value
+    statement.owner = cls_name
     if cls_name in class_info:
         info = class_info[cls_name]
         try:
@@ -558,6 +983,7 @@ def field_access(expression, token, locals_, generics, class_info, stdlib,
         static = True
     cls_name, cls_generics = actual
     name = expression.field.value
+    expression.owner = cls_name
     if cls_name in class_info:
         info = class_info[cls_name]
         try:
@@ -634,6 +1060,7 @@ def check_expression(locals_, generics, class_info, stdlib, global_types,
     actual = expression_handlers[type(expression)](expression, token, locals_,
                                                    generics, class_info, stdlib,
                                                    global_types)
+    expression.static_type = actual
     if expected:
         type_check(actual, expected, generics, class_info, stdlib, token)
     else:
@@ -816,6 +1243,260 @@ def _star_resolve(stdlib, parts, types):
         types[name] = "{}.{}".format(cls.parent, name)
 
 
+def address(program):
+    """Lexical addressing - resolves each local variable (including parameters
+    and 'this') to a (depth, slot) address, depth being the level of the
+    frame it lives in (0 being the method's own frame, each nested statement
+    that declares locals of its own adding one) and slot its index in that
+    frame, and each field to an offset into the fields of its object. Names
+    that aren't locals are left unaddressed, as they are class names.
+
+    Loops, conditionals and blocks that declare no locals are given no layout,
+    and run in the enclosing frame.
+
+    This needs re-running if the tree is changed after analysis."""
+    classes_ = {cls.name.value: cls for cls in program.classes}
+    layouts = {name: field_layout(name, classes_) for name in classes_}
+    for cls in program.classes:
+        for constructor in cls.constructors:
+            _address_frame(constructor, True, constructor.super_arguments +
+                           constructor.statements, layouts)
+        for method in cls.methods:
+            _address_frame(method, not method.static, method.statements,
+                           layouts)
+
+
+def counted(program):
+    """Marks for loops of the canonical counted shape with the constant their
+    counter steps by - those whose setup declares an int counter, whose check
+    compares it against a bound the loop can't change and whose iteration
+    alone changes it - so the interpreter can keep the counter as a Python
+    int and evaluate the bound once. Returns how many loops were marked, and
+    how many there are.
+
+    This needs re-running if the tree is changed after analysis."""
+    counts = [0, 0]
+    for cls in program.classes:
+        for node in itertools.chain(cls.constructors, cls.methods):
+            for loop in node:
+                if isinstance(loop, mjast.ForLoop):
+                    loop.counted = _counted(loop)
+                    counts[0] += loop.counted is not None
+                    counts[1] += 1
+    return counts
+
+
+def _counted(loop):
+    setup, check = loop.setup, loop.check
+    if (not isinstance(setup, mjast.LocalVariableDeclaration) or
+            setup.type.type.value != "int" or
+            not isinstance(check, mjast.InfixOperation) or
+            check.operator.value not in ("<", "<=", ">", ">=") or
+            not isinstance(check.lhs, mjast.Variable) or
+            check.lhs.name.value != setup.name.value):
+        return None
+    counter, bound = setup.name.value, check.rhs
+    written = assigned([check] + loop.statements)
+    if counter in written:
+        return None
+    if isinstance(bound, mjast.Variable):
+        if bound.name.value in written or bound.name.value == counter:
+            return None
+    elif isinstance(bound, mjast.TemporaryValue):
+        # Reductions are stepped along with the counter.
+        if bound.source in loop.reductions:
+            return None
+    elif not isinstance(bound, (mjast.NumberLiteral, mjast.DecimalLiteral)):
+        return None
+    return step(loop.iteration, counter)
+
+
+def field_layout(cls_name, classes_):
+    """The names of the fields of a class, in the order its instances store
+    them - those of the base class first."""
+    if cls_name not in classes_:
+        return []
+    cls = classes_[cls_name]
+    base = field_layout(cls.base.type.value, classes_) if cls.base else []
+    return base + [field.name.value for field in cls.fields]
+
+
+def _address_frame(node, instance, statements, layouts):
+    node.layout = (["this"] if instance else []) + [p.name.value
+                                                    for p in node.parameters]
+    env = [{name: slot for slot, name in enumerate(node.layout)}]
+    frames = [node]
+    for statement in statements:
+        _address_statement(statement, env, frames, layouts)
+
+
+def _address_statement(statement, env, frames, layouts):
+    if isinstance(statement, mjast.LocalVariableDeclaration):
+        if statement.value:
+            _address_nodes(statement.value, env, frames, layouts)
+        frame = frames[-1]
+        statement.slot = len(frame.layout)
+        env[-1][statement.name.value] = statement.slot
+        frame.layout.append(statement.name.value)
+    elif isinstance(statement, (mjast.ForLoop, mjast.WhileLoop,
+                                mjast.Conditional, mjast.Block)):
+        if isinstance(statement, mjast.Conditional):
+            declaring = statement.true_case + statement.false_case
+        elif isinstance(statement, mjast.ForLoop):
+            declaring = [statement.setup] + statement.statements
+        else:
+            declaring = statement.statements
+        scoped = any(isinstance(s, mjast.LocalVariableDeclaration)
+                     for s in declaring)
+        statement.layout = [] if scoped else None
+        if scoped:
+            env.append({})
+            frames.append(statement)
+        if isinstance(statement, mjast.ForLoop):
+            _address_statement(statement.setup, env, frames, layouts)
+            for reduction in statement.reductions:
+                _address_nodes(reduction, env, frames, layouts)
+        if not isinstance(statement, mjast.Block):
+            _address_nodes(statement.check, env, frames, layouts)
+        if isinstance(statement, mjast.ForLoop):
+            _address_statement(statement.iteration, env, frames, layouts)
+        if isinstance(statement, mjast.Conditional):
+            body = statement.true_case + ([statement.elseif]
+                                          if statement.elseif else [])
+            body += statement.false_case
+        else:
+            body = statement.statements
+        for substatement in body:
+            _address_statement(substatement, env, frames, layouts)
+        if scoped:
+            env.pop()
+            frames.pop()
+    elif isinstance(statement, mjast.Vectorised):
+        _address_statement(statement.loop, env, frames, layouts)
+    else:
+        _address_nodes(statement, env, frames, layouts)
+
+
+def _address_nodes(node, env, frames, layouts):
+    if isinstance(node, mjast.Inlined):
+        _address_inlined(node, env, frames, layouts)
+        return
+    if isinstance(node, mjast.Temporary):
+        _address_nodes(node.expression, env, frames, layouts)
+        frame = frames[-1]
+        node.address = len(env) - 1, len(frame.layout)
+        frame.layout.append("(temporary)")
+        return
+    if isinstance(node, (mjast.Variable, mjast.VariableAssignment)):
+        name = node.name.value
+        node.address = None
+        for depth in reversed(range(len(env))):
+            if name in env[depth]:
+                node.address = depth, env[depth][name]
+                break
+    elif (isinstance(node, (mjast.FieldAccess, mjast.FieldAssignment))
+            and node.owner in layouts):
+        layout = layouts[node.owner]
+        name = node.field.value
+        node.offset = len(layout) - 1 - layout[::-1].index(name)
+    for child in children(node):
+        _address_nodes(child, env, frames, layouts)
+
+
+def _address_inlined(node, env, frames, layouts):
+    """The parameters of an inlined method get slots in the caller's frame,
+    after the receiver and arguments are addressed in the caller's scope."""
+    for part in ([node.receiver] if node.receiver else []) + node.arguments:
+        _address_nodes(part, env, frames, layouts)
+    frame = frames[-1]
+    node.address = len(env) - 1, len(frame.layout)
+    for name in node.parameters:
+        env[-1][name] = len(frame.layout)
+        frame.layout.append(name)
+    if node.value:
+        _address_nodes(node.value, env, frames, layouts)
+    for statement in node.statements:
+        _address_statement(statement, env, frames, layouts)
+
+
+def children(node):
+    """The nodes directly beneath the given one, in evaluation order."""
+    single, many = node._parts
+    for name in single:
+        part = getattr(node, name)
+        if isinstance(part, mjast.Node):
+            yield part
+    for name in many:
+        for part in getattr(node, name):
+            if isinstance(part, mjast.Node):
+                yield part
+
+
+def symbols(program):
+    """Yields a (symbol, kind, token, context) record for each definition and
+    reference in an analysed program - context being the enclosing definition
+    for references, or the subclass for "extends" records."""
+    for cls in program.classes:
+        name = cls.name.value
+        class_generics = {g.type.value for g in cls.generics}
+        yield name, "class", cls.name, None
+        if cls.base:
+            yield cls.base.type.value, "extends", cls.base.type, name
+            yield from _type_references(cls.base, class_generics, name)
+        else:
+            yield "java.lang.Object", "extends", cls.name, name
+        for field in cls.fields:
+            yield ("{}.{}".format(name, field.name.value), "field", field.name,
+                   name)
+            yield from _type_references(field.type, class_generics, name)
+        for constructor in cls.constructors:
+            yield name, "constructor", constructor.name, name
+            yield from _references(constructor, class_generics, name)
+        for method in cls.methods:
+            context = "{}.{}".format(name, method.name.value)
+            generics = {g.type.value for g in method.generics}
+            if not method.static:
+                generics |= class_generics
+            yield context, "method", method.name, name
+            yield from _references(method, generics, context)
+
+
+def _references(node, generics, context):
+    for subnode in node:
+        if isinstance(subnode, mjast.Type):
+            yield from _type_references(subnode, generics, context, False)
+        elif getattr(subnode, "owner", None) is None:
+            continue
+        elif isinstance(subnode, mjast.MethodCall):
+            yield ("{}.{}".format(subnode.owner, subnode.method.value), "call",
+                   subnode.method, context)
+        elif isinstance(subnode, mjast.ObjectConstruction):
+            yield subnode.owner, "new", subnode.type.type, context
+        elif isinstance(subnode, mjast.FieldAssignment):
+            yield ("{}.{}".format(subnode.owner, subnode.field.value), "write",
+                   subnode.field, context)
+        elif isinstance(subnode, mjast.FieldAccess):
+            yield ("{}.{}".format(subnode.owner, subnode.field.value), "read",
+                   subnode.field, context)
+    for subnode in node:
+        if (isinstance(subnode, (mjast.PrefixOperation,
+                                 mjast.PostfixOperation)) and
+                subnode.operator.value in {"++", "--"}):
+            target = getattr(subnode, "rhs", None) or subnode.lhs
+            if isinstance(target, mjast.FieldAccess):
+                yield ("{}.{}".format(target.owner, target.field.value),
+                       "write", target.field, context)
+
+
+def _type_references(node, generics, context, recurse=True):
+    name = node.type.value if node.type else None
+    if name and name not in generics and name not in mjast.primitive_types:
+        yield name, "type", node.type, context
+    if recurse:
+        for generic in node.generics:
+            yield from _type_references(generic, generics, context)
+
+
 if __name__ == "__main__":
     import argparse
 
@@ -828,7 +1509,9 @@ if __name__ == "__main__":
     target = args.file.name or "<stdin>"
     source = args.file
     program = parse_handling_errors(source)
-    analyse_handling_errors(program)
+    statistics = analyse_handling_errors(program)
     print('"{}" is semantically valid.'.format(target))
+    for name, value in statistics.items():
+        print("{}: {}.".format(name.capitalize(), value))
     print("\n".join(program.tree()))
     sys.exit(0)
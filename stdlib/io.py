@@ -18,8 +18,8 @@ class io(LibClass):
 
         @method()
         def println(self, instance, x: ("java.lang.String", ())) -> None:
-            print(x.value)
+            print(x.value, file=instance.scope.stack.output)
 
         @method()
         def print(self, instance, x: ("java.lang.String", ())) -> None:
-            print(x.value, end="")
+            print(x.value, end="", file=instance.scope.stack.output)
@@ -26,11 +26,11 @@ class lang(LibClass):
         parent = "java.lang"
         static = True
 
-        @method(static=True)
+        @method(static=True, pure=True)
         def toString(self, x: ("int", ())) -> ("java.lang.String", ()):
             return str(x.value)
 
-        @method(static=True)
+        @method(static=True, pure=True)
         def parseInt(self, x: ("java.lang.String", ())) -> ("int", ()):
             return int(x.value)
 
@@ -3,9 +3,28 @@
 
 """A (partial) implementation of `java.util`."""
 
+import weakref
+
 from library import LibClass, constructor, method
 
 
+def _grow(instance, cells):
+    """Charges a list's new items to the run's heap quota, if it has one."""
+    stack = instance.scope.stack
+    if stack.quota is not None and stack.quota.heap is not None:
+        stack.quota.charge(cells, stack)
+
+
+def _shrink(instance, cells):
+    quota = instance.scope.stack.quota
+    if quota is not None and quota.heap is not None:
+        quota.free(cells)
+
+
+def _release(quota, items):
+    quota.free(len(items))
+
+
 class util(LibClass):
     name = "util"
     parent = "java"
@@ -18,26 +37,33 @@ class util(LibClass):
 
         @constructor()
         def const(self, instance):
-            instance.internal["list"] = []
+            items = instance.internal["list"] = []
+            quota = instance.scope.stack.quota
+            if quota is not None and quota.heap is not None:
+                # The items left when the list is freed.
+                weakref.finalize(instance, _release, quota,
+                                 items).atexit = False
 
         @method()
         def add(self, instance, item: ("E", ())) -> None:
+            _grow(instance, 1)
             instance.internal["list"].append(item)
 
         @method()
         def clear(self, instance) -> None:
+            _shrink(instance, len(instance.internal["list"]))
             instance.internal["list"].clear()
 
-        @method()
+        @method(pure=True)
         def contains(self, instance, o: ("java.lang.Object", ())
                      ) -> ("boolean", ()):
             return o in instance.internal["list"]
 
-        @method()
+        @method(pure=True)
         def get(self, instance, index: ("int", ())) -> ("E", ()):
             return instance.internal["list"][index.value].value
 
-        @method()
+        @method(pure=True)
         def size(self, instance) -> ("int", ()):
             return len(instance.internal["list"])
 
@@ -57,7 +83,9 @@ class util(LibClass):
 
         @method()
         def remove(self, instance, index: ("int", ())) -> ("E", ()):
-            return instance.internal["list"].pop(index.value)
+            item = instance.internal["list"].pop(index.value)
+            _shrink(instance, 1)
+            return item
 
         def _debug(self, instance):
             for i, v in enumerate(instance.internal["list"]):
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Picks the superinstructions of the bytecode virtual machine from a profile
+of the blocks of bytecode a workload ran (made with the interpreter's
+--profile-bytecode), and the order the machine tests for instructions in,
+saving them for bytecode.py to generate the machine with.
+
+Each program in the profile counts equally, however long it ran for, so a
+superinstruction is picked for the dispatches it saves across the workload
+rather than in its longest program."""
+
+import collections
+import json
+import sys
+
+import bytecode
+
+
+def load(path):
+    """The blocks of each program of a profile - their opcodes, the number of
+    times they ran and the share of the program's dispatches each run is."""
+    with open(path) as file:
+        profiles = json.load(file)
+    programs = collections.OrderedDict()
+    for name in sorted(profiles):
+        blocks = [(tuple(bytecode.opcodes[op] for op in block.split()), count)
+                  for block, count in profiles[name].items()]
+        total = sum(len(ops) * count for ops, count in blocks)
+        programs[name] = [(ops, count, count / total)
+                          for ops, count in blocks]
+    return programs
+
+
+def dispatches(blocks, sequences, weighted=False):
+    """The number of instructions run over the blocks given the
+    superinstructions (or their share of the dispatches without any)."""
+    return sum(len(bytecode.fuse(ops, sequences)) *
+               (weight if weighted else count)
+               for ops, count, weight in blocks)
+
+
+def _longest_first(sequences):
+    return sorted(sequences, key=len, reverse=True)
+
+
+def candidates(blocks, length):
+    """The runs of instructions that could be superinstructions, and roughly
+    how much running each as one would save."""
+    saved = collections.Counter()
+    for ops, count, weight in blocks:
+        for start in range(len(ops)):
+            for stop in range(start + 2, min(start + length, len(ops)) + 1):
+                if ops[stop - 2] in bytecode.finals:
+                    break
+                saved[ops[start:stop]] += weight * (stop - start - 1)
+    return saved
+
+
+def pick(programs, count, length, shortlist=50):
+    """Picks superinstructions one at a time, each saving the most of what is
+    left to save given those picked before it."""
+    blocks = [block for blocks in programs.values() for block in blocks]
+    shortlisted = [sequence for sequence, _ in
+                   candidates(blocks, length).most_common(shortlist)]
+    picked = []
+    left = dispatches(blocks, picked, True)
+    while len(picked) < count and shortlisted:
+        savings = {sequence: left - dispatches(
+            blocks, _longest_first(picked + [sequence]), True)
+            for sequence in shortlisted}
+        best = max(shortlisted, key=savings.get)
+        if savings[best] <= 0:
+            break
+        picked.append(best)
+        shortlisted.remove(best)
+        left -= savings[best]
+    return picked
+
+
+def order(programs, sequences):
+    """The instructions (superinstructions included) run, the commonest
+    first."""
+    runs = collections.Counter()
+    for blocks in programs.values():
+        for ops, count, weight in blocks:
+            for run in bytecode.fuse(ops, sequences):
+                runs[run] += weight
+    return [run for run, _ in runs.most_common()]
+
+
+def _name(sequence):
+    return "+".join(bytecode.opnames[op] for op in sequence)
+
+
+def report(programs, sequences, file=sys.stdout):
+    print("{:<24} {:>12} {:>12} {:>7}".format(
+        "Program", "Before", "After", "Saved"), file=file)
+    for name, blocks in programs.items():
+        before = dispatches(blocks, [])
+        after = dispatches(blocks, sequences)
+        print("{:<24} {:>12} {:>12} {:>6.1f}%".format(
+            name, before, after, 100 * (before - after) / before), file=file)
+    print(file=file)
+    for sequence in sequences:
+        print(_name(sequence), file=file)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    args = argparse.ArgumentParser(
+        description='Pick superinstructions for the bytecode virtual machine '
+                    'from a profile.')
+    args.add_argument('profile', metavar='PROFILE',
+                      help='The profile made by the interpreter\'s '
+                           '--profile-bytecode.')
+    args.add_argument('-n', '--count', type=int, default=8,
+                      help='The most superinstructions to pick (default: '
+                           '8).')
+    args.add_argument('-l', '--length', type=int, default=4,
+                      help='The most instructions in a superinstruction '
+                           '(default: 4).')
+    args.add_argument('-o', '--output', default=bytecode.table,
+                      help='Where to save them (default: {}).'.format(
+                          bytecode.table))
+
+    args = args.parse_args()
+
+    programs = load(args.profile)
+    picked = pick(programs, args.count, args.length)
+    sequences = _longest_first(picked)
+    report(programs, sequences)
+    with open(args.output, "w") as file:
+        json.dump({"superinstructions": [_name(run) for run in picked],
+                   "order": [_name(run) for run in order(programs,
+                                                         sequences)]},
+                  file, indent=1)
+        file.write("\n")
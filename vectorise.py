@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Vectorisation of counted loops over Lists of ints and floats, run with
+NumPy if it is installed.
+
+A for loop counting up by one from a start to a bound it doesn't change,
+whose body only stores element-wise expressions into Lists at the counter and
+adds them to locals, is replaced by a Vectorised statement. As each element
+only depends on elements at the same index, the statements of the body can be
+run one at a time over the whole range, giving what the loop would have.
+
+The loop is run instead when NumPy isn't installed, or at run time the Lists
+aren't long enough for the range or hold something unexpected, or an int
+could overflow the 64 bits NumPy keeps it in."""
+
+import itertools
+
+import library
+import classes
+import interpreter
+import mjast
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+_elements = {"int": int, "float": float}
+_operators = ("+", "-", "*")
+_bits = 62
+
+
+def vectorise(program):
+    """Replaces the loops that can be vectorised, returning how many were and
+    the lines they are on."""
+    lines = []
+    for cls in program.classes:
+        for node in itertools.chain(cls.constructors, cls.methods):
+            node.statements = _statements(node.statements, lines)
+    if not lines:
+        return 0
+    return "{} (line{} {})".format(len(lines), "s" if len(lines) > 1 else "",
+                                   ", ".join(map(str, lines)))
+
+
+def _statements(statements, lines):
+    vectorised = []
+    for statement in statements:
+        if isinstance(statement, mjast.Conditional):
+            statement.true_case = _statements(statement.true_case, lines)
+            if statement.elseif:
+                statement.elseif, = _statements([statement.elseif], lines)
+            statement.false_case = _statements(statement.false_case, lines)
+        elif isinstance(statement, (mjast.WhileLoop, mjast.ForLoop,
+                                    mjast.Block)):
+            statement.statements = _statements(statement.statements, lines)
+        if isinstance(statement, mjast.ForLoop):
+            replacement = _Matcher(statement).match()
+            if replacement is not None:
+                lines.append(statement.token.line)
+                statement = replacement
+        vectorised.append(statement)
+    return vectorised
+
+
+def _local(node):
+    return isinstance(node, mjast.Variable) and node.address is not None
+
+
+def _list(node):
+    """The element type of a local List of ints or floats, or None."""
+    type_ = node.static_type if _local(node) else None
+    if (isinstance(type_, tuple) and type_[0] == "java.util.List" and
+            len(type_[1]) == 1 and type_[1][0][0] in _elements):
+        return type_[1][0][0]
+    return None
+
+
+def _library_call(node, method, arguments):
+    return (isinstance(node, mjast.MethodCall) and
+            node.method.value == method and
+            len(node.arguments) == arguments and
+            not isinstance(node.declaration, (type(None), mjast.Method,
+                                              mjast.Constructor)) and
+            _list(node.lhs) is not None)
+
+
+class _Matcher:
+    """Recognises a loop that can be vectorised."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.counter = None
+        self.used = {}
+        self.sums = {}
+
+    def match(self):
+        loop, setup = self.loop, self.loop.setup
+        if (loop.reductions or loop.steps or
+                not isinstance(setup, mjast.LocalVariableDeclaration) or
+                setup.type.type.value != "int" or setup.value is None):
+            return None
+        self.counter = setup.name.value
+        check = loop.check
+        if not (self._increment(loop.iteration) and
+                isinstance(check, mjast.InfixOperation) and
+                check.operator.value == "<" and
+                self._counter(check.lhs) and
+                self._bound(setup.value, False) and
+                self._bound(check.rhs, True) and loop.statements):
+            return None
+        kernels = [self._kernel(statement) for statement in loop.statements]
+        # What is added to can't be used otherwise, as it is only added to
+        # once the whole range has been evaluated.
+        if None in kernels or self.sums.keys() & self.used.keys():
+            return None
+        names = dict(self.used, **self.sums)
+        return mjast.Vectorised(loop, self.counter, setup.value, check.rhs,
+                                kernels, list(names.values()))
+
+    def _counter(self, node):
+        return _local(node) and node.name.value == self.counter
+
+    def _increment(self, node):
+        if (isinstance(node, (mjast.PrefixOperation, mjast.PostfixOperation))
+                and node.operator.value == "++"):
+            return self._counter(node.lhs if isinstance(
+                node, mjast.PostfixOperation) else node.rhs)
+        return False
+
+    def _bound(self, node, size):
+        """The start and bound are evaluated once, before the loop runs."""
+        if isinstance(node, mjast.NumberLiteral):
+            return True
+        elif _local(node):
+            return (node.static_type == ("int", ()) and
+                    not self._counter(node) and self._use(node))
+        return size and _library_call(node, "size", 0)
+
+    def _use(self, node):
+        self.used.setdefault(node.name.value, node)
+        return True
+
+    def _kernel(self, statement):
+        if _library_call(statement, "set", 2):
+            element = _list(statement.lhs)
+            index, value = statement.arguments
+            # A variable would be stored itself, not a copy of its value.
+            if (self._counter(index) and
+                    not isinstance(value, mjast.Variable) and
+                    self._element(value, element)):
+                self._use(statement.lhs)
+                return "set", statement.lhs.name.value, value, element
+        elif (isinstance(statement, mjast.VariableAssignment) and
+                statement.address is not None and
+                statement.name.value != self.counter and
+                statement.name.value not in self.sums):
+            name, value = statement.name.value, statement.value
+            if statement.operator.value == "=":
+                if not (isinstance(value, mjast.InfixOperation) and
+                        value.operator.value == "+" and
+                        _local(value.lhs) and value.lhs.name.value == name):
+                    return None
+                value = value.rhs
+            elif statement.operator.value != "+=":
+                return None
+            element = value.static_type and value.static_type[0]
+            if (element in _elements and
+                    statement.value.static_type == (element, ()) and
+                    self._element(value, element)):
+                self.sums[name] = statement
+                return "sum", name, value, element
+        return None
+
+    def _element(self, node, element):
+        """Whether the expression can be evaluated element-wise."""
+        if node.static_type != (element, ()):
+            return False
+        if isinstance(node, (mjast.NumberLiteral, mjast.DecimalLiteral)):
+            return True
+        elif _local(node):
+            return self._counter(node) or self._use(node)
+        elif isinstance(node, mjast.OperationGroup):
+            return self._element(node.operation, element)
+        elif isinstance(node, mjast.InfixOperation):
+            return (node.operator.value in _operators and
+                    self._element(node.lhs, element) and
+                    self._element(node.rhs, element))
+        elif isinstance(node, mjast.PrefixOperation):
+            return (node.operator.value == "-" and
+                    self._element(node.rhs, element))
+        elif _library_call(node, "get", 1):
+            return (self._counter(node.arguments[0]) and
+                    _list(node.lhs) == element and self._use(node.lhs))
+        return False
+
+
+# Running - every kernel is evaluated before anything is stored, so a range
+# that can't be vectorised part way through can still be run by the loop.
+
+class _Unvectorisable(Exception):
+    pass
+
+
+class _Range:
+    def __init__(self, statement, start, stop, values):
+        self.statement = statement
+        self.start = start
+        self.stop = stop
+        self.values = values
+        self.arrays = {}
+
+    def elements(self, name, element):
+        """The elements of a List in the range, as an array."""
+        instance = self.values[name].value
+        if (not isinstance(instance, library.LibInstance) or
+                "list" not in instance.internal):
+            raise _Unvectorisable
+        items = instance.internal["list"]
+        if id(items) not in self.arrays:
+            if len(items) < self.stop:
+                raise _Unvectorisable
+            values = [item.value for item in items[self.start:self.stop]]
+            if any(type(value) is not _elements[element]
+                   for value in values):
+                raise _Unvectorisable
+            try:
+                array = numpy.array(values, dtype=_dtype(element))
+            except OverflowError:
+                raise _Unvectorisable
+            self.arrays[id(items)] = items, array, _magnitude(array, element)
+        return self.arrays[id(items)]
+
+
+def _dtype(element):
+    return numpy.int64 if element == "int" else numpy.float64
+
+
+def _magnitude(array, element):
+    if element != "int":
+        return 0
+    return int(numpy.abs(array).max()).bit_length()
+
+
+def _checked(value, bits):
+    if bits > _bits:
+        raise _Unvectorisable
+    return value, bits
+
+
+def _vector(node, context):
+    """The values of an expression over the range, as an array or (if it is
+    the same for the whole range) a number, and a bound on the bits the
+    ints need."""
+    # The interpreter may have quickened the node into a subclass.
+    kind = next(kind for kind in type(node).__mro__ if kind in _vectors)
+    return _vectors[kind](node, context)
+
+
+def _number(node, context):
+    if isinstance(node, mjast.DecimalLiteral):
+        return float(node.value.value), 0
+    value = int(node.value.value)
+    return _checked(value, abs(value).bit_length())
+
+
+def _variable(node, context):
+    name = node.name.value
+    if name == context.statement.counter:
+        return _checked(numpy.arange(context.start, context.stop,
+                                     dtype=numpy.int64),
+                        context.stop.bit_length())
+    value = context.values[name].value
+    if type(value) is not _elements[node.static_type[0]]:
+        raise _Unvectorisable
+    elif type(value) is float:
+        return value, 0
+    return _checked(value, abs(value).bit_length())
+
+
+def _group(node, context):
+    return _vector(node.operation, context)
+
+
+def _operation(node, context):
+    operands = [_vector(getattr(node, part), context)
+                for part in ("lhs", "rhs") if hasattr(node, part)]
+    if len(operands) == 1:
+        (value, bits), = operands
+        return -value, bits
+    (lhs, lhs_bits), (rhs, rhs_bits) = operands
+    operator = node.operator.value
+    if operator == "*":
+        return _checked(lhs * rhs, lhs_bits + rhs_bits)
+    value = lhs + rhs if operator == "+" else lhs - rhs
+    return _checked(value, max(lhs_bits, rhs_bits) + 1)
+
+
+def _get(node, context):
+    _, array, bits = context.elements(node.lhs.name.value,
+                                      _list(node.lhs))
+    return array, bits
+
+
+_vectors = {
+    mjast.NumberLiteral: _number,
+    mjast.DecimalLiteral: _number,
+    mjast.Variable: _variable,
+    mjast.OperationGroup: _group,
+    mjast.InfixOperation: _operation,
+    mjast.PrefixOperation: _operation,
+    mjast.MethodCall: _get,
+}
+
+
+def run(statement, start, stop, values, scope):
+    """Runs a Vectorised statement over its range, given the start and bound
+    of the range and the variables of the locals it uses. Returns whether it
+    could, having changed nothing if not."""
+    start, stop = start.value, stop.value
+    if numpy is None or start < 0 or stop <= start:
+        return False
+    context = _Range(statement, start, stop, values)
+    stores, sums = [], []
+    try:
+        for kind, name, expression, element in statement.kernels:
+            value, bits = _vector(expression, context)
+            if kind == "set":
+                items, _, _ = context.elements(name, element)
+                array = numpy.empty(stop - start, dtype=_dtype(element))
+                array[:] = value
+                # Later reads of the List see what was stored.
+                context.arrays[id(items)] = items, array, bits
+                stores.append((items, array, element))
+            else:
+                sums.append((name, value, bits, element))
+        totals = [(name, _sum(context, name, value, bits, element))
+                  for name, value, bits, element in sums]
+    except _Unvectorisable:
+        return False
+    for items, array, element in stores:
+        type_ = classes.primitive_types[element](scope)
+        items[start:stop] = [interpreter.Variable(type_, value)
+                             for value in array.tolist()]
+    for name, total in totals:
+        values[name].value = total
+    return True
+
+
+def _sum(context, name, value, bits, element):
+    total = context.values[name].value
+    if type(total) is not _elements[element]:
+        raise _Unvectorisable
+    count = context.stop - context.start
+    if element == "float":
+        # Added up in order, as the loop would, rather than pairwise.
+        values = numpy.empty(count + 1)
+        values[0] = total
+        values[1:] = value
+        return float(numpy.add.accumulate(values)[-1])
+    _checked(None, bits + count.bit_length())
+    if isinstance(value, int):
+        return total + value * count
+    return total + int(value.sum())